@@ -0,0 +1,319 @@
+import sys
+import getopt
+import json
+import random
+import re
+import threading
+import time
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from xml.sax.saxutils import escape
+
+
+version = '0.1'
+"""
+Local stand-in for the MediaLive, MediaPackage and CloudWatch APIs used by create_CW_dashboard.py: describe_channel,
+list_channels, list_origin_endpoints, list_metrics, put_dashboard and get_dashboard. It serves a synthetic inventory
+of MediaLive channels with their MediaPackage channels, endpoints and OutputVideoFrameRate metrics, with a configurable
+latency per call, page sizes and throttling rate, and counts the calls per operation. Point the script at it with
+'--endpoint-url'. The region of a request is taken from its signature.
+
+Notes:
+Version 0.1: Initial Release
+"""
+
+# AWS Account ID of the synthetic inventory
+standin_account_id = "123456789012"
+# Default page sizes of the MediaPackage list queries and of list_metrics
+default_mediapackage_page_size = 50
+default_cloudwatch_page_size = 500
+# The operations of the stand-in
+standin_operations = ("describe_channel", "list_channels", "list_origin_endpoints", "list_metrics", "put_dashboard",
+                      "get_dashboard", "list_dashboards", "delete_dashboards")
+
+
+def build_standin_channel_id(index):
+    """Return the MediaLive Channel ID of the synthetic MediaLive channel number "index" """
+    return str(1000000 + index)
+
+
+class StandInInventory(object):
+    """Synthetic inventory of "channel_count" MediaLive channels per region. Every MediaLive channel sends to 2
+    MediaPackage channels, which share "endpoint_count" MediaPackage endpoints, and has "output_count" outputs on
+    both pipelines."""
+
+    def __init__(self, channel_count, endpoint_count, output_count):
+        self.channel_count = channel_count
+        self.endpoint_count = endpoint_count
+        self.output_count = output_count
+
+    def medialive_channel(self, region, ml_channel_id):
+        """Return the describe-channel response of the MediaLive Channel "ml_channel_id", None if it doesn't exist"""
+        if not ml_channel_id.isdigit() or not 0 <= int(ml_channel_id) - 1000000 < self.channel_count:
+            return None
+        index = int(ml_channel_id) - 1000000
+        return {
+            "id": ml_channel_id,
+            "arn": "arn:aws:medialive:{0}:{1}:channel:{2}".format(region, standin_account_id, ml_channel_id),
+            "name": "channel-{0}".format(index),
+            "destinations": [{
+                "id": "destination",
+                "settings": [{"url": "https://abcdef.mediapackage.{0}.amazonaws.com/in/v2/{1}/{1}/channel".format(
+                    region, mp_channel_uid)} for mp_channel_uid in self.mediapackage_channel_uids(index)]
+            }],
+            "encoderSettings": {
+                "outputGroups": [{"name": "group-{0}".format(group_index), "outputs": [], "outputGroupSettings": {}}
+                                 for group_index in range(max(1, self.output_count // 10))]
+            }
+        }
+
+    def mediapackage_channel_uids(self, index):
+        """Return the UIDs of the 2 MediaPackage channels of the MediaLive channel number "index" """
+        return ["uid-{0}-a".format(index), "uid-{0}-b".format(index)]
+
+    def mediapackage_channels(self, region):
+        """Return the list_channels items of all MediaPackage channels"""
+        return [{"id": "mp-{0}".format(mp_channel_uid[4:]),
+                 "arn": "arn:aws:mediapackage:{0}:{1}:channels/{2}".format(region, standin_account_id, mp_channel_uid)}
+                for index in range(self.channel_count) for mp_channel_uid in self.mediapackage_channel_uids(index)]
+
+    def mediapackage_endpoints(self, region, mp_channel_id=None):
+        """Return the list_origin_endpoints items of all MediaPackage endpoints, or of the MediaPackage channel
+        "mp_channel_id" """
+        endpoints = []
+        for mp_channel in self.mediapackage_channels(region):
+            if mp_channel_id is not None and mp_channel["id"] != mp_channel_id:
+                continue
+            suffix = mp_channel["id"][-1]
+            endpoints += [{"id": "{0}-endpoint-{1}".format(mp_channel["id"], endpoint_index // 2),
+                           "channelId": mp_channel["id"]}
+                          for endpoint_index in range(self.endpoint_count)
+                          if "ab"[endpoint_index % 2] == suffix]
+        return endpoints
+
+    def output_video_frame_rate_metrics(self, ml_channel_id=None):
+        """Return the (ChannelId, OutputName, Pipeline) dimensions of the OutputVideoFrameRate metrics of all MediaLive
+        channels, or of the MediaLive Channel "ml_channel_id" """
+        return [(build_standin_channel_id(index), "output-{0}".format(output_index), pipeline)
+                for index in range(self.channel_count)
+                if ml_channel_id is None or build_standin_channel_id(index) == ml_channel_id
+                for output_index in range(self.output_count) for pipeline in ("0", "1")]
+
+
+class AwsStandIn(ThreadingMixIn, HTTPServer):
+    """HTTP server that answers the AWS requests of create_CW_dashboard.py from the inventory "inventory". Every
+    call waits its latency, in seconds, from "latencies" by operation or "latency", and is throttled with probability
+    "throttle_rate". The calls and throttling responses are counted per operation."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, inventory, latency=0.0, latencies=None, throttle_rate=0.0,
+                 mediapackage_page_size=default_mediapackage_page_size,
+                 cloudwatch_page_size=default_cloudwatch_page_size):
+        HTTPServer.__init__(self, address, AwsStandInRequestHandler)
+        self.inventory = inventory
+        self.latency = latency
+        self.latencies = latencies or {}
+        self.throttle_rate = throttle_rate
+        self.mediapackage_page_size = mediapackage_page_size
+        self.cloudwatch_page_size = cloudwatch_page_size
+        self.dashboards = {}
+        self.lock = threading.Lock()
+        self.reset_counters()
+
+    @property
+    def url(self):
+        return "http://{0}:{1}".format(*self.server_address)
+
+    def reset_counters(self):
+        """Reset the call and throttling counters of all operations"""
+        with self.lock:
+            self.calls = dict((operation, 0) for operation in standin_operations)
+            self.throttled = dict((operation, 0) for operation in standin_operations)
+
+    def get_counters(self):
+        """Return the (calls, throttling responses) of every operation"""
+        with self.lock:
+            return dict((operation, (self.calls[operation], self.throttled[operation]))
+                        for operation in standin_operations)
+
+    def start_call(self, operation):
+        """Count the call of "operation" and wait its latency. Returns True if the call must be throttled."""
+        throttle = random.random() < self.throttle_rate
+        with self.lock:
+            self.calls[operation] += 1
+            if throttle:
+                self.throttled[operation] += 1
+        time.sleep(self.latencies.get(operation, self.latency))
+        return throttle
+
+
+class AwsStandInRequestHandler(BaseHTTPRequestHandler):
+    """Request handler of the stand-in. MediaLive and MediaPackage requests are REST JSON requests, CloudWatch
+    requests are form encoded query requests."""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def get_region(self):
+        """Return the region of the request from the credential scope of its signature"""
+        match = re.search(r"Credential=[^/]+/[0-9]+/([^/]+)/", self.headers.get("Authorization", ""))
+        return match.group(1) if match is not None else "us-east-1"
+
+    def send_body(self, status, content_type, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status, response, error_type=None):
+        headers = {"x-amzn-ErrorType": error_type} if error_type is not None else None
+        self.send_body(status, "application/json", json.dumps(response), headers)
+
+    def send_xml(self, status, action, inner):
+        if status == 200:
+            body = '<{0}Response xmlns="http://monitoring.amazonaws.com/doc/2010-08-01/"><{0}Result>{1}</{0}Result>' \
+                   '<ResponseMetadata><RequestId>standin</RequestId></ResponseMetadata></{0}Response>'.format(action,
+                                                                                                             inner)
+        else:
+            body = '<ErrorResponse xmlns="http://monitoring.amazonaws.com/doc/2010-08-01/"><Error><Type>Sender</Type>' \
+                   '{0}</Error><RequestId>standin</RequestId></ErrorResponse>'.format(inner)
+        self.send_body(status, "text/xml", body)
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        query = dict((key, values[0]) for key, values in urlparse.parse_qs(url.query).items())
+        region = self.get_region()
+        inventory = self.server.inventory
+        if url.path.startswith("/prod/channels/"):
+            if self.server.start_call("describe_channel"):
+                return self.send_json(429, {"message": "Too Many Requests"}, "TooManyRequestsException")
+            channel = inventory.medialive_channel(region, url.path.split("/")[-1])
+            if channel is None:
+                return self.send_json(404, {"message": "Channel not found"}, "NotFoundException")
+            return self.send_json(200, channel)
+        if url.path in ("/channels", "/origin_endpoints"):
+            if url.path == "/channels":
+                operation, result_key, items = "list_channels", "channels", inventory.mediapackage_channels(region)
+            else:
+                operation, result_key = "list_origin_endpoints", "originEndpoints"
+                items = inventory.mediapackage_endpoints(region, query.get("channelId"))
+            if self.server.start_call(operation):
+                return self.send_json(429, {"message": "Too Many Requests"}, "TooManyRequestsException")
+            page_size = min(int(query.get("maxResults", self.server.mediapackage_page_size)),
+                            self.server.mediapackage_page_size)
+            start = int(query.get("nextToken", 0))
+            response = {result_key: items[start:start + page_size]}
+            if start + page_size < len(items):
+                response["nextToken"] = str(start + page_size)
+            return self.send_json(200, response)
+        self.send_json(404, {"message": "Unsupported request {0}".format(url.path)}, "NotFoundException")
+
+    def do_POST(self):
+        content_length = int(self.headers.get("Content-Length", 0))
+        form = dict((key, values[0]) for key, values in urlparse.parse_qs(self.rfile.read(content_length)).items())
+        action = form.get("Action")
+        if action == "ListMetrics":
+            return self.list_metrics(form)
+        if action == "PutDashboard":
+            if self.server.start_call("put_dashboard"):
+                return self.send_xml(400, action, "<Code>Throttling</Code><Message>Rate exceeded</Message>")
+            with self.server.lock:
+                self.server.dashboards[form["DashboardName"]] = form["DashboardBody"]
+            return self.send_xml(200, action, "<DashboardValidationMessages/>")
+        if action == "GetDashboard":
+            if self.server.start_call("get_dashboard"):
+                return self.send_xml(400, action, "<Code>Throttling</Code><Message>Rate exceeded</Message>")
+            with self.server.lock:
+                body = self.server.dashboards.get(form["DashboardName"])
+            if body is None:
+                return self.send_xml(404, action, "<Code>ResourceNotFound</Code><Message>Dashboard does not exist"
+                                                  "</Message>")
+            return self.send_xml(200, action, "<DashboardName>{0}</DashboardName><DashboardBody>{1}"
+                                              "</DashboardBody>".format(escape(form["DashboardName"]), escape(body)))
+        if action == "ListDashboards":
+            if self.server.start_call("list_dashboards"):
+                return self.send_xml(400, action, "<Code>Throttling</Code><Message>Rate exceeded</Message>")
+            with self.server.lock:
+                names = sorted(name for name in self.server.dashboards
+                               if name.startswith(form.get("DashboardNamePrefix", "")))
+            return self.send_xml(200, action, "<DashboardEntries>" + "".join(
+                "<member><DashboardName>{0}</DashboardName></member>".format(escape(name)) for name in names) +
+                "</DashboardEntries>")
+        if action == "DeleteDashboards":
+            if self.server.start_call("delete_dashboards"):
+                return self.send_xml(400, action, "<Code>Throttling</Code><Message>Rate exceeded</Message>")
+            with self.server.lock:
+                for key, name in form.items():
+                    if key.startswith("DashboardNames.member."):
+                        self.server.dashboards.pop(name, None)
+            return self.send_xml(200, action, "")
+        self.send_xml(400, action, "<Code>InvalidAction</Code><Message>Unsupported action</Message>")
+
+    def list_metrics(self, form):
+        if self.server.start_call("list_metrics"):
+            return self.send_xml(400, "ListMetrics", "<Code>Throttling</Code><Message>Rate exceeded</Message>")
+        ml_channel_id = None
+        for key, value in form.items():
+            if key.endswith(".Name") and value == "ChannelId":
+                ml_channel_id = form.get(key[:-len("Name")] + "Value")
+        metrics = self.server.inventory.output_video_frame_rate_metrics(ml_channel_id)
+        start = int(form.get("NextToken", 0))
+        page_size = self.server.cloudwatch_page_size
+        inner = "<Metrics>" + "".join(
+            "<member><Namespace>MediaLive</Namespace><MetricName>OutputVideoFrameRate</MetricName><Dimensions>"
+            "<member><Name>ChannelId</Name><Value>{0}</Value></member>"
+            "<member><Name>OutputName</Name><Value>{1}</Value></member>"
+            "<member><Name>Pipeline</Name><Value>{2}</Value></member></Dimensions></member>".format(*metric)
+            for metric in metrics[start:start + page_size]) + "</Metrics>"
+        if start + page_size < len(metrics):
+            inner += "<NextToken>{0}</NextToken>".format(start + page_size)
+        self.send_xml(200, "ListMetrics", inner)
+
+
+def main(argv=None):
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hp:c:e:o:l:t:', ['help', 'port=', 'channels=', 'endpoints=',
+                                                                    'outputs=', 'latency=', 'throttle-rate='])
+    except getopt.GetoptError, err:
+        print str(err)
+        exit(-1)
+    port = 8000
+    channel_count, endpoint_count, output_count = 100, 4, 4
+    latency = 0.0
+    throttle_rate = 0.0
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print "\npython {0} [-p port] [-c channels] [-e endpoints] [-o outputs] [-l latency_ms] " \
+                  "[-t throttle_rate]".format(sys.argv[0])
+            print "\nServes a synthetic inventory of MediaLive, MediaPackage and CloudWatch on http://127.0.0.1:port"
+            sys.exit(0)
+        elif opt in ("-p", "--port"):
+            port = int(arg)
+        elif opt in ("-c", "--channels"):
+            channel_count = int(arg)
+        elif opt in ("-e", "--endpoints"):
+            endpoint_count = int(arg)
+        elif opt in ("-o", "--outputs"):
+            output_count = int(arg)
+        elif opt in ("-l", "--latency"):
+            latency = float(arg) / 1000
+        elif opt in ("-t", "--throttle-rate"):
+            throttle_rate = float(arg)
+    server = AwsStandIn(("127.0.0.1", port), StandInInventory(channel_count, endpoint_count, output_count), latency,
+                        throttle_rate=throttle_rate)
+    print "AWS stand-in listening on {0}".format(server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
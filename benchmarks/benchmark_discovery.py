@@ -0,0 +1,207 @@
+import sys
+import os
+import getopt
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from aws_standin import AwsStandIn, StandInInventory, build_standin_channel_id, standin_account_id, \
+    standin_operations, default_mediapackage_page_size, default_cloudwatch_page_size
+
+
+version = '0.1'
+"""
+End-to-end discovery benchmark of create_CW_dashboard.py. The script runs, as it would against AWS, against the local
+AWS stand-in of aws_standin.py, which serves a synthetic inventory with a configurable latency per call, page sizes
+and throttling rate. Every run reports its wall time and the calls, throttling responses and retries per operation,
+to tune the number of workers, the request limit and the discovery cache without touching any AWS account.
+
+Notes:
+Version 0.1: Initial Release
+"""
+
+# Path of the script under test
+script_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "create_CW_dashboard.py")
+# Name of the Dashboard created by the benchmark runs
+benchmark_dashboard_name = "Discovery Benchmark"
+
+
+def usage(app_name):
+    """Function that prints out a detailed help page for the script"""
+    print '\npython {0} [Optional parameters] [-- create_CW_dashboard.py options]\n'.format(app_name)
+    print 'Version:', version
+    print '\nThis script runs create_CW_dashboard.py against a local stand-in for the MediaLive, MediaPackage and'
+    print "CloudWatch APIs, and reports the wall time and the calls, throttling responses and retries per operation."
+    print "The options after '--' are passed to create_CW_dashboard.py, e.g. '-- -w 16 -m 8'."
+    print ""
+    print "Optional parameters"
+    print "-c, --channels: Number of MediaLive channels per region. Default: 100"
+    print "-e, --endpoints: Number of MediaPackage endpoints per MediaLive channel. Default: 4"
+    print "-o, --outputs: Number of outputs per MediaLive channel. Default: 4"
+    print "-r, --regions: Comma separated regions of the MediaLive channels. Default: us-west-2"
+    print "-l, --latency: Latency of every call in milliseconds. Default: 20"
+    print "--operation-latency: Latency of 1 operation, as operation=milliseconds, can be repeated."
+    print "              Operations: {0}".format(", ".join(standin_operations))
+    print "-t, --throttle-rate: Fraction of the calls that are throttled, between 0 and 1. Default: 0"
+    print "--mp-page-size: Maximum number of items per page of the MediaPackage list queries. " \
+          "Default: {0}".format(default_mediapackage_page_size)
+    print "--cw-page-size: Maximum number of metrics per page of list_metrics. " \
+          "Default: {0}".format(default_cloudwatch_page_size)
+    print "--warm-cache: Run the script a second time with the discovery cache filled by the first run."
+    print '-h, --help:   Print this help and exit.'
+
+
+def write_arn_list(arn_file, regions, channel_count):
+    """Write the MediaLive Channel ARNs of the synthetic inventory of "regions" to "arn_file" """
+    with open(arn_file, "wt") as out_file:
+        for region in regions:
+            for index in range(channel_count):
+                out_file.write("arn:aws:medialive:{0}:{1}:channel:{2}\n".format(region, standin_account_id,
+                                                                              build_standin_channel_id(index)))
+
+
+def run_script(server, arguments, log_file):
+    """Run create_CW_dashboard.py with "arguments" against the stand-in "server" and return its exit code, its wall
+    time and the (calls, throttling responses) of every operation"""
+    environment = dict(os.environ)
+    environment["AWS_ACCESS_KEY_ID"] = "standin"
+    environment["AWS_SECRET_ACCESS_KEY"] = "standin"
+    environment.pop("AWS_SESSION_TOKEN", None)
+    environment.pop("AWS_PROFILE", None)
+    server.reset_counters()
+    with open(log_file, "wt") as log:
+        started = time.time()
+        exit_code = subprocess.call([sys.executable, script_file, "--endpoint-url", server.url] + arguments,
+                                    stdout=log, stderr=subprocess.STDOUT, env=environment)
+        wall_time = time.time() - started
+    return exit_code, wall_time, server.get_counters()
+
+
+def read_aws_call_retries(log_file):
+    """Return the retries per operation of the "AWS calls" summary that the script prints at the end of a run, from
+    its output in "log_file". No operation is returned when the output has no summary."""
+    retries = {}
+    with open(log_file, "rt") as log:
+        lines = iter(log.read().splitlines())
+    for line in lines:
+        if line == "AWS calls:":
+            # Skip the header of the summary, the operations follow until the total
+            next(lines, None)
+            for summary_line in lines:
+                fields = summary_line.split()
+                if not summary_line.startswith("  ") or len(fields) < 3 or fields[0] == "Total":
+                    break
+                retries[fields[0]] = int(fields[2])
+    return retries
+
+
+def print_run_report(run_name, exit_code, wall_time, counters, log_file):
+    """Print the wall time and the calls, throttling responses and retries per operation of a run. The retries are
+    the ones the script counted, as the stand-in can't tell a retry from a new call."""
+    print "\n{0}: {1:.2f} seconds wall time, exit code {2}".format(run_name, wall_time, exit_code)
+    if exit_code != 0:
+        print "  Output of the script: {0}".format(log_file)
+    retries = read_aws_call_retries(log_file)
+    print "  {0:<22} {1:>8} {2:>10} {3:>8}".format("Operation", "Calls", "Throttled", "Retries")
+    total_calls = 0
+    for operation in standin_operations:
+        calls, throttled = counters[operation]
+        if calls == 0:
+            continue
+        print "  {0:<22} {1:>8} {2:>10} {3:>8}".format(operation, calls, throttled, retries.get(operation, "-"))
+        total_calls += calls
+    print "  {0:<22} {1:>8}".format("Total", total_calls)
+
+
+def main(argv=None):
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hc:e:o:r:l:t:',
+                                   ['help', 'channels=', 'endpoints=', 'outputs=', 'regions=', 'latency=',
+                                    'operation-latency=', 'throttle-rate=', 'mp-page-size=', 'cw-page-size=',
+                                    'warm-cache'])
+    except getopt.GetoptError, err:
+        print str(err)
+        usage(sys.argv[0])
+        exit(-1)
+    channel_count, endpoint_count, output_count = 100, 4, 4
+    regions = ["us-west-2"]
+    latency = 0.02
+    latencies = {}
+    throttle_rate = 0.0
+    mediapackage_page_size = default_mediapackage_page_size
+    cloudwatch_page_size = default_cloudwatch_page_size
+    warm_cache = False
+    try:
+        for opt, arg in opts:
+            if opt in ("-h", "--help"):
+                usage(sys.argv[0])
+                sys.exit(0)
+            elif opt in ("-c", "--channels"):
+                channel_count = int(arg)
+            elif opt in ("-e", "--endpoints"):
+                endpoint_count = int(arg)
+            elif opt in ("-o", "--outputs"):
+                output_count = int(arg)
+            elif opt in ("-r", "--regions"):
+                regions = [region.strip() for region in arg.split(",") if region.strip() != ""]
+            elif opt in ("-l", "--latency"):
+                latency = float(arg) / 1000
+            elif opt == "--operation-latency":
+                operation, milliseconds = arg.split("=")
+                if operation not in standin_operations:
+                    print "Error: Unknown operation '{0}'".format(operation)
+                    exit(-1)
+                latencies[operation] = float(milliseconds) / 1000
+            elif opt in ("-t", "--throttle-rate"):
+                throttle_rate = float(arg)
+            elif opt == "--mp-page-size":
+                mediapackage_page_size = int(arg)
+            elif opt == "--cw-page-size":
+                cloudwatch_page_size = int(arg)
+            elif opt == "--warm-cache":
+                warm_cache = True
+            else:
+                assert False, "Unhandled option '{0}'".format(opt)
+    except ValueError, e:
+        print "Error: Invalid value in the command line options: {0}".format(e)
+        usage(sys.argv[0])
+        exit(-1)
+
+    server = AwsStandIn(("127.0.0.1", 0), StandInInventory(channel_count, endpoint_count, output_count), latency,
+                        latencies, throttle_rate, mediapackage_page_size, cloudwatch_page_size)
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+    work_dir = tempfile.mkdtemp(prefix="benchmark_discovery_")
+    # The output of the script is kept when a run fails
+    failed = True
+    try:
+        arn_file = os.path.join(work_dir, "arns.txt")
+        write_arn_list(arn_file, regions, channel_count)
+        print "{0} MediaLive channels in {1}, {2} MediaPackage endpoints and {3} outputs per channel, {4:.0f} ms " \
+              "latency, throttle rate {5}".format(channel_count * len(regions), ", ".join(regions), endpoint_count,
+                                                  output_count, latency * 1000, throttle_rate)
+        arguments = ["-l", arn_file, "-n", benchmark_dashboard_name] + args
+        if warm_cache:
+            cache_file = os.path.join(work_dir, "cache.sqlite")
+            runs = [("Cold cache", arguments + ["-c", cache_file]), ("Warm cache", arguments + ["-c", cache_file])]
+        else:
+            runs = [("No cache", arguments + ["--no-cache"])]
+        failed = False
+        for run_index, (run_name, run_arguments) in enumerate(runs):
+            log_file = os.path.join(work_dir, "run-{0}.log".format(run_index + 1))
+            exit_code, wall_time, counters = run_script(server, run_arguments, log_file)
+            print_run_report(run_name, exit_code, wall_time, counters, log_file)
+            failed = failed or exit_code != 0
+    finally:
+        server.shutdown()
+        server.server_close()
+        if not failed:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+import sys
+import os
+import getopt
+import json
+import resource
+import subprocess
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import create_CW_dashboard
+
+
+version = '0.1'
+"""
+Rendering benchmarks of create_CW_dashboard.py. Synthetic MediaLive channel inventories, as returned by the discovery,
+are rendered into CloudWatch Dashboard bodies without any AWS request. Every case runs in its own process, which
+reports the render time, the peak memory used while rendering and the size of the Dashboard bodies. The results are
+compared with the baselines stored in baselines.json.
+
+Notes:
+Version 0.1: Initial Release
+"""
+
+# File with the stored results the benchmark results are compared with
+default_baseline_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+# Percentage the render time and the render memory may exceed their baseline before it's reported as a regression.
+# The Dashboard bodies don't depend on the machine, so any change of their size is reported.
+default_tolerance = 25
+# Number of times each case is rendered, the fastest render counts
+default_repeat = 3
+# Region of the synthetic MediaLive channels and of the Dashboard widgets
+benchmark_region = "us-west-2"
+# The benchmark cases as (name, MediaLive channels, MediaPackage endpoints per MediaLive channel, outputs per MediaLive
+# channel, render options) tuples
+benchmark_cases = [
+    ("1-channel", 1, 2, 1, {}),
+    ("10-channels", 10, 2, 4, {}),
+    ("100-channels", 100, 4, 10, {}),
+    ("1000-channels", 1000, 4, 20, {}),
+    ("1000-channels-search", 1000, 8, 20, {"search": True}),
+    ("1000-channels-shorthand", 1000, 8, 20, {"shorthand": True}),
+    ("1000-channels-50-outputs", 1000, 2, 50, {}),
+    ("10000-channels", 10000, 8, 10, {}),
+]
+
+
+def usage(app_name):
+    """Function that prints out a detailed help page for the script"""
+    print '\npython {0} [Optional parameters]\n'.format(app_name)
+    print 'Version:', version
+    print '\nThis script benchmarks the rendering of the CloudWatch Dashboards of create_CW_dashboard.py with synthetic'
+    print "MediaLive channel inventories, without any AWS request, and compares the results with stored baselines."
+    print ""
+    print "Optional parameters"
+    print "-c, --case:   Name of a benchmark case to run, can be repeated. Default: all cases"
+    print "              Cases: {0}".format(", ".join(case[0] for case in benchmark_cases))
+    print "-b, --baselines: File of the stored baselines. Default: {0}".format(default_baseline_file)
+    print "-t, --tolerance: Percentage the render time and memory may exceed their baseline. " \
+          "Default: {0}".format(default_tolerance)
+    print "-r, --repeat: Number of renders per case, the fastest one counts. Default: {0}".format(default_repeat)
+    print "-u, --update-baselines: Store the results as the new baselines."
+    print '-h, --help:   Print this help and exit.'
+    print ""
+    print "The script exits with 1 when a case regressed compared with its baseline."
+
+
+def build_synthetic_channel(index, endpoint_count, output_count):
+    """Return the synthetic discovered MediaLive Channel number "index", with 2 MediaPackage Channels that share
+    "endpoint_count" MediaPackage Endpoints and "output_count" Outputs on both pipelines."""
+    ml_channel_id = str(1000000 + index)
+    mp_channel_names = ["mp-{0}-a".format(index), "mp-{0}-b".format(index)]
+    mp_endpoint_names = {}
+    for endpoint_index in range(endpoint_count):
+        mp_channel_name = mp_channel_names[endpoint_index % 2]
+        mp_endpoint_names.setdefault(mp_channel_name, []).append("{0}-endpoint-{1}".format(mp_channel_name,
+                                                                                        endpoint_index // 2))
+    output_names = [{"ChannelId": ml_channel_id, "OutputName": "output-{0}".format(output_index), "Pipeline": pipeline}
+                    for output_index in range(output_count) for pipeline in ("0", "1")]
+    return {
+        "id": ml_channel_id,
+        "name": "channel-{0}".format(index),
+        "region": benchmark_region,
+        "account_id": None,
+        "mp_urls": ["https://abcdef.mediapackage.{0}.amazonaws.com/in/v2/{1}/{1}/channel".format(benchmark_region,
+                                                                                                 mp_channel_name)
+                    for mp_channel_name in mp_channel_names],
+        "outputgroup_names": ["group-{0}".format(group_index) for group_index in range(max(1, output_count // 10))],
+        "output_names": output_names,
+        "mp_channel_names": mp_channel_names,
+        "mp_endpoint_names": mp_endpoint_names
+    }
+
+
+def get_peak_memory_kb():
+    """Return the peak resident memory of this process in KB"""
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports the peak resident memory in bytes, Linux in KB
+    if sys.platform == "darwin":
+        peak_memory //= 1024
+    return peak_memory
+
+
+def run_benchmark_case(case, repeat):
+    """Render the synthetic inventory of the benchmark case "case" "repeat" times and return its results: the fastest
+    render time, the peak memory used while rendering and the number and size of the Dashboard bodies."""
+    case_name, channel_count, endpoint_count, output_count, options = case
+    create_CW_dashboard.dashboard_metric_shorthand = options.get("shorthand", False)
+    ml_channels = [build_synthetic_channel(index, endpoint_count, output_count) for index in range(channel_count)]
+    start_memory = get_peak_memory_kb()
+    render_times = []
+    cw_dashboards = []
+    # The rendering prints a line per channel
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        for run in range(repeat):
+            cw_dashboards = None
+            started = time.time()
+            cw_dashboards = create_CW_dashboard.render_medialive_dashboards(benchmark_region, ml_channels, "Benchmark",
+                                                                            options.get("search", False))
+            render_times.append(time.time() - started)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    return {
+        "channels": channel_count,
+        "dashboards": len(cw_dashboards),
+        "body_bytes": sum(len(cw_dashboard_body) for cw_dashboard_name, cw_dashboard_body in cw_dashboards),
+        "render_seconds": round(min(render_times), 4),
+        "render_memory_kb": get_peak_memory_kb() - start_memory
+    }
+
+
+def run_benchmark_case_process(case_name, repeat):
+    """Run the benchmark case "case_name" in a new process, so that its peak memory isn't affected by the other cases,
+    and return its results"""
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--run-case", case_name,
+                                "--repeat", str(repeat)], stdout=subprocess.PIPE)
+    output = process.communicate()[0]
+    if process.returncode != 0:
+        print "Error: The benchmark case '{0}' failed with exit code {1}".format(case_name, process.returncode)
+        exit(-1)
+    return json.loads(output.strip().split("\n")[-1])
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """Compare the results of a benchmark case with its baseline and return the list of regressions found"""
+    regressions = []
+    if results["body_bytes"] != baseline["body_bytes"]:
+        regressions.append("body size {0} bytes instead of {1}".format(results["body_bytes"], baseline["body_bytes"]))
+    if results["dashboards"] != baseline["dashboards"]:
+        regressions.append("{0} Dashboards instead of {1}".format(results["dashboards"], baseline["dashboards"]))
+    for key, unit in (("render_seconds", "s"), ("render_memory_kb", "KB")):
+        if results[key] > baseline[key] * (1 + tolerance / 100.0) and results[key] - baseline[key] > 0.01:
+            regressions.append("{0} {1}{2} instead of {3}{2}".format(key.replace("_", " "), results[key], unit,
+                                                                     baseline[key]))
+    return regressions
+
+
+def load_baselines(baseline_file):
+    """Load the stored baselines from "baseline_file", no baselines if the file doesn't exist"""
+    if not os.path.isfile(baseline_file):
+        return {}
+    try:
+        with open(baseline_file, "rt") as in_file:
+            return json.load(in_file)
+    except Exception, e:
+        print "Error: Loading the baselines file '{0}'\n{1}".format(baseline_file, e)
+        exit(-1)
+
+
+def main(argv=None):
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hc:b:t:r:u',
+                                   ['help', 'case=', 'baselines=', 'tolerance=', 'repeat=', 'update-baselines',
+                                    'run-case='])
+    except getopt.GetoptError, err:
+        print str(err)
+        usage(sys.argv[0])
+        exit(-1)
+    case_names = []
+    baseline_file = default_baseline_file
+    tolerance = default_tolerance
+    repeat = default_repeat
+    update_baselines = False
+    run_case = None
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage(sys.argv[0])
+            sys.exit(0)
+        elif opt in ("-c", "--case", "--run-case"):
+            if arg not in [case[0] for case in benchmark_cases]:
+                print "Error: Unknown benchmark case '{0}'".format(arg)
+                exit(-1)
+            if opt == "--run-case":
+                run_case = arg
+            else:
+                case_names.append(arg)
+        elif opt in ("-b", "--baselines"):
+            baseline_file = arg
+        elif opt in ("-t", "--tolerance"):
+            if not arg.isdigit():
+                print "Error: The tolerance must be a percentage, not '{0}'".format(arg)
+                exit(-1)
+            tolerance = int(arg)
+        elif opt in ("-r", "--repeat"):
+            if not arg.isdigit() or int(arg) < 1:
+                print "Error: The number of renders must be a positive integer, not '{0}'".format(arg)
+                exit(-1)
+            repeat = int(arg)
+        elif opt in ("-u", "--update-baselines"):
+            update_baselines = True
+        else:
+            assert False, "Unhandled option '{0}'".format(opt)
+
+    if run_case is not None:
+        # Child process of a single benchmark case, its results are the last line of its output
+        case = [case for case in benchmark_cases if case[0] == run_case][0]
+        print json.dumps(run_benchmark_case(case, repeat), sort_keys=True)
+        return 0
+
+    cases = [case for case in benchmark_cases if len(case_names) == 0 or case[0] in case_names]
+    baselines = load_baselines(baseline_file)
+    regression_count = 0
+    print "{0:<26} {1:>8} {2:>10} {3:>12} {4:>10} {5:>11}  {6}".format("Case", "Channels", "Dashboards", "Body bytes",
+                                                                     "Render s", "Memory KB", "Baseline")
+    for case in cases:
+        case_name = case[0]
+        results = run_benchmark_case_process(case_name, repeat)
+        if case_name not in baselines:
+            status = "none"
+        else:
+            regressions = compare_with_baseline(results, baselines[case_name], tolerance)
+            status = "ok" if len(regressions) == 0 else "REGRESSION: " + ", ".join(regressions)
+            if len(regressions) > 0:
+                regression_count += 1
+        print "{0:<26} {1:>8} {2:>10} {3:>12} {4:>10.3f} {5:>11}  {6}".format(case_name, results["channels"],
+                                                                             results["dashboards"],
+                                                                             results["body_bytes"],
+                                                                             results["render_seconds"],
+                                                                             results["render_memory_kb"], status)
+        baselines[case_name] = results
+
+    if update_baselines:
+        with open(baseline_file, "wt") as out_file:
+            json.dump(baselines, out_file, indent=4, separators=(",", ": "), sort_keys=True)
+            out_file.write("\n")
+        print "\nStored the results as the new baselines in '{0}'".format(baseline_file)
+    elif regression_count > 0:
+        print "\n{0} of {1} benchmark cases regressed".format(regression_count, len(cases))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,6 +5,21 @@ import os
 import getopt
 import boto3
 import json
+import re
+import sqlite3
+import time
+import math
+import hashlib
+import cProfile
+import pstats
+import botocore.session
+from botocore import xform_name
+from botocore.config import Config
+from botocore.credentials import RefreshableCredentials
+from botocore.exceptions import ClientError
+import threading
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 
 
 version = '0.4'
@@ -469,8 +484,62 @@ def usage(app_name):
     print "              All MediaLive channels and their corresponding MediaPackage channels will be included in "
     print "              the CloudWatch Dashboard."
     print "              Note: This parameter is ignored if a channel ARN is provided via the '-a/--arn' option"
-    print "              Note: All ARNs in the list must be for channels in the same region. All ARNs not in the same"
-    print "              region as the first ARN in the list will be ignored."
+    print "              Note: The ARNs in the list can be for channels in several regions. The Dashboard is created in"
+    print "              the region of the first ARN in the list."
+    print "              Note: When the channels don't fit within the CloudWatch Dashboard quotas, they are split over"
+    print "              Dashboards named after the Dashboard name with a sequence number, e.g. 'My-TV-Dashboard-1'."
+    print "-w, --workers: Number of MediaLive channels that are discovered concurrently. " \
+          "Default: {0}".format(default_discovery_workers)
+    print "              The Dashboard is the same for any number of workers. The regions in the list are discovered in"
+    print "              parallel, each with this number of workers."
+    print "-m, --max-requests: Maximum number of AWS requests in flight at the same time, shared by all workers."
+    print "              Use it with a large number of workers for very large channel lists. Default: no limit"
+    print "-p, --pool-size: Maximum number of HTTP connections kept open, and reused, per AWS service and region."
+    print "              Default: the number of workers, but at least 10"
+    print "-c, --cache:  File of the discovery cache, which keeps the MediaLive, MediaPackage and CloudWatch"
+    print "              information of earlier runs for a limited time. Default: {0}".format(default_discovery_cache_file)
+    print "-r, --refresh: Ignore the cached information and discover everything again. The cache is updated."
+    print "--no-cache:   Do not use the discovery cache."
+    print "-u, --update: Compare the new Dashboard with the existing one, report the changes per widget and only"
+    print "              write the Dashboard when something changed."
+    print "--delete-stale: Delete the Dashboards left over from earlier runs with the same name, i.e. the unsplit"
+    print "              Dashboard or the shards '<name>-<n>' that aren't published any more. By default they are only"
+    print "              reported."
+    print "-s, --search: Use SEARCH expressions, scoped to the MediaPackage Channels, in the Egress widgets instead of"
+    print "              1 metric per MediaPackage Endpoint. The Endpoints aren't discovered and new Endpoints show up"
+    print "              without updating the Dashboard."
+    print "--recently-active: Only include the MediaLive Outputs with metrics in the last 3 hours, which leaves out the"
+    print "              Outputs of channels that were stopped since."
+    print "--accounts:   Filename of the account map, a JSON object with the IAM Role ARN to assume per AWS Account ID,"
+    print "              e.g. {\"111122223333\": \"arn:aws:iam::111122223333:role/DashboardDiscovery\"}. The channels in"
+    print "              these AWS Accounts are discovered with the Role, and their metrics carry the AWS Account ID."
+    print "              All other channels are discovered with the default credentials."
+    print "-b, --budget: Budget of the Dashboard body size in bytes. The Dashboard is split in shards that fit within"
+    print "              it. Dashboards still over budget, or over the CloudWatch metric quotas, are reported widget by"
+    print "              widget before publishing. Default: {0}".format(dashboard_max_body_bytes)
+    print "--fail-over-budget: Don't publish any Dashboard when a Dashboard is over budget."
+    print "--report:     Print the body bytes and the number of metrics of every widget of the Dashboards."
+    print "--shorthand:  Write the metrics that start like the metric before them with the '...' shorthand, which"
+    print "              makes the Dashboard body smaller. The Dashboard shows the same graphs."
+    print "--endpoint-url: URL used instead of the AWS endpoints of MediaLive, MediaPackage and CloudWatch, e.g. the"
+    print "              local stand-in of the discovery benchmark."
+    print "--trace:      Filename of a trace of this run in the Chrome trace_event JSON format, with spans for the ARN"
+    print "              list loading, the discovery of every channel and its steps, the rendering, the serialization"
+    print "              and the publishing of the Dashboards. Open it in chrome://tracing or https://ui.perfetto.dev"
+    print "--profile:    Filename of the cProfile statistics of this run, readable with pstats. The functions with the"
+    print "              most own time are printed per phase: discovery, builders, serialization and publishing."
+    print "--export-inventory: Filename of an inventory snapshot, in which everything discovered about the channels"
+    print "              is written, to render the Dashboard again later with '--from-inventory'."
+    print "--from-inventory: Filename of an inventory snapshot written with '--export-inventory'. The Dashboard is"
+    print "              rendered from it, without discovering the channels, so '-a/--arn' and '-l/--list' aren't used."
+    print "--dry-run:    Render and check the Dashboards, but don't publish them. With '--from-inventory' no AWS"
+    print "              request is made at all."
+    print "--output-dir: Folder to write the Dashboard bodies to instead of publishing them, 1 file per Dashboard named"
+    print "              after the Dashboard and the hash of its body, listed in '{0}'.".format(dashboard_manifest_file)
+    print "--publish-dir: Folder written with '--output-dir' whose Dashboards are published. Only the Dashboards that"
+    print "              changed since the last publish from the folder, as recorded in '{0}', are " \
+          "published.".format(dashboard_published_file)
+    print "              '-a/--arn', '-l/--list' and '-n/--name' aren't used."
     print '-h, --help:   Print this help and exit.'
     print ""
     print 'Examples:'
@@ -512,6 +581,16 @@ def extract_medialive_region(ml_channel_arn):
     return region
 
 
+def extract_medialive_account_id(ml_channel_arn):
+    """Given a MediaLive Channel ARN, return the ID of the AWS Account the channel is in"""
+    account_id = None
+    if is_valid_medialive_channel_arn(ml_channel_arn):
+        arn_parts = ml_channel_arn.split(":")
+        if len(arn_parts) == 7:
+            account_id = arn_parts[4]
+    return account_id
+
+
 def extract_medialive_channel_id(ml_channel_arn):
     """Given a MediaLive Channel ARN, return the MediaLive Channel ID"""
     ml_channel_id = None
@@ -522,30 +601,19 @@ def extract_medialive_channel_id(ml_channel_arn):
 
 def load_eml_arn_list(ml_list_file):
     """Load the MediaLive Channel ARNs defined in "ml_list_file" and return as a list.
-    All MediaLive Channels must be in the same region to be eligble for inclusion into a CloudWatch Dashboard metric
-    widget. Therefore only Channel ARNs in the same region as the first Channel ARN in the list will be returned.
-    Additionally, any duplicate ARNs will be discarded as well."""
-    first_region = None
-    is_first_arn = True
+    The Channels can be in any region, the metrics of Channels outside the region of the first Channel ARN in the list
+    carry their own region in the CloudWatch Dashboard widgets. Any duplicate ARNs will be discarded."""
     result = []
     try:
         with open(ml_list_file, "rt") as in_file:
             for line in in_file:
                 line = line.strip()
                 if is_valid_medialive_channel_arn(line):
-                    current_region = extract_medialive_region(line)
-                    if is_first_arn:
-                        first_region = current_region
-                        is_first_arn = False
-                    if current_region == first_region:
-                        if line not in result:
-                            result.append(line)
-                        else:
-                            print "Skipping duplicate MediaLive ARN '{0}', since it already exists in the " \
-                                  "list".format(line)
+                    if line not in result:
+                        result.append(line)
                     else:
-                        print "Ignoring MediaLive ARN '{0}', since it's not in the same region as the first " \
-                              "ARN in the list.".format(line)
+                        print "Skipping duplicate MediaLive ARN '{0}', since it already exists in the " \
+                              "list".format(line)
                 else:
                     if line is not "":
                         print "'{0}' is not a valid MediaLive Channel ARN".format(line)
@@ -554,17 +622,513 @@ def load_eml_arn_list(ml_list_file):
         print "Error: Processing EML Channel ARN List file '{0}'\n{1}".format(ml_list_file, e.message)
 
 
+def load_aws_account_roles(account_file):
+    """Load the account map defined in "account_file", a JSON object with the IAM Role ARN to assume per AWS Account
+    ID, and return it as a dict. Returns None if the file isn't a valid account map."""
+    try:
+        with open(account_file, "rt") as in_file:
+            account_roles = json.load(in_file)
+    except Exception, e:
+        print "Error: Processing the account map file '{0}'\n{1}".format(account_file, e)
+        return None
+    if not isinstance(account_roles, dict):
+        print "Error: The account map file '{0}' must contain a JSON object".format(account_file)
+        return None
+    for account_id, role_arn in account_roles.items():
+        if not (account_id.isdigit() and len(account_id) == 12) or not isinstance(role_arn, basestring) or \
+                not role_arn.startswith("arn:aws:iam::"):
+            print "Error: Invalid account map entry '{0}': '{1}', expecting a 12 digit AWS Account ID and an IAM " \
+                  "Role ARN".format(account_id, role_arn)
+            return None
+    return dict((str(account_id), str(role_arn)) for account_id, role_arn in account_roles.items())
+
+
+# AWS client related functions
+# Number of attempts per AWS request before a throttled or failed request is reported as an error
+aws_max_attempts = 10
+# Error codes with which MediaLive, MediaPackage and CloudWatch throttle requests
+throttling_error_codes = ("Throttling", "ThrottlingException", "TooManyRequestsException", "LimitExceededException")
+# Maximum number of HTTP connections kept open per client, botocore's default of 10 when None
+aws_max_pool_connections = None
+# Enable TCP keep-alive on the kept open HTTP connections, when supported by the installed botocore version
+aws_tcp_keepalive = True
+# Endpoint URL, set with '--endpoint-url', that replaces the AWS endpoints of the services below, e.g. a local stand-in
+# for the AWS APIs. None for the AWS endpoints.
+aws_endpoint_url = None
+aws_endpoint_url_services = ("medialive", "mediapackage", "cloudwatch")
+# The boto3 session used for the default credentials and the clients of this run, keyed by
+# (service, region, session), so that every client and its HTTP connections are shared by the whole run
+aws_session = None
+aws_clients = {}
+aws_clients_lock = threading.Lock()
+# IAM Role ARN to assume per AWS Account ID, loaded from the account map with '--accounts'. The resources in AWS
+# Accounts that aren't in the account map are accessed with the default credentials.
+aws_account_roles = {}
+aws_role_session_name = "create_CW_dashboard"
+# The boto3 sessions with the credentials of the assumed Roles by AWS Account ID, their AWS Account ID by session, and
+# the AWS Account ID of the clients created with them, or with the default credentials
+aws_account_sessions = {}
+aws_session_accounts = {}
+aws_account_sessions_lock = threading.Lock()
+aws_client_accounts = {}
+
+
+def create_aws_client_config():
+    """Create the botocore client configuration shared by the MediaLive, MediaPackage and CloudWatch clients.
+    The adaptive retry mode gives every client, and so every service, its own token bucket that lowers the request
+    rate on throttling responses and raises it again while requests succeed, and retries with jittered backoff."""
+    config = {'retries': {'mode': 'adaptive', 'total_max_attempts': aws_max_attempts}}
+    if aws_max_pool_connections is not None:
+        config['max_pool_connections'] = aws_max_pool_connections
+    if aws_tcp_keepalive and 'tcp_keepalive' in Config.OPTION_DEFAULTS:
+        config['tcp_keepalive'] = True
+    return Config(**config)
+
+
+def get_aws_client(service_name, region_name, session=None):
+    """Return the client of the AWS service "service_name" in the region "region_name" using the credentials of the
+    boto3 session "session", or of the default session. Only one client is created per (service, region, credentials)
+    so that all requests reuse its open HTTP connections instead of doing a new TLS handshake."""
+    global aws_session
+    with aws_clients_lock:
+        if session is None:
+            if aws_session is None:
+                aws_session = boto3.session.Session()
+            session = aws_session
+        client_key = (service_name, region_name, session)
+        if client_key not in aws_clients:
+            endpoint_url = aws_endpoint_url if service_name in aws_endpoint_url_services else None
+            aws_clients[client_key] = session.client(service_name, region_name=region_name, endpoint_url=endpoint_url,
+                                                     config=create_aws_client_config())
+            account_aws_calls(aws_clients[client_key])
+            if session in aws_session_accounts:
+                aws_client_accounts[aws_clients[client_key]] = aws_session_accounts[session]
+        return aws_clients[client_key]
+
+
+def get_aws_client_scope(client):
+    """Return the scope of the AWS resources seen by the client "client", which prefixes the discovery cache keys:
+    its region, preceded by its AWS Account ID when known, and followed by the endpoint URL set with '--endpoint-url',
+    so that the cache never mixes the resources of different AWS Accounts or endpoints"""
+    scope = client.meta.region_name
+    account_id = aws_client_accounts.get(client)
+    if account_id is not None:
+        scope = "{0}:{1}".format(account_id, scope)
+    if aws_endpoint_url is not None and client.meta.service_model.service_name in aws_endpoint_url_services:
+        scope = "{0}@{1}".format(scope, aws_endpoint_url)
+    return scope
+
+
+def get_aws_account_session(account_id):
+    """Return the boto3 session for the resources in the AWS Account "account_id". The Role of the account map is
+    assumed once per run and AWS Account, after which botocore refreshes its credentials shortly before they expire.
+    Returns None, standing for the default session, for an AWS Account that isn't in the account map."""
+    role_arn = aws_account_roles.get(account_id)
+    if role_arn is None:
+        return None
+    with aws_account_sessions_lock:
+        if account_id not in aws_account_sessions:
+            def assume_role():
+                response = get_aws_client('sts', None).assume_role(RoleArn=role_arn,
+                                                                    RoleSessionName=aws_role_session_name)
+                credentials = response["Credentials"]
+                return {"access_key": credentials["AccessKeyId"],
+                        "secret_key": credentials["SecretAccessKey"],
+                        "token": credentials["SessionToken"],
+                        "expiry_time": credentials["Expiration"].isoformat()}
+
+            botocore_session = botocore.session.get_session()
+            # botocore has no public setter for the credentials of a session, refreshable ones included
+            botocore_session._credentials = RefreshableCredentials.create_from_metadata(
+                metadata=assume_role(), refresh_using=assume_role, method="sts-assume-role")
+            session = boto3.session.Session(botocore_session=botocore_session)
+            aws_account_sessions[account_id] = session
+            aws_session_accounts[session] = account_id
+        return aws_account_sessions[account_id]
+
+
+def describe_aws_error(error):
+    """Return the message of the AWS error "error", stating on how many attempts the request was throttled. The
+    retry quota of botocore can stop the retries before the maximum number of attempts."""
+    if isinstance(error, ClientError) and error.response.get("Error", {}).get("Code") in throttling_error_codes:
+        retry_attempts = error.response.get("ResponseMetadata", {}).get("RetryAttempts")
+        if retry_attempts is None:
+            return "{0} - The request was throttled".format(error)
+        return "{0} - The request was throttled on {1} of at most {2} attempts".format(error, retry_attempts + 1,
+                                                                                        aws_max_attempts)
+    return str(error)
+
+
+# AWS call accounting related functions
+# Calls, retries, throttling responses, errors and latencies in seconds of every AWS operation of this run, keyed by
+# the operation name as called on the boto3 clients, e.g. describe_channel. A paginated operation counts 1 call per page.
+aws_call_stats = {}
+aws_call_stats_lock = threading.Lock()
+
+
+def start_aws_call(model, context, **kwargs):
+    """botocore 'before-call' handler that marks the start of an AWS call, before its first attempt"""
+    context["call_accounting"] = {"operation": xform_name(model.name), "started": time.time(), "attempts": 0,
+                                  "throttles": 0}
+
+
+def count_aws_call_attempt(response_dict, parsed_response, context, **kwargs):
+    """botocore 'response-received' handler that counts the attempts, retries included, of an AWS call and its
+    throttling responses"""
+    call_accounting = context.get("call_accounting")
+    if call_accounting is None:
+        return
+    call_accounting["attempts"] += 1
+    error_code = (parsed_response or {}).get("Error", {}).get("Code")
+    if error_code in throttling_error_codes or (response_dict or {}).get("status_code") == 429:
+        call_accounting["throttles"] += 1
+
+
+def record_aws_call(context, failed):
+    """Add the AWS call of the request context "context" to the accounting of its operation"""
+    call_accounting = context.pop("call_accounting", None)
+    if call_accounting is None:
+        return
+    latency = time.time() - call_accounting["started"]
+    with aws_call_stats_lock:
+        operation_stats = aws_call_stats.setdefault(call_accounting["operation"], {
+            "calls": 0, "retries": 0, "throttles": 0, "errors": 0, "latencies": []})
+        operation_stats["calls"] += 1
+        operation_stats["retries"] += max(0, call_accounting["attempts"] - 1)
+        operation_stats["throttles"] += call_accounting["throttles"]
+        operation_stats["errors"] += 1 if failed else 0
+        operation_stats["latencies"].append(latency)
+
+
+def finish_aws_call(http_response, context, **kwargs):
+    """botocore 'after-call' handler, the AWS call got a response, the last attempt may have failed"""
+    record_aws_call(context, http_response.status_code >= 300)
+
+
+def fail_aws_call(context, **kwargs):
+    """botocore 'after-call-error' handler, the AWS call ended without a response, e.g. on a connection error"""
+    record_aws_call(context, True)
+
+
+def account_aws_calls(client):
+    """Add the calls of the client "client" to the per operation accounting of this run"""
+    client.meta.events.register('before-call', start_aws_call)
+    client.meta.events.register('response-received', count_aws_call_attempt)
+    client.meta.events.register('after-call', finish_aws_call)
+    client.meta.events.register('after-call-error', fail_aws_call)
+
+
+def get_latency_percentile(sorted_latencies, percentile):
+    """Return the latency at "percentile" of the sorted list of latencies "sorted_latencies", by the nearest rank"""
+    rank = int(math.ceil(percentile / 100.0 * len(sorted_latencies)))
+    return sorted_latencies[max(0, rank - 1)]
+
+
+def summarize_aws_calls():
+    """Return the accounting of the AWS calls of this run as a (operation, calls, retries, throttles, errors, p50, p95,
+    max latency in milliseconds) tuple per operation, in operation name order"""
+    summary = []
+    with aws_call_stats_lock:
+        for operation in sorted(aws_call_stats):
+            operation_stats = aws_call_stats[operation]
+            latencies = sorted(operation_stats["latencies"])
+            summary.append((operation, operation_stats["calls"], operation_stats["retries"],
+                            operation_stats["throttles"], operation_stats["errors"],
+                            get_latency_percentile(latencies, 50) * 1000, get_latency_percentile(latencies, 95) * 1000,
+                            latencies[-1] * 1000))
+    return summary
+
+
+def print_aws_call_summary():
+    """Print the calls, retries, throttling responses, errors and latencies of every AWS operation of this run"""
+    summary = summarize_aws_calls()
+    if len(summary) == 0:
+        return
+    print "\nAWS calls:"
+    line_format = "  {0:<24} {1:>7} {2:>8} {3:>10} {4:>7} {5:>9} {6:>9} {7:>9}"
+    print line_format.format("Operation", "Calls", "Retries", "Throttles", "Errors", "p50 ms", "p95 ms", "max ms")
+    for operation, calls, retries, throttles, errors, p50, p95, maximum in summary:
+        print line_format.format(operation, calls, retries, throttles, errors, "{0:.1f}".format(p50),
+                                 "{0:.1f}".format(p95), "{0:.1f}".format(maximum))
+    print line_format.format("Total", sum(entry[1] for entry in summary), sum(entry[2] for entry in summary),
+                             sum(entry[3] for entry in summary), sum(entry[4] for entry in summary), "", "", "")
+
+
+# Trace related functions
+# Spans of the phases of this run, kept as Chrome trace_event "complete" events when tracing with '--trace'. None when
+# not tracing, then a span costs next to nothing. The names of the threads that recorded spans are kept by thread ID.
+trace_events = None
+trace_threads = {}
+trace_events_lock = threading.Lock()
+trace_started = time.time()
+
+
+def start_tracing():
+    """Record the spans of this run from now on"""
+    global trace_events
+    global trace_started
+    trace_events = []
+    trace_threads.clear()
+    trace_started = time.time()
+
+
+@contextmanager
+def trace_span(name, **args):
+    """Record the run of the with block as the span "name", with the details "args", when tracing"""
+    if trace_events is None:
+        yield
+        return
+    started = time.time()
+    try:
+        yield
+    finally:
+        finished = time.time()
+        thread = threading.current_thread()
+        with trace_events_lock:
+            trace_threads[thread.ident] = thread.name
+            trace_events.append({"name": name, "ph": "X", "pid": os.getpid(), "tid": thread.ident,
+                                 "ts": int((started - trace_started) * 1000000),
+                                 "dur": int((finished - started) * 1000000), "args": args})
+
+
+def write_trace(trace_file):
+    """Write the recorded spans to "trace_file" in the Chrome trace_event JSON format, which chrome://tracing and
+    Perfetto show as a timeline with a row per thread"""
+    with trace_events_lock:
+        events = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": thread_id,
+                   "args": {"name": thread_name}} for thread_id, thread_name in sorted(trace_threads.items())]
+        events += sorted(trace_events, key=lambda event: event["ts"])
+    try:
+        with open(trace_file, "wt") as out_file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, out_file, separators=(",", ":"))
+        print "\nWrote {0} trace spans to '{1}'".format(len(events) - len(trace_threads), trace_file)
+    except Exception, e:
+        print "Warning: Unable to write the trace file '{0}': {1}".format(trace_file, e)
+
+
+# Profiling related functions
+# The cProfile profilers of the threads of this run when profiling with '--profile', None when not profiling. cProfile
+# only profiles the thread it's enabled in, so every thread that runs a part of the pipeline gets its own profiler.
+profilers = None
+profilers_lock = threading.Lock()
+profile_thread = threading.local()
+# Number of functions with the most own time printed per phase
+profile_top_functions = 10
+# The functions of this script whose calls, and everything they call, make up a phase of the run. A function called in
+# several phases shares its time between them in proportion to the time of its calls from each phase.
+profile_phase_roots = {
+    "get_aws_client": "discovery",
+    "get_aws_account_session": "discovery",
+    "discover_medialive_channel": "discovery",
+    "render_medialive_dashboards": "builders",
+    "serialize_dashboard_body": "serialization",
+    "normalize_dashboard_body": "serialization",
+    "check_dashboard_budget": "serialization",
+    "publish_cloudwatch_dashboards": "publishing",
+    "create_cloudwatch_dashboard": "publishing",
+    "update_cloudwatch_dashboard": "publishing",
+    "remove_stale_dashboards": "publishing"
+}
+profile_phases = ("discovery", "builders", "serialization", "publishing", "other")
+
+
+def start_profiling():
+    """Profile the functions run through profiled() from now on"""
+    global profilers
+    profilers = []
+
+
+def profiled(function):
+    """Return "function" wrapped to run under the profiler of the calling thread when profiling. Used for the main
+    pipeline and for every function that runs on a pool thread."""
+    if profilers is None:
+        return function
+
+    def run_profiled(*args):
+        profiler = getattr(profile_thread, "profiler", None)
+        if profiler is None:
+            profiler = cProfile.Profile()
+            profile_thread.profiler = profiler
+            with profilers_lock:
+                profilers.append(profiler)
+        # A thread that is already profiled, e.g. a region discovering its channels without a pool, keeps its profiler
+        if getattr(profile_thread, "active", False):
+            return function(*args)
+        profile_thread.active = True
+        try:
+            return profiler.runcall(function, *args)
+        finally:
+            profile_thread.active = False
+    return run_profiled
+
+
+def get_profile_phase_times(stats, phase_roots):
+    """Return the (own time, calls, function) of the functions of the pstats "stats" by phase. The functions of
+    "phase_roots" start a phase, every other function takes the phases of its callers, weighed by the time of the calls
+    from each caller. The functions that aren't called from any phase are in the phase "other"."""
+    module_name = os.path.splitext(os.path.basename(__file__))[0]
+    phase_shares = {}
+    function_callers = {}
+    for function, (primitive_calls, calls, own_time, cumulative_time, callers) in stats.stats.items():
+        filename, line, function_name = function
+        if function_name in phase_roots and os.path.splitext(os.path.basename(filename))[0] == module_name:
+            phase_shares[function] = {phase_roots[function_name]: 1.0}
+            continue
+        # Recursive calls are accounted at the outermost call
+        callers = [(caller, caller_stats[3]) for caller, caller_stats in callers.items()
+                   if caller != function and caller in stats.stats]
+        if len(callers) == 0:
+            phase_shares[function] = {"other": 1.0}
+            continue
+        callers_time = sum(caller_time for caller, caller_time in callers)
+        function_callers[function] = [(caller, caller_time / callers_time if callers_time > 0 else 1.0 / len(callers))
+                                      for caller, caller_time in callers]
+        phase_shares[function] = {}
+    # The phases flow down the call graph, a number of call levels per pass, until they settle. Mutually recursive
+    # functions settle gradually, so the number of passes is capped and what's left over goes to "other".
+    for profile_pass in range(200):
+        settled = True
+        for function, callers in function_callers.items():
+            shares = {}
+            for caller, weight in callers:
+                for phase, share in phase_shares[caller].items():
+                    shares[phase] = shares.get(phase, 0) + weight * share
+            if settled and any(abs(shares.get(phase, 0) - phase_shares[function].get(phase, 0)) > 1e-6
+                               for phase in profile_phases):
+                settled = False
+            phase_shares[function] = shares
+        if settled:
+            break
+    phase_times = dict((phase, []) for phase in profile_phases)
+    for function, (primitive_calls, calls, own_time, cumulative_time, callers) in stats.stats.items():
+        shares = phase_shares[function]
+        if sum(shares.values()) < 0.999:
+            shares["other"] = shares.get("other", 0) + 1.0 - sum(shares.values())
+        for phase, share in shares.items():
+            if share > 0:
+                phase_times[phase].append((own_time * share, calls, function))
+    return phase_times
+
+
+def write_profile(profile_file):
+    """Write the merged profile of all profiled threads to "profile_file", readable with pstats, and print the
+    functions with the most own time of every phase of the run"""
+    with profilers_lock:
+        if profilers is None or len(profilers) == 0:
+            return
+        stats = pstats.Stats(*profilers)
+    try:
+        stats.dump_stats(profile_file)
+    except Exception, e:
+        print "Warning: Unable to write the profile file '{0}': {1}".format(profile_file, e)
+    phase_times = get_profile_phase_times(stats, profile_phase_roots)
+    print "\nProfile: {0:.3f} seconds in {1} function calls over {2} threads, written to '{3}'".format(
+        stats.total_tt, stats.total_calls, len(profilers), profile_file)
+    for phase in profile_phases:
+        functions = sorted(phase_times[phase], reverse=True)
+        phase_time = sum(function[0] for function in functions)
+        if phase_time == 0:
+            continue
+        print "{0}: {1:.3f} seconds ({2:.0f}%)".format(phase, phase_time, 100 * phase_time / stats.total_tt)
+        for own_time, calls, function in functions[:profile_top_functions]:
+            print "  {0:>9.3f} s {1:>9} calls  {2}".format(own_time, calls, pstats.func_std_string(function))
+
+
+# Discovery cache related functions
+# Default file of the on-disk discovery cache, shared by all runs of the script
+default_discovery_cache_file = os.path.join(os.path.expanduser("~"), ".create_CW_dashboard_cache.sqlite")
+# Number of seconds a cached discovery result stays valid, per kind of result
+discovery_cache_ttls = {
+    "describe_channel": 24 * 3600,
+    "mediapackage_channel": 24 * 3600,
+    "mediapackage_endpoints": 3600,
+    "output_names": 6 * 3600
+}
+# The discovery cache of this run, None when the cache is disabled
+discovery_cache = None
+
+
+class DiscoveryCache(object):
+    """SQLite file holding the describe-channel responses, the MediaPackage Channel and Endpoint indexes and the
+    OutputVideoFrameRate Output Names of earlier runs. Entries expire after the time to live of their kind. With
+    "refresh", cached entries are ignored but replaced by the freshly discovered ones. The new entries are written to
+    the file when the cache is closed."""
+
+    def __init__(self, filename, refresh=False):
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS discovery (kind TEXT, key TEXT, stored REAL, value TEXT, "
+                                "PRIMARY KEY (kind, key))")
+
+    def get(self, kind, key):
+        """Return the cached value of "kind" for "key", or None if there is no valid entry"""
+        if self.refresh:
+            return None
+        with self.lock:
+            row = self.connection.execute("SELECT stored, value FROM discovery WHERE kind = ? AND key = ?",
+                                          (kind, key)).fetchone()
+        if row is None or time.time() - row[0] > discovery_cache_ttls[kind]:
+            return None
+        return json.loads(row[1])
+
+    def put(self, kind, key, value):
+        """Store the value of "kind" for "key" """
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO discovery VALUES (?, ?, ?, ?)",
+                                    (kind, key, time.time(), json.dumps(value, default=str)))
+
+    def close(self):
+        """Write the new entries to the file and close it"""
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
+
+
+def get_cached_discovery(kind, key):
+    """Return the value of "kind" for "key" from the discovery cache, or None if not cached or the cache is disabled"""
+    if discovery_cache is None:
+        return None
+    return discovery_cache.get(kind, key)
+
+
+def put_cached_discovery(kind, key, value):
+    """Store the value of "kind" for "key" in the discovery cache, if enabled"""
+    if discovery_cache is not None:
+        discovery_cache.put(kind, key, value)
+
+
 # MediaLive related functions
-def create_medialive_client_instance(ml_region):
-    """Create a MediaLive Client Instance for the region specified in "ml_region". """
+def create_medialive_client_instance(ml_region, session=None):
+    """Create a MediaLive Client Instance for the region specified in "ml_region", using the credentials of the boto3
+    session "session" or the default credentials."""
     try:
-        medialive = boto3.client('medialive', region_name=ml_region)
+        medialive = get_aws_client('medialive', ml_region, session)
         return medialive
     except Exception, e:
         print "Error: Creating a MediaLive Client instance:\n '{0}'".format(e.message)
         exit(-1)
 
 
+# describe-channel responses of this run, keyed by (AWS client scope, MediaLive Channel ID)
+medialive_channel_descriptions = {}
+
+
+def describe_medialive_channel(ml_client, ml_channel_id):
+    """Perform the describe-channel query for the MediaLive Channel ID "ml_channel_id" once per run and return the
+    response, so that all information extracted from the channel configuration is read from a single query."""
+    channel_key = (get_aws_client_scope(ml_client), ml_channel_id)
+    if channel_key not in medialive_channel_descriptions:
+        cache_key = "{0}:{1}".format(*channel_key)
+        response = get_cached_discovery("describe_channel", cache_key)
+        if response is None:
+            response = ml_client.describe_channel(ChannelId=ml_channel_id)
+            response.pop("ResponseMetadata", None)
+            put_cached_discovery("describe_channel", cache_key, response)
+        medialive_channel_descriptions[channel_key] = response
+    return medialive_channel_descriptions[channel_key]
+
+
 def extract_medialive_channel_info(ml_client, ml_channel_id):
     """Perform a list-channels query against all MediaLive channel in the region specified by the
     MediaLive Channel ID and retrieve the MediaLive Channel Name, and MediaPackage Channel ARNs
@@ -572,9 +1136,7 @@ def extract_medialive_channel_info(ml_client, ml_channel_id):
     mediapackage_channel_list = []
     channel_name = None
     try:
-        response = ml_client.describe_channel(
-            ChannelId=ml_channel_id
-        )
+        response = describe_medialive_channel(ml_client, ml_channel_id)
         channel_name = str(response["Name"])
         destinations = response["Destinations"]
         for destination in destinations:
@@ -583,7 +1145,7 @@ def extract_medialive_channel_info(ml_client, ml_channel_id):
                 if "mediapackage" in url:
                     mediapackage_channel_list.append(url)
     except Exception, e:
-        print "Error:", e.message
+        print "Error:", describe_aws_error(e)
     return channel_name, mediapackage_channel_list
 
 
@@ -592,7 +1154,7 @@ def extract_medialive_outputgroup_names(ml_client, ml_channel_id):
     channel configuration."""
     mp_outputgroup_names = []
     try:
-        channel_response = ml_client.describe_channel(ChannelId=ml_channel_id)
+        channel_response = describe_medialive_channel(ml_client, ml_channel_id)
         outputgroups = channel_response["EncoderSettings"]["OutputGroups"]
         for outputgroup in outputgroups:
             groupname = str(outputgroup["Name"])
@@ -600,24 +1162,93 @@ def extract_medialive_outputgroup_names(ml_client, ml_channel_id):
         return mp_outputgroup_names
     except Exception, e:
         print "Error: Unable to perform the describe-channel() query for the MediaLive Channel", ml_channel_id
-        print "Error message:", e
+        print "Error message:", describe_aws_error(e)
 
 
 # MediaPackage related functions
-def create_mediapackage_client_instance(mp_region):
-    """Create a MediaPackage Client Instance for the region specified in "mp_region". """
+def create_mediapackage_client_instance(mp_region, session=None):
+    """Create a MediaPackage Client Instance for the region specified in "mp_region", using the credentials of the
+    boto3 session "session" or the default credentials."""
     try:
-        mediapackage = boto3.client('mediapackage', region_name=mp_region)
+        mediapackage = get_aws_client('mediapackage', mp_region, session)
         return mediapackage
     except Exception, e:
         print "Error: Creating a MediaPackage Client instance '{0}'".format(e.message)
 
 
-def extract_mediapackage_channel_names(mp_client, mediapackage_url_list, ml_region):
-    """Using the list-channels query, in the region "ml_region", find the MediaPackage Channel Id for the MediaPackage 
+# Maximum number of results returned per page by the MediaPackage list queries
+mediapackage_page_size = 1000
+
+
+def iterate_mediapackage_items(mp_client, operation_name, result_key):
+    """Generator that streams the items of the paginated MediaPackage query "operation_name" one page at a time, so
+    that no page is requested before all items of the previous page have been consumed."""
+    paginator = mp_client.get_paginator(operation_name)
+    for response in paginator.paginate(PaginationConfig={'PageSize': mediapackage_page_size}):
+        for item in response[result_key]:
+            yield item
+
+
+class MediaPackageInventory(object):
+    """Index of the MediaPackage Channels and Endpoints of a region, shared by all MediaLive channels of a run.
+    The list-channels pages are only read until every requested Channel UID is resolved. The list_origin_endpoints
+    pages are read once, on the first endpoint lookup, since the endpoints of a channel can be on any page.
+    Channels and Endpoints found in the discovery cache are not listed at all, unless a channel is missing from the
+    cached Endpoints, e.g. because it was created since, in which case they are listed again once.
+    Lookups are serialized so that the inventory can be shared by the discovery workers."""
+
+    def __init__(self, mp_client):
+        self.scope = get_aws_client_scope(mp_client)
+        self.channels = iterate_mediapackage_items(mp_client, 'list_channels', 'Channels')
+        self.endpoints = iterate_mediapackage_items(mp_client, 'list_origin_endpoints', 'OriginEndpoints')
+        self.channel_ids = {}
+        self.listed_channels = 0
+        self.channel_endpoints = None
+        self.channel_endpoints_cached = False
+        self.lock = threading.Lock()
+
+    def find_channel_ids(self, channel_uids):
+        """Return the (position, Channel Id) of the MediaPackage Channels with the UIDs "channel_uids" that exist,
+        where position is the order in which list-channels returned the channel."""
+        with self.lock:
+            unresolved = set(channel_uids) - set(self.channel_ids)
+            for channel_uid in list(unresolved):
+                cached_channel = get_cached_discovery("mediapackage_channel", "{0}:{1}".format(self.scope, channel_uid))
+                if cached_channel is not None:
+                    self.channel_ids[channel_uid] = (cached_channel[0], str(cached_channel[1]))
+                    unresolved.discard(channel_uid)
+            while len(unresolved) > 0:
+                channel = next(self.channels, None)
+                if channel is None:
+                    break
+                channel_uid = channel["Arn"].split("/")[-1]
+                self.channel_ids[channel_uid] = (self.listed_channels, str(channel["Id"]))
+                self.listed_channels += 1
+                put_cached_discovery("mediapackage_channel", "{0}:{1}".format(self.scope, channel_uid),
+                                     self.channel_ids[channel_uid])
+                unresolved.discard(channel_uid)
+            return [self.channel_ids[channel_uid] for channel_uid in channel_uids if channel_uid in self.channel_ids]
+
+    def find_endpoint_ids(self, channel_id):
+        """Return the Endpoint Ids of the MediaPackage Channel "channel_id" """
+        with self.lock:
+            if self.channel_endpoints is None:
+                self.channel_endpoints = get_cached_discovery("mediapackage_endpoints", self.scope)
+                self.channel_endpoints_cached = self.channel_endpoints is not None
+            if self.channel_endpoints is None or \
+                    (self.channel_endpoints_cached and str(channel_id) not in self.channel_endpoints):
+                self.channel_endpoints_cached = False
+                self.channel_endpoints = {}
+                for endpoint in self.endpoints:
+                    self.channel_endpoints.setdefault(str(endpoint["ChannelId"]), []).append(str(endpoint['Id']))
+                put_cached_discovery("mediapackage_endpoints", self.scope, self.channel_endpoints)
+            return [str(endpoint_id) for endpoint_id in self.channel_endpoints.get(str(channel_id), [])]
+
+
+def extract_mediapackage_channel_names(mp_inventory, mediapackage_url_list, ml_region):
+    """Using the MediaPackage inventory of the region "ml_region", find the MediaPackage Channel Id for the MediaPackage
     Channels defined in "mediapackage_url_list"."""
     mp_uids = []
-    mp_channel_names = []
     for mediapackage_url in mediapackage_url_list:
         if "mediapackage." + ml_region in mediapackage_url:
             if "/v1/" in mediapackage_url:
@@ -631,66 +1262,113 @@ def extract_mediapackage_channel_names(mp_client, mediapackage_url_list, ml_regi
                     emp_ch_id = url_parts[5]
                     if emp_ch_id not in mp_uids:
                         mp_uids.append(emp_ch_id)
-    if len(mp_uids) > 0:
-        response = mp_client.list_channels()
-        for channel in response["Channels"]:
-            channel_arn = channel["Arn"]
-            channel_uid = channel_arn.split("/")[-1]
-            if channel_uid in mp_uids:
-                mp_channel_names.append(channel["Id"])
-    return mp_channel_names
-
-
-def extract_mediapackage_endpoints(mp_client, mp_channel_id_list):
-    """Using the list_origin_endpoints query, find all the MediaPackage endpoints for the MediaPackage
-    channels defined in "mediapackage_channel_id_list" """
+    if len(mp_uids) == 0:
+        return []
+    # Return the Channel Ids in the order list-channels returned them
+    mp_channels = set(mp_inventory.find_channel_ids(mp_uids))
+    return [channel_id for position, channel_id in sorted(mp_channels)]
+
+
+def extract_mediapackage_endpoints(mp_inventory, mp_channel_id_list):
+    """Using the MediaPackage inventory, find all the MediaPackage endpoints for the MediaPackage channels defined in
+    "mediapackage_channel_id_list" """
     emp_endpoint_list = {}
     for channel in mp_channel_id_list:
-        emp_endpoint_list[str(channel)] = []
-    response = mp_client.list_origin_endpoints()
-    for endpoint in response['OriginEndpoints']:
-        if str(endpoint["ChannelId"]) in mp_channel_id_list:
-            emp_endpoint_list[str(endpoint["ChannelId"])].append(str(endpoint['Id']))
+        emp_endpoint_list[str(channel)] = mp_inventory.find_endpoint_ids(channel)
     return emp_endpoint_list
 
 
 # CloudWatch related functions
-def create_cloudwatch_client_instance():
-    """Create a CloudWatch Client Instance. """
+def create_cloudwatch_client_instance(cw_region, session=None):
+    """Create a CloudWatch Client Instance for the region specified in "cw_region", using the credentials of the boto3
+    session "session" or the default credentials."""
     try:
-        cloudwatch = boto3.client('cloudwatch')
+        cloudwatch = get_aws_client('cloudwatch', cw_region, session)
         return cloudwatch
     except Exception, e:
         print "Error: Creating a CloudWatch Client instance:\n '{0}'".format(e.message)
         exit(-1)
 
 
-def extract_cw_metrics_output_names(cw_client, ml_channel_id):
+# Minimum number of MediaLive Channels without cached OutputNames from which on the OutputVideoFrameRate metrics of all
+# MediaLive Channels of the region are listed at once, instead of 1 list_metrics sweep per channel
+cloudwatch_sweep_min_channels = 10
+# Only list the metrics that received data in the last 3 hours, which leaves out the Outputs of stopped channels
+cloudwatch_recently_active = False
+
+
+def iterate_cw_output_video_frame_rate_metrics(cw_client, ml_channel_id=None):
+    """Iterate over the OutputVideoFrameRate CloudWatch Metrics of the MediaLive Channel "ml_channel_id", or of all
+    MediaLive Channels of the region when None. Yields a dict with the ChannelId, OutputName and Pipeline of each, the
+    metrics without all 3 dimensions are skipped."""
+    channel_dimension = {'Name': 'ChannelId'}
+    if ml_channel_id is not None:
+        channel_dimension['Value'] = ml_channel_id
+    arguments = {'Dimensions': [channel_dimension, {'Name': 'OutputName'}, {'Name': 'Pipeline'}],
+                 'MetricName': 'OutputVideoFrameRate',
+                 'Namespace': 'MediaLive'}
+    if cloudwatch_recently_active:
+        arguments['RecentlyActive'] = 'PT3H'
+    paginator = cw_client.get_paginator('list_metrics')
+    for response in paginator.paginate(**arguments):
+        for metric in response["Metrics"]:
+            entry = {}
+            dimensions = metric["Dimensions"]
+            for dimension in dimensions:
+                if dimension["Name"] == "OutputName":
+                    entry["OutputName"] = dimension["Value"]
+                elif dimension["Name"] == "ChannelId":
+                    entry["ChannelId"] = dimension["Value"]
+                elif dimension["Name"] == "Pipeline":
+                    entry["Pipeline"] = dimension["Value"]
+            # The dimensions can be in any order, so the entry is only complete once all of them are read
+            if "ChannelId" in entry and "OutputName" in entry and "Pipeline" in entry:
+                yield entry
+
+
+class CloudWatchOutputIndex(object):
+    """Index of the OutputVideoFrameRate CloudWatch Metrics of the MediaLive Channels of a region, shared by all
+    MediaLive channels of a run. With "sweep", the metrics of all channels are listed once, on the first lookup, and
+    grouped by ChannelId. Otherwise the metrics are listed per channel.
+    Lookups are serialized so that the index can be shared by the discovery workers."""
+
+    def __init__(self, cw_client, sweep=False):
+        self.cw_client = cw_client
+        self.region = cw_client.meta.region_name
+        self.scope = get_aws_client_scope(cw_client)
+        self.sweep = sweep
+        self.channel_outputs = None
+        self.lock = threading.Lock()
+
+    def find_output_names(self, ml_channel_id):
+        """Return the OutputVideoFrameRate metric dimensions of the MediaLive Channel "ml_channel_id" """
+        if not self.sweep:
+            return list(iterate_cw_output_video_frame_rate_metrics(self.cw_client, ml_channel_id))
+        with self.lock:
+            if self.channel_outputs is None:
+                sys.stdout.write("Retrieving the Outputs of all MediaLive channels in region {0}\n".format(self.region))
+                channel_outputs = {}
+                for entry in iterate_cw_output_video_frame_rate_metrics(self.cw_client):
+                    channel_outputs.setdefault(entry["ChannelId"], []).append(entry)
+                self.channel_outputs = channel_outputs
+        return list(self.channel_outputs.get(ml_channel_id, []))
+
+
+def extract_cw_metrics_output_names(cw_output_index, ml_channel_id):
     """Retrieve a list of MediaLive OutputNames for all Outputs defined in the OutputVideoFrameRate CloudWatch Metric 
     of the MediaLive defined by the MediaLive Channel ID "ml_channel_id" """
-    output_name_list = []
+    cache_key = "{0}:{1}".format(cw_output_index.scope, ml_channel_id)
+    output_name_list = get_cached_discovery("output_names", cache_key)
+    if output_name_list is not None:
+        return output_name_list
     try:
-        paginator = cw_client.get_paginator('list_metrics')
-        for response in paginator.paginate(Dimensions=[{'Name': 'ChannelId', 'Value': ml_channel_id},
-                                                       {'Name': 'OutputName'},
-                                                       {'Name': 'Pipeline'}],
-                                           MetricName='OutputVideoFrameRate',
-                                           Namespace='MediaLive'):
-            if len(response["Metrics"]) > 0:
-                for metric in response["Metrics"]:
-                    entry = {}
-                    dimensions = metric["Dimensions"]
-                    for dimension in dimensions:
-                        if dimension["Name"] == "OutputName":
-                            entry["OutputName"] = dimension["Value"]
-                        elif dimension["Name"] == "ChannelId":
-                            entry["ChannelId"] = dimension["Value"]
-                        elif dimension["Name"] == "Pipeline":
-                            entry["Pipeline"] = dimension["Value"]
-                            output_name_list.append(entry)
+        output_name_list = cw_output_index.find_output_names(ml_channel_id)
+        # Outputs only show up once the channel was started, so keep looking for them while there are none
+        if len(output_name_list) > 0:
+            put_cached_discovery("output_names", cache_key, output_name_list)
         return output_name_list
     except Exception, e:
-        print "Error while retrieving CloudWatch OutputName information", e.message
+        print "Error while retrieving CloudWatch OutputName information", describe_aws_error(e)
 
 
 def create_cloudwatch_dashboard(cw_client, cw_dashboard_name, cw_dashboard_body):
@@ -698,17 +1376,146 @@ def create_cloudwatch_dashboard(cw_client, cw_dashboard_name, cw_dashboard_body)
     as defined in "cw_dashboard_body" """
     try:
         cw_dashboard_name = cw_dashboard_name.replace(" ", "-")
-        response = cw_client.put_dashboard(
-            DashboardName=cw_dashboard_name,
-            DashboardBody=cw_dashboard_body
-        )
+        with trace_span("put_dashboard", dashboard=cw_dashboard_name, bytes=len(cw_dashboard_body)):
+            response = cw_client.put_dashboard(
+                DashboardName=cw_dashboard_name,
+                DashboardBody=cw_dashboard_body
+            )
         result_code = response["ResponseMetadata"]["HTTPStatusCode"]
         if result_code == 200:
-            print "Successfully created Dashboard '{0}'".format(cw_dashboard_name)
+            sys.stdout.write("Successfully created Dashboard '{0}'\n".format(cw_dashboard_name))
         else:
-            print "HTTP Status Code:", result_code
+            sys.stdout.write("HTTP Status Code: {0}\n".format(result_code))
     except Exception, e:
-        print "Error while trying to create new CloudWatch Dashboard:\n", e.message
+        sys.stdout.write("Error while trying to create new CloudWatch Dashboard '{0}':\n{1}\n".format(
+            cw_dashboard_name, describe_aws_error(e)))
+        exit(-5)
+
+
+def normalize_dashboard_body(cw_dashboard_body):
+    """Parse the CloudWatch Dashboard definition "cw_dashboard_body" into a normalized form for comparisons: the
+    metric lines of every widget are written out in full, in their order, as the order of the metrics sets the order
+    of the legend and the colors of the lines."""
+    dashboard_json = json.loads(cw_dashboard_body, strict=False)
+    for widget in dashboard_json.get("widgets", []):
+        metrics = widget.get("properties", {}).get("metrics")
+        if metrics is not None:
+            widget["properties"]["metrics"] = expand_dashboard_metrics(metrics)
+    return dashboard_json
+
+
+def describe_widget(widget):
+    """Return a short description of the dashboard widget "widget" for the change report"""
+    properties = widget.get("properties", {})
+    if "title" in properties:
+        return "'{0}'".format(properties["title"])
+    if "markdown" in properties:
+        return "'{0}'".format(properties["markdown"].split("\n")[0])
+    return "at x={0}, y={1}".format(widget.get("x"), widget.get("y"))
+
+
+def diff_dashboard_bodies(current_json, new_json):
+    """Compare the normalized Dashboard definitions "current_json" and "new_json" widget by widget and return the list
+    of changes found. An empty list means both definitions are the same."""
+    changes = []
+    current_widgets = current_json.get("widgets", [])
+    new_widgets = new_json.get("widgets", [])
+    if len(current_widgets) != len(new_widgets):
+        changes.append("Number of widgets changes from {0} to {1}".format(len(current_widgets), len(new_widgets)))
+    for current_widget, new_widget in zip(current_widgets, new_widgets):
+        if json.dumps(current_widget, sort_keys=True) == json.dumps(new_widget, sort_keys=True):
+            continue
+        current_metric_list = [json.dumps(metric, sort_keys=True)
+                               for metric in current_widget.get("properties", {}).get("metrics", [])]
+        new_metric_list = [json.dumps(metric, sort_keys=True)
+                           for metric in new_widget.get("properties", {}).get("metrics", [])]
+        current_metrics = set(current_metric_list)
+        new_metrics = set(new_metric_list)
+        change = "Widget {0}:".format(describe_widget(new_widget))
+        if new_metrics != current_metrics:
+            change += " {0} metrics added, {1} metrics removed".format(len(new_metrics - current_metrics),
+                                                                        len(current_metrics - new_metrics))
+        elif new_metric_list != current_metric_list:
+            change += " metrics reordered"
+        else:
+            changed_keys = [key for key in sorted(set(current_widget) | set(new_widget))
+                            if current_widget.get(key) != new_widget.get(key)]
+            change += " changed {0}".format(", ".join(changed_keys))
+        changes.append(change)
+    return changes
+
+
+def update_cloudwatch_dashboard(cw_client, cw_dashboard_name, cw_dashboard_body):
+    """Use get_dashboard to compare the CloudWatch Dashboard named "cw_dashboard_name" with the definition
+    "cw_dashboard_body", report the changes per widget and only use put_dashboard when something changed or the
+    Dashboard doesn't exist yet."""
+    cw_dashboard_name = cw_dashboard_name.replace(" ", "-")
+    try:
+        with trace_span("get_dashboard", dashboard=cw_dashboard_name):
+            response = cw_client.get_dashboard(DashboardName=cw_dashboard_name)
+        current_json = normalize_dashboard_body(response["DashboardBody"])
+    except ClientError, e:
+        if e.response.get("Error", {}).get("Code") == "ResourceNotFound":
+            sys.stdout.write("Dashboard '{0}' doesn't exist yet\n".format(cw_dashboard_name))
+        else:
+            sys.stdout.write("Error while retrieving the current CloudWatch Dashboard '{0}':\n{1}\n".format(
+                cw_dashboard_name, describe_aws_error(e)))
+        create_cloudwatch_dashboard(cw_client, cw_dashboard_name, cw_dashboard_body)
+        return
+    changes = diff_dashboard_bodies(current_json, normalize_dashboard_body(cw_dashboard_body))
+    if len(changes) == 0:
+        sys.stdout.write("Dashboard '{0}' is up to date, skipping the update\n".format(cw_dashboard_name))
+        return
+    # Written at once, like the other messages of the Dashboard functions, to keep them whole while shards are
+    # published concurrently
+    sys.stdout.write("Dashboard '{0}' changes:\n".format(cw_dashboard_name) +
+                     "".join("  {0}\n".format(change) for change in changes))
+    create_cloudwatch_dashboard(cw_client, cw_dashboard_name, cw_dashboard_body)
+
+
+# Delete the Dashboards left over from earlier runs, instead of only warning about them
+dashboard_delete_stale = False
+
+
+def find_stale_dashboards(cw_client, cw_dashboard_name, cw_dashboard_names):
+    """Use list_dashboards to find the CloudWatch Dashboards left over from earlier runs of the Dashboard
+    "cw_dashboard_name": the Dashboard itself or its shards "<name>-1", "<name>-2", ... that aren't among the
+    Dashboards "cw_dashboard_names" of this run, e.g. the unsplit Dashboard once it is split in shards."""
+    cw_dashboard_name = cw_dashboard_name.replace(" ", "-")
+    current_names = set(name.replace(" ", "-") for name in cw_dashboard_names)
+    stale_name = re.compile("^{0}(-[0-9]+)?$".format(re.escape(cw_dashboard_name)))
+    stale_names = []
+    paginator = cw_client.get_paginator('list_dashboards')
+    for response in paginator.paginate(DashboardNamePrefix=cw_dashboard_name):
+        for entry in response["DashboardEntries"]:
+            if stale_name.match(entry["DashboardName"]) and entry["DashboardName"] not in current_names:
+                stale_names.append(str(entry["DashboardName"]))
+    return stale_names
+
+
+def remove_stale_dashboards(cw_client, cw_dashboard_name, cw_dashboard_names):
+    """Warn about the CloudWatch Dashboards left over from earlier runs of the Dashboard "cw_dashboard_name", which
+    was published as the Dashboards "cw_dashboard_names", or with "dashboard_delete_stale" delete them."""
+    try:
+        with trace_span("list_dashboards", dashboard=cw_dashboard_name):
+            stale_names = find_stale_dashboards(cw_client, cw_dashboard_name, cw_dashboard_names)
+    except Exception, e:
+        sys.stdout.write("Warning: Unable to look for Dashboards left over from earlier runs of '{0}':\n{1}\n".format(
+            cw_dashboard_name.replace(" ", "-"), describe_aws_error(e)))
+        return
+    if len(stale_names) == 0:
+        return
+    if not dashboard_delete_stale:
+        sys.stdout.write("Warning: Dashboards left over from earlier runs, which show outdated channels: {0}. Use "
+                         "'--delete-stale' to delete them.\n".format(", ".join(stale_names)))
+        return
+    try:
+        with trace_span("delete_dashboards", dashboards=len(stale_names)):
+            cw_client.delete_dashboards(DashboardNames=stale_names)
+        sys.stdout.write("Deleted the Dashboards left over from earlier runs: {0}\n".format(", ".join(stale_names)))
+    except Exception, e:
+        sys.stdout.write("Error while trying to delete the CloudWatch Dashboards {0}:\n{1}\n".format(
+            ", ".join(stale_names), describe_aws_error(e)))
         exit(-5)
 
 
@@ -897,21 +1704,188 @@ def update_console_links_markdown(region, ml_channel_name, ml_channel_id, mp_cha
     return result
 
 
-def process_all_medialive_channels(ml_channel_list, cw_dashboard_name):
-    """Given a list of all MediaLive Channel ARNs process them one at time and update the CloudWatch Dashboard 
-    template"""
-    global dashboard_template
-    eml_region = extract_medialive_region(ml_channel_list[0])
-    if eml_region is None:
-        print "Error: Unable to extract the Region from the MediaLive Channel ARN '{0}'.".format(ml_channel_list[0])
-        exit(-3)
-    eml_client = create_medialive_client_instance(eml_region)
-    cw_client = create_cloudwatch_client_instance()
-    emp_client = create_mediapackage_client_instance(eml_region)
+# SEARCH expression mode. Instead of 1 metric per MediaPackage Endpoint, the Egress widgets get SEARCH expressions
+# scoped to the MediaPackage Channels of the dashboard. They pick up new Endpoints without rediscovering them.
+# Maximum length of a CloudWatch metric math expression, SEARCH expressions included
+search_expression_max_length = 1024
+
+
+def search_egress_req_bytes_queries():
+    """Return the SEARCH queries, with their metric options, of the "Egress Request Bytes (sum)" dashboard widget"""
+    return [('{AWS/MediaPackage,Channel,OriginEndpoint} MetricName="EgressBytes"', {})]
+
+
+def search_egress_req_count_queries():
+    """Return the SEARCH queries, with their metric options, of the "Egress Request Count (sum)" dashboard widget"""
+    return [('{AWS/MediaPackage,Channel,OriginEndpoint} MetricName="EgressRequestCount"', {})]
+
+
+def search_status_code_range_2xx4xx_queries():
+    """Return the SEARCH queries, with their metric options, of the "Status Code Range (sum)" dashboard widget"""
+    return [('{AWS/MediaPackage,Channel,OriginEndpoint,StatusCodeRange} MetricName="EgressRequestCount" '
+             'StatusCodeRange="2xx"', {}),
+            ('{AWS/MediaPackage,Channel,OriginEndpoint,StatusCodeRange} MetricName="EgressRequestCount" '
+             'StatusCodeRange="4xx"', {"yAxis": "right"})]
+
+
+def search_status_code_range_3xx5xx_queries():
+    """Return the SEARCH queries, with their metric options, of the "Status Code Range (sum)" dashboard widget"""
+    return [('{AWS/MediaPackage,Channel,OriginEndpoint,StatusCodeRange} MetricName="EgressRequestCount" '
+             'StatusCodeRange="3xx"', {}),
+            ('{AWS/MediaPackage,Channel,OriginEndpoint,StatusCodeRange} MetricName="EgressRequestCount" '
+             'StatusCodeRange="5xx"', {"yAxis": "right"})]
 
-    dashboard_json = json.loads(dashboard_template, strict=False)
 
-    # Update the titles of the 2 sections within the dashboard
+def search_mediapackage_channel_terms(mp_channel_names):
+    """Return the search terms that scope a SEARCH query to the MediaPackage Channels "mp_channel_names" """
+    return ['Channel="{0}"'.format(mp_name) for mp_name in mp_channel_names]
+
+
+def build_search_expression(query, terms, stat, period):
+    """Return the SEARCH expression for the metrics matching "query" and any of the search "terms" """
+    return "SEARCH('{0} ({1})', '{2}', {3})".format(query, " OR ".join(terms), stat, period)
+
+
+def chunk_search_terms(chunks, queries, terms, stat, period):
+    """Return the search terms of "chunks" followed by "terms" split in chunks, so that the SEARCH expression of each
+    chunk stays within search_expression_max_length for all "queries". "chunks" itself isn't modified."""
+    chunks = [list(chunk) for chunk in chunks]
+    for term in terms:
+        if len(chunks) > 0 and max(len(build_search_expression(query, chunks[-1] + [term], stat, period))
+                                   for query, options in queries) <= search_expression_max_length:
+            chunks[-1].append(term)
+        else:
+            chunks.append([term])
+    return chunks
+
+
+def build_search_metrics(queries, chunks, stat, period, first_chunk=0, search_scope=()):
+    """Return the dashboard metrics with the SEARCH expressions of all "queries" for each chunk of search terms.
+    "chunks" starts at chunk number "first_chunk" of the widget, which keeps the expression IDs the same when only the
+    last chunks of a widget are built. "search_scope" holds the (option, value) pairs, like the region and the AWS
+    Account ID, of metrics outside the region and AWS Account of the widget."""
+    results = []
+    for query_index, (query, options) in enumerate(queries):
+        for chunk_index, chunk in enumerate(chunks):
+            entry = {"expression": build_search_expression(query, chunk, stat, period),
+                     "id": "search{0}_{1}".format(query_index + 1, first_chunk + chunk_index + 1)}
+            entry.update(options)
+            for option, value in search_scope:
+                entry["id"] += "_" + value.replace("-", "_")
+                entry[option] = value
+            results.append([entry])
+    return results
+
+
+# Dashboard widget builder registry
+# The builders of the dashboard widgets as (widget key, widget text, builder, SEARCH queries) tuples, in the order the
+# widgets of the dashboard template are matched against them. The widget text identifies a metric widget by its title
+# and a text widget by its markdown. The builder is called with a discovered MediaLive Channel and returns what the
+# channel adds to the widget: a list of metrics, or markdown. The optional SEARCH queries function replaces the builder
+# in the SEARCH expression mode.
+widget_builders = []
+
+
+def register_widget_builder(widget_key, widget_text, builder, search_queries=None):
+    """Register "builder" as the builder of the dashboard widget with the stable key "widget_key", for the widget of
+    the dashboard template whose title, or markdown, contains "widget_text". A builder registered earlier with the same
+    key is replaced, any other widget is added after the registered ones."""
+    widget_builder = (widget_key, widget_text, builder, search_queries)
+    for index, registered_builder in enumerate(widget_builders):
+        if registered_builder[0] == widget_key:
+            widget_builders[index] = widget_builder
+            return
+    widget_builders.append(widget_builder)
+
+
+def compile_widget_builders(dashboard_json):
+    """Match every widget of the dashboard template "dashboard_json" with its registered builder, once per template.
+    Returns a list with one entry per widget: the (builder, SEARCH queries) of the widget, with None as SEARCH queries
+    for a widget without SEARCH expression mode, or None for a widget without builder."""
+    compiled_builders = []
+    for widget in dashboard_json["widgets"]:
+        widget_text = None
+        if widget["type"] == "metric":
+            widget_text = widget["properties"]["title"]
+        elif widget["type"] == "text":
+            widget_text = widget["properties"]["markdown"]
+        compiled_builder = None
+        if widget_text is not None:
+            for widget_key, registered_text, builder, search_queries in widget_builders:
+                if registered_text in widget_text:
+                    compiled_builder = (builder, search_queries() if search_queries is not None else None)
+                    break
+        if compiled_builder is None and widget["type"] == "metric":
+            print "Unsupported metric '{0}' found in the dashboard template".format(widget_text)
+        compiled_builders.append(compiled_builder)
+    return compiled_builders
+
+
+register_widget_builder("ingress_bytes", "Ingress Bytes (sum)",
+                        lambda ml_channel: update_ingress_bytes_metric(ml_channel["mp_channel_names"]))
+register_widget_builder("ingress_response_times", "Ingress Response Times",
+                        lambda ml_channel: update_ingress_resp_times_metric(ml_channel["mp_channel_names"]))
+register_widget_builder("egress_request_bytes", "Egress Request Bytes (sum)",
+                        lambda ml_channel: update_egress_req_bytes_metric(ml_channel["mp_endpoint_names"]),
+                        search_egress_req_bytes_queries)
+register_widget_builder("egress_request_count", "Egress Request Count (sum)",
+                        lambda ml_channel: update_egress_req_count_metric(ml_channel["mp_endpoint_names"]),
+                        search_egress_req_count_queries)
+register_widget_builder("status_code_range_2xx_4xx", "Status Code Range (sum), 2xx,4xx",
+                        lambda ml_channel: update_status_code_range_2xx4xx_metric(ml_channel["mp_endpoint_names"]),
+                        search_status_code_range_2xx4xx_queries)
+register_widget_builder("status_code_range_3xx_5xx", "Status Code Range (sum), 3xx,5xx",
+                        lambda ml_channel: update_status_code_range_3xx5xx_metric(ml_channel["mp_endpoint_names"]),
+                        search_status_code_range_3xx5xx_queries)
+register_widget_builder("active_output_renditions", "Active Output Renditions (avg)",
+                        lambda ml_channel: update_active_output_renditions_metric(ml_channel["id"], ml_channel["name"],
+                                                                                  ml_channel["outputgroup_names"]))
+register_widget_builder("output_video_frame_rate", "Output Video Frame Rate (avg)",
+                        lambda ml_channel: update_output_frame_video_rate_metric(ml_channel["output_names"]))
+register_widget_builder("input_video_frame_rate", "Input Video Frame Rate (avg)",
+                        lambda ml_channel: update_input_video_frame_rate_metric(ml_channel["id"], ml_channel["name"]))
+register_widget_builder("network_in", "Network In (sum)",
+                        lambda ml_channel: update_network_in_metric(ml_channel["id"], ml_channel["name"]))
+register_widget_builder("dropped_frames", "Dropped Frames (sum)",
+                        lambda ml_channel: update_dropped_frames_metric(ml_channel["id"], ml_channel["name"]))
+register_widget_builder("network_out", "Network Out (sum)",
+                        lambda ml_channel: update_network_output_metric(ml_channel["id"], ml_channel["name"]))
+register_widget_builder("svq_time", "SVQ Time (percentage)",
+                        lambda ml_channel: update_svq_time_metric(ml_channel["id"], ml_channel["name"]))
+register_widget_builder("fill_milliseconds", "Fill Milliseconds (sum)",
+                        lambda ml_channel: update_fill_msec_metric(ml_channel["id"], ml_channel["name"]))
+register_widget_builder("console_links", "Console Links for all channels",
+                        lambda ml_channel: update_console_links_markdown(ml_channel["region"], ml_channel["name"],
+                                                                         ml_channel["id"],
+                                                                         ml_channel["mp_channel_names"]))
+
+
+# CloudWatch Dashboard rendering related functions
+# CloudWatch Dashboard quotas. A Dashboard that would exceed any of them is split in shards named "<name>-1",
+# "<name>-2", ... that each fit within them.
+dashboard_max_body_bytes = 1000000
+dashboard_max_metrics = 2500
+dashboard_max_metrics_per_widget = 500
+# Bytes reserved per widget for the properties that are only set once rendered, like the region and the title of the
+# Dashboard sections
+dashboard_widget_reserve_bytes = 64
+# Budget of the Dashboard body size in bytes, None for the CloudWatch Dashboard quota. The Dashboard is split in shards
+# that fit within it, and Dashboards still over budget, or over the metric quotas, are reported widget by widget
+# before anything is published. With "dashboard_over_budget_fail" nothing is published then.
+dashboard_body_budget = None
+dashboard_over_budget_fail = False
+# Write the metrics that start like the metric before them with the "..." shorthand of CloudWatch Dashboards
+dashboard_metric_shorthand = False
+
+
+def serialize_dashboard_body(dashboard_json):
+    """Serialize the Dashboard definition "dashboard_json" into a Dashboard body: JSON with sorted keys and without any
+    whitespace around its separators, so that the body only counts the bytes CloudWatch needs."""
+    return json.dumps(dashboard_json, separators=(",", ":"), sort_keys=True)
+
+
+def update_dashboard_section_titles(dashboard_json, cw_dashboard_name):
+    """Update the titles of the 2 sections within the dashboard "dashboard_json" with "cw_dashboard_name" """
     for widget in dashboard_json["widgets"]:
         if widget["type"] == "text":
             text_title = widget["properties"]["markdown"]
@@ -920,76 +1894,741 @@ def process_all_medialive_channels(ml_channel_list, cw_dashboard_name):
             if "MediaLive Section Title" in text_title:
                 widget["properties"]["markdown"] = "# {0}: Encoding".format(cw_dashboard_name)
 
+
+def set_metric_options(metrics, metric_options):
+    """Return the dashboard metrics "metrics" with the options of "metric_options" added to their own options"""
+    results = []
+    for metric in metrics:
+        if len(metric) > 0 and isinstance(metric[-1], dict):
+            options = dict(metric[-1])
+            options.update(metric_options)
+            results.append(metric[:-1] + [options])
+        else:
+            results.append(metric + [dict(metric_options)])
+    return results
+
+
+def split_dashboard_metric(metric):
+    """Split the dashboard metric "metric" into the list of its namespace, metric name and dimension items, and the
+    list of its options, which holds the options object if it has one"""
+    if len(metric) > 0 and isinstance(metric[-1], dict):
+        return metric[:-1], metric[-1:]
+    return metric, []
+
+
+def compress_dashboard_metrics(metrics, previous_metric=None):
+    """Return the dashboard metrics "metrics" written with the "..." shorthand of CloudWatch Dashboards: a metric with
+    as many items as the metric before it, that starts with the same items, only lists the items after the ones it
+    repeats, following "...". "previous_metric" is the metric before the first one, if any. Metric math and SEARCH
+    expressions are kept as they are."""
+    results = []
+    for metric in metrics:
+        items, options = split_dashboard_metric(metric)
+        compressed_metric = metric
+        if previous_metric is not None:
+            previous_items = split_dashboard_metric(previous_metric)[0]
+            if len(items) > 1 and len(items) == len(previous_items):
+                repeated = 0
+                while repeated < len(items) - 1 and items[repeated] == previous_items[repeated]:
+                    repeated += 1
+                if repeated > 0:
+                    compressed_metric = ["..."] + items[repeated:] + options
+        results.append(compressed_metric)
+        previous_metric = metric
+    return results
+
+
+def expand_dashboard_metrics(metrics):
+    """Return the dashboard metrics "metrics" with the "..." and "." shorthands of CloudWatch Dashboards written out"""
+    results = []
+    previous_items = []
+    for metric in metrics:
+        items, options = split_dashboard_metric(metric)
+        if len(items) > 0 and items[0] == "...":
+            items = previous_items[:len(previous_items) - len(items) + 1] + items[1:]
+        items = [previous_items[index] if item == "." and index < len(previous_items) else item
+                 for index, item in enumerate(items)]
+        results.append(items + options)
+        previous_items = items
+    return results
+
+
+def render_medialive_channel_widgets(compiled_builders, cw_region, ml_channel, search=False):
+    """Build what the discovered MediaLive Channel "ml_channel" adds to each widget, with the "compiled_builders" of
+    the dashboard template, for widgets in region "cw_region". Returns a list with one entry per widget: the metrics
+    for a metric widget, the markdown for a text widget, or None. With "search", the entry of a SEARCH expression widget
+    is a (SEARCH queries, search terms, search scope) tuple. Metrics of channels in another region, or in an AWS Account
+    of the account map, carry their region and AWS Account ID."""
+    metric_options = {}
+    if ml_channel["region"] != cw_region:
+        metric_options["region"] = ml_channel["region"]
+    if ml_channel["account_id"] is not None:
+        metric_options["accountId"] = ml_channel["account_id"]
+    widgets = []
+    for compiled_builder in compiled_builders:
+        if compiled_builder is None:
+            widgets.append(None)
+            continue
+        builder, search_queries = compiled_builder
+        if search and search_queries is not None:
+            widgets.append((search_queries, search_mediapackage_channel_terms(ml_channel["mp_channel_names"]),
+                            tuple(sorted(metric_options.items()))))
+            continue
+        addition = builder(ml_channel)
+        if isinstance(addition, list) and len(metric_options) > 0:
+            addition = set_metric_options(addition, metric_options)
+        widgets.append(addition)
+    return widgets
+
+
+def measure_dashboard_metric(metric):
+    """Return the number of bytes the dashboard metric "metric" adds to the Dashboard body, as serialized by
+    serialize_dashboard_body(), including the item separator that follows it."""
+    return len(serialize_dashboard_body(metric)) + 1
+
+
+class DashboardShard(object):
+    """One CloudWatch Dashboard rendered from the template. It keeps track of its body size and of its number of
+    metrics, in total and per widget, while channels are added to it. Its widgets are in region "cw_region"."""
+
+    def __init__(self, cw_region):
+        self.region = cw_region
+        self.dashboard_json = json.loads(dashboard_template, strict=False)
+        self.channel_count = 0
+        self.metric_count = 0
+        self.widget_metric_counts = [0] * len(self.dashboard_json["widgets"])
+        # The SEARCH queries and the search scopes of the SEARCH expression widgets, by widget index, and their
+        # chunks of search terms, by (widget index, search scope)
+        self.widget_search_queries = {}
+        self.widget_search_scopes = {}
+        self.widget_search_chunks = {}
+        self.body_bytes = len(serialize_dashboard_body(self.dashboard_json)) + \
+            dashboard_widget_reserve_bytes * len(self.dashboard_json["widgets"])
+
+    def measure(self, widget_additions):
+        """Return the number of metrics, by widget index, and the number of body bytes the widget additions of a
+        channel add to the Dashboard, together with the new chunks of search terms of the SEARCH expression widgets"""
+        widget_metric_counts = {}
+        body_bytes = 0
+        search_chunks = {}
+        for index, addition in enumerate(widget_additions):
+            if isinstance(addition, list):
+                widget_metric_counts[index] = len(addition)
+                if dashboard_metric_shorthand:
+                    metrics = self.dashboard_json["widgets"][index]["properties"]["metrics"]
+                    addition = compress_dashboard_metrics(addition, metrics[-1] if len(metrics) > 0 else None)
+                body_bytes += sum(measure_dashboard_metric(metric) for metric in addition)
+            elif isinstance(addition, tuple):
+                search_queries, search_terms, search_scope = addition
+                properties = self.dashboard_json["widgets"][index]["properties"]
+                stat, period = properties["stat"], properties["period"]
+                chunks = self.widget_search_chunks.get((index, search_scope), [])
+                new_chunks = chunk_search_terms(chunks, search_queries, search_terms, stat, period)
+                search_chunks[(index, search_scope)] = new_chunks
+                # Only the last chunk of search terms and the chunks after it change
+                first_chunk = max(len(chunks) - 1, 0)
+                old_metrics = build_search_metrics(search_queries, chunks[first_chunk:], stat, period, first_chunk,
+                                                   search_scope)
+                new_metrics = build_search_metrics(search_queries, new_chunks[first_chunk:], stat, period,
+                                                   first_chunk, search_scope)
+                widget_metric_counts[index] = len(new_metrics) - len(old_metrics)
+                body_bytes += sum(measure_dashboard_metric(metric) for metric in new_metrics) - \
+                    sum(measure_dashboard_metric(metric) for metric in old_metrics)
+            elif addition is not None:
+                body_bytes += len(json.dumps(addition)) - 2
+        return widget_metric_counts, body_bytes, search_chunks
+
+    def fits(self, widget_additions):
+        """Return True if the widget additions of a channel can be added within the Dashboard quotas"""
+        widget_metric_counts, body_bytes, search_chunks = self.measure(widget_additions)
+        for index, metric_count in widget_metric_counts.items():
+            if self.widget_metric_counts[index] + metric_count > dashboard_max_metrics_per_widget:
+                return False
+        if self.metric_count + sum(widget_metric_counts.values()) > dashboard_max_metrics:
+            return False
+        return self.body_bytes + body_bytes <= get_dashboard_body_budget()
+
+    def add(self, widget_additions):
+        """Add the widget additions of a channel to the Dashboard"""
+        widget_metric_counts, body_bytes, search_chunks = self.measure(widget_additions)
+        for index, addition in enumerate(widget_additions):
+            widget = self.dashboard_json["widgets"][index]
+            if isinstance(addition, list):
+                if len(addition) > 0:
+                    widget["properties"]["metrics"] += addition
+                    widget["properties"]["region"] = self.region
+            elif isinstance(addition, tuple):
+                search_queries, search_terms, search_scope = addition
+                self.widget_search_queries[index] = search_queries
+                search_scopes = self.widget_search_scopes.setdefault(index, [])
+                if search_scope not in search_scopes:
+                    search_scopes.append(search_scope)
+                self.widget_search_chunks[(index, search_scope)] = search_chunks[(index, search_scope)]
+                widget["properties"]["region"] = self.region
+            elif addition is not None:
+                widget["properties"]["markdown"] += addition
+        for index, metric_count in widget_metric_counts.items():
+            self.widget_metric_counts[index] += metric_count
+            self.metric_count += metric_count
+        self.body_bytes += body_bytes
+        self.channel_count += 1
+
+    def render(self, cw_dashboard_name):
+        """Return the Dashboard body of the shard named "cw_dashboard_name" """
+        update_dashboard_section_titles(self.dashboard_json, cw_dashboard_name)
+        for index, search_scopes in self.widget_search_scopes.items():
+            properties = self.dashboard_json["widgets"][index]["properties"]
+            properties["metrics"] = []
+            for search_scope in search_scopes:
+                properties["metrics"] += build_search_metrics(self.widget_search_queries[index],
+                                                              self.widget_search_chunks[(index, search_scope)],
+                                                              properties["stat"], properties["period"], 0,
+                                                              search_scope)
+        if dashboard_metric_shorthand:
+            for widget in self.dashboard_json["widgets"]:
+                if "metrics" in widget["properties"]:
+                    widget["properties"]["metrics"] = compress_dashboard_metrics(widget["properties"]["metrics"])
+        with trace_span("serialize_dashboard", dashboard=cw_dashboard_name, channels=self.channel_count):
+            return serialize_dashboard_body(self.dashboard_json)
+
+
+def render_medialive_dashboards(cw_region, ml_channels, cw_dashboard_name, search=False):
+    """Render the CloudWatch Dashboard for the discovered MediaLive Channels "ml_channels", one channel at a time, in
+    the order of the list. The widgets are in region "cw_region", the metrics of channels in other regions carry their
+    own region. When the Dashboard doesn't fit within the CloudWatch Dashboard quotas, the channels are
+    split over as many Dashboards as needed. With "search", the Egress widgets use SEARCH expressions. Returns a list
+    of (Dashboard name, Dashboard body) tuples."""
+    compiled_builders = compile_widget_builders(json.loads(dashboard_template, strict=False))
+    shards = [DashboardShard(cw_region)]
+    for ml_channel in ml_channels:
+        if ml_channel["name"] is None or ml_channel["mp_urls"] == []:
+            print "Error: Retrieving MediaLive Name and\or MediaPackage Destinations from the MediaLive Channel " \
+                  "'{0}' configuration.".format(ml_channel["id"])
+            exit(-3)
+        print "MediaLive Channel Name: ", ml_channel["name"]
+        if ml_channel["outputgroup_names"] is None or ml_channel["output_names"] is None:
+            print "Error: Retrieving the Output Groups and\or the Outputs of the MediaLive Channel '{0}'.".format(
+                ml_channel["id"])
+            exit(-3)
+        widget_additions = render_medialive_channel_widgets(compiled_builders, cw_region, ml_channel, search)
+        if shards[-1].channel_count > 0 and not shards[-1].fits(widget_additions):
+            shards.append(DashboardShard(cw_region))
+        shards[-1].add(widget_additions)
+
+    if len(shards) == 1:
+        return [(cw_dashboard_name, shards[0].render(cw_dashboard_name))]
+    print "The Dashboard exceeds the CloudWatch Dashboard quotas, splitting its {0} channels over {1} " \
+          "Dashboards".format(len(ml_channels), len(shards))
+    dashboards = []
+    for index, shard in enumerate(shards):
+        shard_name = "{0}-{1}".format(cw_dashboard_name, index + 1)
+        shard_body = shard.render(shard_name)
+        print "  {0}: {1} channels, {2} metrics, {3} bytes".format(shard_name, shard.channel_count,
+                                                                    shard.metric_count, len(shard_body))
+        dashboards.append((shard_name, shard_body))
+    return dashboards
+
+
+def get_dashboard_body_budget():
+    """Return the budget of the Dashboard body size in bytes, which is never over the CloudWatch Dashboard quota"""
+    if dashboard_body_budget is None:
+        return dashboard_max_body_bytes
+    return min(dashboard_body_budget, dashboard_max_body_bytes)
+
+
+def check_dashboard_budget(cw_dashboards, report=False):
+    """Check the Dashboard bodies of "cw_dashboards", a list of (Dashboard name, Dashboard body) tuples, against the body
+    budget and the metric quotas. The body bytes and metric count of every widget are printed for the Dashboards over
+    budget, or with "report" for all Dashboards. Returns False if any Dashboard is over budget."""
+    body_budget = get_dashboard_body_budget()
+    within_budget = True
+    for cw_dashboard_name, cw_dashboard_body in cw_dashboards:
+        widgets = json.loads(cw_dashboard_body, strict=False)["widgets"]
+        widget_sizes = [(describe_widget(widget), len(serialize_dashboard_body(widget)),
+                         len(widget["properties"].get("metrics", []))) for widget in widgets]
+        body_bytes = len(cw_dashboard_body)
+        metric_count = sum(widget_metric_count for widget, widget_bytes, widget_metric_count in widget_sizes)
+        over_budget = body_bytes > body_budget or metric_count > dashboard_max_metrics or \
+            max([widget_metric_count for widget, widget_bytes, widget_metric_count in widget_sizes] + [0]) > \
+            dashboard_max_metrics_per_widget
+        if over_budget:
+            print "Warning: Dashboard '{0}' is over budget: {1} bytes of {2}, {3} metrics of {4}, at most {5} " \
+                  "metrics per widget".format(cw_dashboard_name, body_bytes, body_budget, metric_count,
+                                              dashboard_max_metrics, dashboard_max_metrics_per_widget)
+            within_budget = False
+        elif report:
+            print "Dashboard '{0}': {1} bytes of {2}, {3} metrics of {4}".format(cw_dashboard_name, body_bytes,
+                                                                                body_budget, metric_count,
+                                                                                dashboard_max_metrics)
+        if over_budget or report:
+            for widget, widget_bytes, widget_metric_count in widget_sizes:
+                print "  {0:>8} bytes {1:>4} metrics  {2}".format(widget_bytes, widget_metric_count, widget)
+    return within_budget
+
+
+def publish_cloudwatch_dashboards(cw_client, cw_dashboards, update, workers):
+    """Create, or with "update" update, the CloudWatch Dashboards "cw_dashboards", a list of (Dashboard name,
+    Dashboard body) tuples, using up to "workers" concurrent requests."""
+    def publish(cw_dashboard):
+        cw_dashboard_name, cw_dashboard_body = cw_dashboard
+        if update:
+            update_cloudwatch_dashboard(cw_client, cw_dashboard_name, cw_dashboard_body)
+        else:
+            create_cloudwatch_dashboard(cw_client, cw_dashboard_name, cw_dashboard_body)
+
+    def publish_shard(cw_dashboard):
+        # The exit code of a failed Dashboard is returned, as exit() can't stop the script from a pool thread
+        try:
+            publish(cw_dashboard)
+        except SystemExit, e:
+            return e.code
+        return None
+
+    workers = min(workers, len(cw_dashboards))
+    if workers <= 1:
+        for cw_dashboard in cw_dashboards:
+            publish(cw_dashboard)
+        return
+    pool = ThreadPool(workers)
+    try:
+        exit_codes = pool.map_async(profiled(publish_shard), cw_dashboards).get(sys.maxint)
+    finally:
+        pool.terminate()
+    for exit_code in exit_codes:
+        if exit_code is not None:
+            exit(exit_code)
+
+
+# Inventory snapshot related functions
+# Format and version of the inventory snapshots written with '--export-inventory'. The version is raised when the
+# snapshot changes in a way older versions of the script can't read.
+inventory_format = "create_CW_dashboard-inventory"
+inventory_version = 1
+# What the dashboard widgets need to know about every discovered MediaLive Channel
+inventory_channel_keys = ("id", "name", "region", "account_id", "mp_urls", "outputgroup_names", "output_names",
+                          "mp_channel_names", "mp_endpoint_names")
+
+
+def export_medialive_inventory(inventory_file, ml_channels, mp_endpoints=True):
+    """Write the discovered MediaLive Channels "ml_channels" to the inventory snapshot "inventory_file", from which
+    the Dashboards can be rendered again without any AWS request. Without "mp_endpoints" the MediaPackage Endpoints
+    weren't discovered, so the snapshot can only be rendered with SEARCH expressions."""
+    inventory = {
+        "format": inventory_format,
+        "version": inventory_version,
+        "exported": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "mp_endpoints": mp_endpoints,
+        "channels": [dict((key, ml_channel.get(key)) for key in inventory_channel_keys) for ml_channel in ml_channels]
+    }
+    try:
+        with open(inventory_file, "wt") as out_file:
+            json.dump(inventory, out_file, separators=(",", ":"), sort_keys=True)
+        print "Exported the inventory of {0} MediaLive channels to '{1}'".format(len(ml_channels), inventory_file)
+    except Exception, e:
+        print "Error: Writing the inventory file '{0}'\n{1}".format(inventory_file, e)
+        exit(-1)
+
+
+def load_medialive_inventory(inventory_file):
+    """Load the inventory snapshot "inventory_file" written with '--export-inventory'. Returns the discovered
+    MediaLive Channels and whether their MediaPackage Endpoints were discovered, or None if the file isn't a valid
+    inventory snapshot."""
+    try:
+        with open(inventory_file, "rt") as in_file:
+            inventory = json.load(in_file)
+    except Exception, e:
+        print "Error: Processing the inventory file '{0}'\n{1}".format(inventory_file, e)
+        return None
+    if not isinstance(inventory, dict) or inventory.get("format") != inventory_format:
+        print "Error: The file '{0}' isn't an inventory exported with '--export-inventory'".format(inventory_file)
+        return None
+    if inventory.get("version") != inventory_version:
+        print "Error: The inventory '{0}' has version {1}, this version of the script reads version {2}".format(
+            inventory_file, inventory.get("version"), inventory_version)
+        return None
+    ml_channels = inventory.get("channels")
+    if not isinstance(ml_channels, list) or len(ml_channels) == 0 or \
+            any(not isinstance(ml_channel, dict) or not set(inventory_channel_keys) <= set(ml_channel)
+                for ml_channel in ml_channels):
+        print "Error: The inventory '{0}' has no channels, or channels with missing information".format(
+            inventory_file)
+        return None
+    return ml_channels, inventory.get("mp_endpoints", True)
+
+
+# Discovery related functions
+# Number of MediaLive channels discovered concurrently, unless overridden with '-w/--workers'
+default_discovery_workers = 8
+
+
+def discover_medialive_channel(ml_client, cw_output_index, mp_inventory, ml_region, ml_channel_id,
+                               mp_endpoints=True):
+    """Retrieve everything the dashboard widgets need to know about the MediaLive Channel "ml_channel_id" from
+    MediaLive, CloudWatch and MediaPackage. Returns a dict with the discovered information. Without "mp_endpoints" the
+    MediaPackage Endpoints aren't discovered, as the SEARCH expression widgets find them by themselves."""
+    # A single write keeps the line whole while other discovery workers print as well
+    sys.stdout.write("Retrieving information from MediaLive channel {0}\n".format(ml_channel_id))
+    channel = {"id": ml_channel_id, "region": ml_region}
+    with trace_span("discover_channel", channel=ml_channel_id, region=ml_region):
+        with trace_span("describe_channel", channel=ml_channel_id):
+            channel["name"], channel["mp_urls"] = extract_medialive_channel_info(ml_client, ml_channel_id)
+            if channel["name"] is None or channel["mp_urls"] == []:
+                return channel
+            channel["outputgroup_names"] = extract_medialive_outputgroup_names(ml_client, ml_channel_id)
+        with trace_span("discover_output_names", channel=ml_channel_id):
+            channel["output_names"] = extract_cw_metrics_output_names(cw_output_index, ml_channel_id)
+        with trace_span("resolve_mediapackage", channel=ml_channel_id):
+            channel["mp_channel_names"] = extract_mediapackage_channel_names(mp_inventory, channel["mp_urls"],
+                                                                             ml_region)
+            channel["mp_endpoint_names"] = None
+            if mp_endpoints:
+                channel["mp_endpoint_names"] = extract_mediapackage_endpoints(mp_inventory,
+                                                                              channel["mp_channel_names"])
+    return channel
+
+
+def discover_all_medialive_channels(ml_client, cw_output_index, mp_inventory, ml_region, ml_channel_ids, workers,
+                                    mp_endpoints=True):
+    """Discover the MediaLive Channels "ml_channel_ids" using up to "workers" concurrent discovery workers. The
+    discovered channels are returned in the order of "ml_channel_ids", independent of the order they completed in."""
+    def discover(ml_channel_id):
+        return discover_medialive_channel(ml_client, cw_output_index, mp_inventory, ml_region, ml_channel_id,
+                                          mp_endpoints)
+
+    workers = min(workers, len(ml_channel_ids))
+    if workers <= 1:
+        return [discover(ml_channel_id) for ml_channel_id in ml_channel_ids]
+    pool = ThreadPool(workers)
+    try:
+        # map_async().get() with a timeout keeps the discovery interruptible with Ctrl-C
+        return pool.map_async(profiled(discover), ml_channel_ids).get(sys.maxint)
+    finally:
+        pool.terminate()
+
+
+def discover_all_medialive_groups(group_discovery, ml_group_channel_ids, workers, mp_endpoints=True):
+    """Discover the MediaLive Channels of "ml_group_channel_ids", a list of ((AWS Account ID, region), MediaLive Channel
+    IDs) tuples, with all AWS Accounts and regions in parallel and up to "workers" concurrent discovery workers each.
+    The AWS Account ID is None for the default credentials. "group_discovery" holds the (MediaLive client, CloudWatch
+    Output index, MediaPackage inventory) of each (AWS Account ID, region). Returns the discovered channels by
+    ((AWS Account ID, region), MediaLive Channel ID)."""
+    def discover_group(group_channel_ids):
+        (ml_account_id, ml_region), ml_channel_ids = group_channel_ids
+        ml_client, cw_output_index, mp_inventory = group_discovery[(ml_account_id, ml_region)]
+        ml_channels = discover_all_medialive_channels(ml_client, cw_output_index, mp_inventory, ml_region,
+                                                      ml_channel_ids, workers, mp_endpoints)
+        for ml_channel in ml_channels:
+            ml_channel["account_id"] = ml_account_id
+        return ml_channels
+
+    if len(ml_group_channel_ids) == 1:
+        group_channels = [discover_group(ml_group_channel_ids[0])]
+    else:
+        pool = ThreadPool(len(ml_group_channel_ids))
+        try:
+            group_channels = pool.map_async(profiled(discover_group), ml_group_channel_ids).get(sys.maxint)
+        finally:
+            pool.terminate()
+    channels = {}
+    for ml_channels in group_channels:
+        for ml_channel in ml_channels:
+            channels[((ml_channel["account_id"], ml_channel["region"]), ml_channel["id"])] = ml_channel
+    return channels
+
+
+def limit_requests_in_flight(clients, max_requests):
+    """Allow at most "max_requests" HTTP requests of "clients" to be in flight at the same time, independent of the
+    number of discovery workers. Each request attempt, including retries, holds one of the request slots."""
+    request_slots = threading.BoundedSemaphore(max_requests)
+
+    def acquire_request_slot(**kwargs):
+        request_slots.acquire()
+
+    def release_request_slot(**kwargs):
+        request_slots.release()
+
+    for client in clients:
+        client.meta.events.register('before-send', acquire_request_slot)
+        client.meta.events.register('response-received', release_request_slot)
+
+
+# With '--output-dir' the Dashboard bodies are written to files named after the Dashboard and the hash of the body,
+# listed in a manifest. '--publish-dir' publishes the Dashboards whose hash differs from the published manifest, the
+# copy of the manifest written after the last publish.
+dashboard_manifest_format = "create_CW_dashboard-manifest"
+dashboard_manifest_version = 1
+dashboard_manifest_file = "manifest.json"
+dashboard_published_file = "published.json"
+# Number of characters of the SHA-256 hash of the body in the Dashboard file names
+dashboard_file_hash_length = 12
+
+
+def hash_dashboard_body(cw_dashboard_body):
+    """Return the SHA-256 hash of the Dashboard body "cw_dashboard_body" as a hex string"""
+    return hashlib.sha256(cw_dashboard_body).hexdigest()
+
+
+def load_dashboard_manifest(manifest_file):
+    """Load the Dashboard manifest "manifest_file". Returns an empty manifest if the file doesn't exist, or None if
+    the file isn't a valid Dashboard manifest."""
+    if not os.path.isfile(manifest_file):
+        return {"format": dashboard_manifest_format, "version": dashboard_manifest_version, "region": None,
+                "dashboards": {}}
+    try:
+        with open(manifest_file, "rt") as in_file:
+            manifest = json.load(in_file)
+    except Exception, e:
+        print "Error: Processing the Dashboard manifest '{0}'\n{1}".format(manifest_file, e)
+        return None
+    if not isinstance(manifest, dict) or manifest.get("format") != dashboard_manifest_format or \
+            manifest.get("version") != dashboard_manifest_version or not isinstance(manifest.get("dashboards"), dict):
+        print "Error: The file '{0}' isn't a Dashboard manifest of version {1}".format(manifest_file,
+                                                                                     dashboard_manifest_version)
+        return None
+    return manifest
+
+
+def write_dashboard_manifest(manifest_file, manifest):
+    """Write the Dashboard manifest "manifest" to "manifest_file", indented and with sorted keys so that it diffs
+    well"""
+    with open(manifest_file, "wt") as out_file:
+        json.dump(manifest, out_file, indent=4, separators=(",", ": "), sort_keys=True)
+        out_file.write("\n")
+
+
+def write_dashboard_files(output_dir, cw_region, cw_dashboards):
+    """Write the Dashboard bodies of "cw_dashboards", a list of (Dashboard name, Dashboard body) tuples, to
+    "output_dir", one file per Dashboard named after the Dashboard and the hash of its body, and list them in the
+    manifest with the region "cw_region" of the Dashboards. The files of the previous manifest that are no longer
+    listed are removed."""
+    manifest_file = os.path.join(output_dir, dashboard_manifest_file)
+    try:
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+        previous_manifest = load_dashboard_manifest(manifest_file)
+        if previous_manifest is None:
+            exit(-1)
+        manifest = {"format": dashboard_manifest_format, "version": dashboard_manifest_version, "region": cw_region,
+                    "dashboards": {}}
+        for cw_dashboard_name, cw_dashboard_body in cw_dashboards:
+            cw_dashboard_name = cw_dashboard_name.replace(" ", "-")
+            body_hash = hash_dashboard_body(cw_dashboard_body)
+            dashboard_file = "{0}.{1}.json".format(cw_dashboard_name, body_hash[:dashboard_file_hash_length])
+            with open(os.path.join(output_dir, dashboard_file), "wb") as out_file:
+                out_file.write(cw_dashboard_body)
+            manifest["dashboards"][cw_dashboard_name] = {"file": dashboard_file, "sha256": body_hash,
+                                                         "bytes": len(cw_dashboard_body)}
+            previous_file = previous_manifest["dashboards"].get(cw_dashboard_name, {}).get("file")
+            sys.stdout.write("Dashboard '{0}' {1}: {2}\n".format(
+                cw_dashboard_name, "unchanged" if previous_file == dashboard_file else "written", dashboard_file))
+        write_dashboard_manifest(manifest_file, manifest)
+        current_files = set(entry["file"] for entry in manifest["dashboards"].values())
+        for entry in previous_manifest["dashboards"].values():
+            previous_file = os.path.join(output_dir, os.path.basename(entry.get("file", "")))
+            if entry.get("file") not in current_files and os.path.isfile(previous_file):
+                os.remove(previous_file)
+    except (IOError, OSError), e:
+        print "Error: Writing the Dashboard files to '{0}'\n{1}".format(output_dir, e)
+        exit(-1)
+    print "Wrote {0} Dashboards and the manifest '{1}'".format(len(cw_dashboards), manifest_file)
+
+
+def publish_dashboard_files(output_dir, workers=default_discovery_workers, update=False, dry_run=False):
+    """Publish the Dashboards of the manifest in "output_dir" whose body hash differs from the published manifest,
+    using up to "workers" concurrent requests. With "update" the changed Dashboards are compared with the existing
+    ones first. With "dry_run" the changed Dashboards are only listed. Dashboards that are no longer in the manifest
+    aren't deleted."""
+    manifest = load_dashboard_manifest(os.path.join(output_dir, dashboard_manifest_file))
+    published_file = os.path.join(output_dir, dashboard_published_file)
+    published_manifest = load_dashboard_manifest(published_file)
+    if manifest is None or published_manifest is None:
+        exit(-1)
+    if len(manifest["dashboards"]) == 0:
+        print "Error: No Dashboards to publish in '{0}', write them with '--output-dir' first".format(output_dir)
+        exit(-1)
+    published_dashboards = published_manifest["dashboards"] if published_manifest["region"] == manifest["region"] \
+        else {}
+    cw_dashboards = []
+    for cw_dashboard_name, entry in sorted(manifest["dashboards"].items()):
+        if published_dashboards.get(cw_dashboard_name, {}).get("sha256") == entry["sha256"]:
+            continue
+        try:
+            with open(os.path.join(output_dir, os.path.basename(entry["file"])), "rb") as in_file:
+                cw_dashboard_body = in_file.read()
+        except IOError, e:
+            print "Error: Reading the Dashboard file of '{0}'\n{1}".format(cw_dashboard_name, e)
+            exit(-1)
+        if hash_dashboard_body(cw_dashboard_body) != entry["sha256"]:
+            print "Error: The file '{0}' doesn't match the hash of the manifest, write the Dashboards again with " \
+                  "'--output-dir'".format(entry["file"])
+            exit(-1)
+        cw_dashboards.append((cw_dashboard_name, cw_dashboard_body))
+    print "\n{0} of {1} Dashboards changed since the last publish".format(len(cw_dashboards),
+                                                                          len(manifest["dashboards"]))
+    if dry_run:
+        for cw_dashboard_name, cw_dashboard_body in cw_dashboards:
+            print "Dry run: not publishing Dashboard '{0}', {1} bytes".format(cw_dashboard_name,
+                                                                              len(cw_dashboard_body))
+        return
+    if len(cw_dashboards) > 0:
+        cw_client = create_cloudwatch_client_instance(manifest["region"])
+        with trace_span("publish_dashboards", dashboards=len(cw_dashboards)):
+            publish_cloudwatch_dashboards(cw_client, cw_dashboards, update, workers)
+    try:
+        write_dashboard_manifest(published_file, manifest)
+    except (IOError, OSError), e:
+        print "Error: Writing the published manifest '{0}'\n{1}".format(published_file, e)
+        exit(-1)
+
+
+def publish_medialive_dashboards(cw_region, ml_channels, cw_dashboard_name, workers=default_discovery_workers,
+                                 update=False, search=False, report=False, dry_run=False, output_dir=None):
+    """Render the CloudWatch Dashboards of the discovered MediaLive Channels "ml_channels", with their widgets in
+    region "cw_region", check them against the body budget and publish them, using up to "workers" concurrent
+    requests. With "dry_run" the Dashboards are rendered and checked, but not published. With "output_dir" they are
+    written to files in that folder instead of being published. The Dashboards of the same name left over from
+    earlier runs, split in another number of shards, are reported, or deleted with "dashboard_delete_stale"."""
+    with trace_span("render_dashboards", channels=len(ml_channels)):
+        cw_dashboards = render_medialive_dashboards(cw_region, ml_channels, cw_dashboard_name, search)
+    with trace_span("check_dashboard_budget", dashboards=len(cw_dashboards)):
+        within_budget = check_dashboard_budget(cw_dashboards, report)
+    if not within_budget and dashboard_over_budget_fail:
+        print "Error: Not publishing any Dashboard, since a Dashboard is over budget"
+        exit(-6)
+    if output_dir is not None:
+        with trace_span("write_dashboard_files", dashboards=len(cw_dashboards)):
+            write_dashboard_files(output_dir, cw_region, cw_dashboards)
+        return
+    if dry_run:
+        for cw_dashboard_name, cw_dashboard_body in cw_dashboards:
+            print "Dry run: not publishing Dashboard '{0}', {1} bytes".format(cw_dashboard_name.replace(" ", "-"),
+                                                                              len(cw_dashboard_body))
+        return
+    cw_client = create_cloudwatch_client_instance(cw_region)
+    with trace_span("publish_dashboards", dashboards=len(cw_dashboards)):
+        publish_cloudwatch_dashboards(cw_client, cw_dashboards, update, workers)
+    remove_stale_dashboards(cw_client, cw_dashboard_name, [name for name, body in cw_dashboards])
+
+
+def process_medialive_inventory(inventory_file, cw_dashboard_name, workers=default_discovery_workers, update=False,
+                                search=False, report=False, dry_run=False, output_dir=None):
+    """Render, check and publish the CloudWatch Dashboards of the MediaLive Channels of the inventory snapshot
+    "inventory_file" instead of discovering them. The Dashboard is in the region of the first Channel. With
+    "dry_run" or "output_dir" not a single AWS request is made."""
+    with trace_span("load_inventory", file=inventory_file):
+        inventory = load_medialive_inventory(inventory_file)
+    if inventory is None:
+        exit(-1)
+    ml_channels, mp_endpoints = inventory
+    if not search and not mp_endpoints:
+        print "Error: The inventory '{0}' has no MediaPackage Endpoints, as it was exported with '-s/--search'. " \
+              "Render it with '-s/--search' as well.".format(inventory_file)
+        exit(-1)
+    print "\nLoaded {0} MediaLive channels from the inventory {1}".format(len(ml_channels), inventory_file)
+    publish_medialive_dashboards(ml_channels[0]["region"], ml_channels, cw_dashboard_name, workers, update, search,
+                                 report, dry_run, output_dir)
+
+
+def process_all_medialive_channels(ml_channel_list, cw_dashboard_name, workers=default_discovery_workers,
+                                   max_requests=None, update=False, search=False, report=False, inventory_file=None,
+                                   dry_run=False, output_dir=None):
+    """Given a list of all MediaLive Channel ARNs discover them concurrently and update the CloudWatch Dashboard
+    template one channel at a time, in the order of the list. The Channels of each AWS Account and region are
+    discovered in parallel with their own clients, using the Role of the account map for the AWS Account if any. The
+    Dashboard is created in the region of the first Channel with the default credentials. When "max_requests" is set,
+    no more than that many AWS requests are in flight at the same time, whatever the number of workers. With "update",
+    the Dashboard is only written when it differs from the existing one. A Dashboard exceeding the CloudWatch Dashboard
+    quotas is split in shards, which are published concurrently. With "search", the Egress widgets use SEARCH
+    expressions instead of 1 metric per MediaPackage Endpoint and the Endpoints aren't discovered. The Dashboards are
+    checked against the body budget before they are published, with "report" their size is printed widget by
+    widget. With "inventory_file" the discovered channels are exported to that inventory snapshot, and with
+    "dry_run" the Dashboards aren't published, and with "output_dir" they are written to files in that folder
+    instead."""
+    # The MediaLive Channels are grouped by AWS Account and region, in the order the groups first appear in the list.
+    # The AWS Accounts outside the account map all use the default credentials, so they share 1 group per region.
+    eml_channel_keys = []
+    eml_groups = []
+    eml_group_channel_ids = {}
+    eml_group_account_ids = {}
     for ml_channel_arn in ml_channel_list:
-        print "Retrieving information from MediaLive channel", ml_channel_arn
+        eml_region = extract_medialive_region(ml_channel_arn)
+        if eml_region is None:
+            print "Error: Unable to extract the Region from the MediaLive Channel ARN '{0}'.".format(ml_channel_arn)
+            exit(-3)
         eml_channel_id = extract_medialive_channel_id(ml_channel_arn)
         if eml_channel_id is None:
-            print "Error: Verify the MediaLive Channel ARN"
+            print "Error: Verify the MediaLive Channel ARN '{0}'".format(ml_channel_arn)
             exit(-4)
-        eml_channel_name, emp_channel_arn_list = extract_medialive_channel_info(eml_client, eml_channel_id)
-        if eml_channel_name is None or emp_channel_arn_list == []:
-            print "Error: Retrieving MediaLive Name and\or MediaPackage Destinations from the MediaLive Channel " \
-                  "configuration."
-            exit(-3)
-        print "MediaLive Channel Name: ", eml_channel_name
-        eml_outputgroup_names = extract_medialive_outputgroup_names(eml_client, eml_channel_id)
-        eml_output_names = extract_cw_metrics_output_names(cw_client, eml_channel_id)
-
-        print "Retrieving information from the MediaPackage channels"
-        emp_channel_names = extract_mediapackage_channel_names(emp_client, emp_channel_arn_list, eml_region)
-        emp_endpoint_names = extract_mediapackage_endpoints(emp_client, emp_channel_names)
-
-        for widget in dashboard_json["widgets"]:
-            if widget["type"] == "metric":
-                metrics = []
-                metric_title = widget["properties"]["title"]
-                if "Ingress Bytes (sum)" in metric_title:
-                    metrics += update_ingress_bytes_metric(emp_channel_names)
-                elif "Ingress Response Times" in metric_title:
-                    metrics += update_ingress_resp_times_metric(emp_channel_names)
-                elif "Egress Request Bytes (sum)" in metric_title:
-                    metrics += update_egress_req_bytes_metric(emp_endpoint_names)
-                elif "Egress Request Count (sum)" in metric_title:
-                    metrics += update_egress_req_count_metric(emp_endpoint_names)
-                elif "Status Code Range (sum), 2xx,4xx" in metric_title:
-                    metrics += update_status_code_range_2xx4xx_metric(emp_endpoint_names)
-                elif "Status Code Range (sum), 3xx,5xx" in metric_title:
-                    metrics += update_status_code_range_3xx5xx_metric(emp_endpoint_names)
-                elif "Active Output Renditions (avg)" in metric_title:
-                    metrics += update_active_output_renditions_metric(eml_channel_id, eml_channel_name,
-                                                                      eml_outputgroup_names)
-                elif "Output Video Frame Rate (avg)" in metric_title:
-                    metrics += update_output_frame_video_rate_metric(eml_output_names)
-                elif "Input Video Frame Rate (avg)" in metric_title:
-                    metrics += update_input_video_frame_rate_metric(eml_channel_id, eml_channel_name)
-                elif "Network In (sum)" in metric_title:
-                    metrics += update_network_in_metric(eml_channel_id, eml_channel_name)
-                elif "Dropped Frames (sum)" in metric_title:
-                    metrics += update_dropped_frames_metric(eml_channel_id, eml_channel_name)
-                elif "Network Out (sum)" in metric_title:
-                    metrics += update_network_output_metric(eml_channel_id, eml_channel_name)
-                elif "SVQ Time (percentage)" in metric_title:
-                    metrics += update_svq_time_metric(eml_channel_id, eml_channel_name)
-                elif "Fill Milliseconds (sum)" in metric_title:
-                    metrics += update_fill_msec_metric(eml_channel_id, eml_channel_name)
-                else:
-                    print "Unsupported metric '{0}' found in the dashboard template".format(metric_title)
-                if len(metrics) > 0:
-                    widget["properties"]["metrics"] += metrics
-                    widget["properties"]["region"] = eml_region
-            if widget["type"] == "text":
-                markdown = widget["properties"]["markdown"]
-                if "Console Links for all channels" in markdown:
-                    tmp = update_console_links_markdown(eml_region, eml_channel_name, eml_channel_id, emp_channel_names)
-                    widget["properties"]["markdown"] = markdown + tmp
-
-    dashboard_template = json.dumps(dashboard_json, indent=4, sort_keys=True)
-    create_cloudwatch_dashboard(cw_client, cw_dashboard_name, dashboard_template)
+        eml_account_id = extract_medialive_account_id(ml_channel_arn)
+        eml_group = (eml_account_id if eml_account_id in aws_account_roles else None, eml_region)
+        eml_channel_keys.append((eml_group, eml_channel_id))
+        if eml_group not in eml_group_channel_ids:
+            eml_groups.append(eml_group)
+            eml_group_channel_ids[eml_group] = []
+            eml_group_account_ids[eml_group] = eml_account_id
+        eml_group_channel_ids[eml_group].append(eml_channel_id)
+    # The Dashboard and its widgets are in the region of the first MediaLive Channel
+    cw_region = eml_groups[0][1]
+
+    group_discovery = {}
+    clients = []
+    for eml_account_id, eml_region in eml_groups:
+        try:
+            session = get_aws_account_session(eml_account_id)
+        except Exception, e:
+            print "Error: Assuming the Role '{0}' of AWS Account '{1}':\n{2}".format(
+                aws_account_roles[eml_account_id], eml_account_id, describe_aws_error(e))
+            exit(-1)
+        eml_client = create_medialive_client_instance(eml_region, session)
+        cw_client = create_cloudwatch_client_instance(eml_region, session)
+        emp_client = create_mediapackage_client_instance(eml_region, session)
+        clients += [eml_client, cw_client, emp_client]
+        # The default credentials can only see the channels of their own AWS Account, which is the one in the ARNs
+        if eml_account_id is None:
+            for client in (eml_client, cw_client, emp_client):
+                aws_client_accounts.setdefault(client, eml_group_account_ids[(eml_account_id, eml_region)])
+        # Channels with cached Outputs don't need any list_metrics request
+        cw_scope = get_aws_client_scope(cw_client)
+        uncached_output_count = len([eml_channel_id for eml_channel_id
+                                     in eml_group_channel_ids[(eml_account_id, eml_region)]
+                                     if get_cached_discovery("output_names",
+                                                             "{0}:{1}".format(cw_scope, eml_channel_id)) is None])
+        group_discovery[(eml_account_id, eml_region)] = (
+            eml_client,
+            CloudWatchOutputIndex(cw_client, uncached_output_count >= cloudwatch_sweep_min_channels),
+            MediaPackageInventory(emp_client))
+    if max_requests is not None:
+        limit_requests_in_flight(clients, max_requests)
+
+    with trace_span("discover_channels", channels=len(eml_channel_keys), workers=workers):
+        eml_channels = discover_all_medialive_groups(group_discovery,
+                                                     [(eml_group, eml_group_channel_ids[eml_group])
+                                                      for eml_group in eml_groups], workers, not search)
+    eml_channels = [eml_channels[eml_channel_key] for eml_channel_key in eml_channel_keys]
+    if inventory_file is not None:
+        export_medialive_inventory(inventory_file, eml_channels, not search)
+
+    publish_medialive_dashboards(cw_region, eml_channels, cw_dashboard_name, workers, update, search, report, dry_run,
+                                 output_dir)
 
 
 def main(argv=None):
+    global aws_max_pool_connections
+    global discovery_cache
+    global cloudwatch_recently_active
+    global aws_account_roles
+    global dashboard_body_budget
+    global dashboard_over_budget_fail
+    global dashboard_metric_shorthand
+    global dashboard_delete_stale
+    global aws_endpoint_url
     try:
-        opts, args = getopt.getopt(sys.argv[1:], 'ha:n:l:', ['help', 'arn=', 'name=', 'list='])
+        opts, args = getopt.getopt(sys.argv[1:], 'ha:n:l:w:m:p:c:rusb:',
+                                   ['help', 'arn=', 'name=', 'list=', 'workers=', 'max-requests=', 'pool-size=',
+                                    'cache=', 'refresh', 'no-cache', 'update', 'search', 'recently-active',
+                                    'accounts=', 'budget=', 'fail-over-budget', 'report', 'shorthand',
+                                    'endpoint-url=', 'trace=', 'profile=', 'export-inventory=', 'from-inventory=',
+                                    'dry-run', 'output-dir=', 'publish-dir=', 'delete-stale'])
     except getopt.GetoptError, err:
         print str(err)
         usage(sys.argv[0])
@@ -1007,6 +2646,20 @@ def main(argv=None):
     dashboard_name = None
     eml_list_filename = None
     eml_channel_arn_list = []
+    discovery_workers = default_discovery_workers
+    max_requests = None
+    discovery_cache_file = default_discovery_cache_file
+    discovery_cache_refresh = False
+    update_dashboard = False
+    search_expressions = False
+    size_report = False
+    trace_file = None
+    profile_file = None
+    inventory_export_file = None
+    inventory_input_file = None
+    dry_run = False
+    output_dir = None
+    publish_dir = None
     for opt, arg in opts:
         if opt in ("-h", "--help"):
             usage(sys.argv[0])
@@ -1023,13 +2676,96 @@ def main(argv=None):
             if not os.path.isfile(eml_list_filename):
                 print "Error: File '{0}' doesn't exists or is not in the folder provided.".format(eml_list_filename)
                 eml_list_filename = None
+        elif opt in ("-w", "--workers"):
+            if not arg.isdigit() or int(arg) < 1:
+                print "Error: The number of workers must be a positive integer, not '{0}'".format(arg)
+                print_mini_help(sys.argv[0])
+                exit(-1)
+            discovery_workers = int(arg)
+        elif opt in ("-m", "--max-requests"):
+            if not arg.isdigit() or int(arg) < 1:
+                print "Error: The maximum number of requests must be a positive integer, not '{0}'".format(arg)
+                print_mini_help(sys.argv[0])
+                exit(-1)
+            max_requests = int(arg)
+        elif opt in ("-p", "--pool-size"):
+            if not arg.isdigit() or int(arg) < 1:
+                print "Error: The connection pool size must be a positive integer, not '{0}'".format(arg)
+                print_mini_help(sys.argv[0])
+                exit(-1)
+            aws_max_pool_connections = int(arg)
+        elif opt in ("-c", "--cache"):
+            discovery_cache_file = arg
+        elif opt in ("-r", "--refresh"):
+            discovery_cache_refresh = True
+        elif opt == "--no-cache":
+            discovery_cache_file = None
+        elif opt in ("-u", "--update"):
+            update_dashboard = True
+        elif opt in ("-s", "--search"):
+            search_expressions = True
+        elif opt == "--recently-active":
+            cloudwatch_recently_active = True
+        elif opt == "--accounts":
+            aws_account_roles = load_aws_account_roles(arg)
+            if aws_account_roles is None:
+                print_mini_help(sys.argv[0])
+                exit(-1)
+        elif opt in ("-b", "--budget"):
+            if not arg.isdigit() or int(arg) < 1:
+                print "Error: The Dashboard body budget must be a positive number of bytes, not '{0}'".format(arg)
+                print_mini_help(sys.argv[0])
+                exit(-1)
+            dashboard_body_budget = int(arg)
+        elif opt == "--fail-over-budget":
+            dashboard_over_budget_fail = True
+        elif opt == "--delete-stale":
+            dashboard_delete_stale = True
+        elif opt == "--report":
+            size_report = True
+        elif opt == "--shorthand":
+            dashboard_metric_shorthand = True
+        elif opt == "--endpoint-url":
+            aws_endpoint_url = arg
+        elif opt == "--trace":
+            trace_file = arg
+        elif opt == "--profile":
+            profile_file = arg
+        elif opt == "--export-inventory":
+            inventory_export_file = arg
+        elif opt == "--from-inventory":
+            inventory_input_file = arg
+        elif opt == "--dry-run":
+            dry_run = True
+        elif opt == "--output-dir":
+            output_dir = arg
+        elif opt == "--publish-dir":
+            publish_dir = arg
         else:
             assert False, "Unhandled option '{0}'".format(opt)
 
-    if medialive_channel_arn is not None:
+    if trace_file is not None:
+        start_tracing()
+    if profile_file is not None:
+        start_profiling()
+    if publish_dir is not None:
+        if medialive_channel_arn is not None or eml_list_filename is not None or inventory_input_file is not None or \
+                output_dir is not None:
+            print "\nError: '--publish-dir' publishes the Dashboards written with '--output-dir', it can't be " \
+                  "combined with '-a/--arn', '-l/--list', '--from-inventory' or '--output-dir'"
+            print_mini_help(sys.argv[0])
+            exit(-1)
+    elif inventory_input_file is not None:
+        if medialive_channel_arn is not None or eml_list_filename is not None or inventory_export_file is not None:
+            print "\nError: '--from-inventory' renders the channels of the inventory, it can't be combined with " \
+                  "'-a/--arn', '-l/--list' or '--export-inventory'"
+            print_mini_help(sys.argv[0])
+            exit(-1)
+    elif medialive_channel_arn is not None:
         eml_channel_arn_list = [medialive_channel_arn]
     elif medialive_channel_arn is None and eml_list_filename is not None:
-        eml_channel_arn_list = load_eml_arn_list(eml_list_filename)
+        with trace_span("load_arn_list", file=eml_list_filename):
+            eml_channel_arn_list = load_eml_arn_list(eml_list_filename)
         arn_count = len(eml_channel_arn_list)
         print "\nFound {0} valid MediaLive Channel ARNs in the file {1}".format(arn_count, eml_list_filename)
         if arn_count == 0:
@@ -1041,11 +2777,38 @@ def main(argv=None):
         print_mini_help(sys.argv[0])
         exit(-1)  # Must have a MediaLive Channel ARN to continue
 
-    if dashboard_name is None:
+    if dashboard_name is None and publish_dir is None:
         print '\nPlease provide a name for the Dashboard. Note to encapsulate the name in "" if it contains spaces.'
         exit()
 
-    process_all_medialive_channels(eml_channel_arn_list, dashboard_name)
+    if aws_max_pool_connections is None:
+        # Keep a connection open for every discovery worker
+        aws_max_pool_connections = max(10, discovery_workers)
+    if discovery_cache_file is not None and inventory_input_file is None and publish_dir is None:
+        try:
+            discovery_cache = DiscoveryCache(discovery_cache_file, discovery_cache_refresh)
+        except Exception, e:
+            print "Warning: Unable to open the discovery cache '{0}', continuing without it: {1}".format(
+                discovery_cache_file, e)
+    try:
+        if publish_dir is not None:
+            profiled(publish_dashboard_files)(publish_dir, discovery_workers, update_dashboard, dry_run)
+        elif inventory_input_file is not None:
+            profiled(process_medialive_inventory)(inventory_input_file, dashboard_name, discovery_workers,
+                                                  update_dashboard, search_expressions, size_report, dry_run,
+                                                  output_dir)
+        else:
+            profiled(process_all_medialive_channels)(eml_channel_arn_list, dashboard_name, discovery_workers,
+                                                     max_requests, update_dashboard, search_expressions, size_report,
+                                                     inventory_export_file, dry_run, output_dir)
+    finally:
+        if discovery_cache is not None:
+            discovery_cache.close()
+        print_aws_call_summary()
+        if trace_file is not None:
+            write_trace(trace_file)
+        if profile_file is not None:
+            write_profile(profile_file)
 
 
 if __name__ == "__main__":
@@ -1,29 +1,337 @@
+import time
+# Start of the initialization of the execution environment, taken before the other imports, as importing boto3 is the
+# largest part of a cold start
+execution_environment_started = time.time()
+
 import sys
 import os
 import getopt
 import boto3
 import json
+import sqlite3
+import threading
+import math
+import cProfile
+import pstats
+from botocore import xform_name
+from botocore.config import Config
 
 
-def lambda_handler(event, context):
-    global dashboard_template
-    global medialive_channel_arn
-
-    version = '0.5'
-    """
-    Notes:
-    Version 0.1: Initial Release
-    Version 0.2: Added support of both 'Status Code Range (sum), 2xx4xx' and 'Status Code Range (sum), 3xx5xx' metrics
-                 Added '-l/--list' command line option with which a user can provide a list of MediaLive Channel ARNs 
-                 for which the Dashboard will be created. NOTE: All MediaLive Channels in this list must be in the same 
-                 region."
-    Version 0.3: Added a text widget to contain all the links to the MediaLive/MediaPackage channel consoles of the 
-                 channels of this dashboard.         
-    Version 0.4: Switched MediaLive centric widgets to use the MediaLive Channel Name instead of the ARN 
-    Version 0.5: Added support for the new dual channel MediaPackage implementation.                     
-    """
-    
-    dashboard_template = """{
+# Number of invocations the execution environment has served. Everything defined at module scope, the parsed dashboard
+# template and the AWS clients included, is kept for warm invocations.
+execution_environment_invocations = 0
+
+# AWS client related functions
+# Number of attempts per AWS request before a throttled or failed request is reported as an error
+aws_max_attempts = 10
+# Error codes with which MediaLive, MediaPackage and CloudWatch throttle requests
+throttling_error_codes = ("Throttling", "ThrottlingException", "TooManyRequestsException", "LimitExceededException")
+# Maximum number of HTTP connections kept open per client
+aws_max_pool_connections = 10
+# The boto3 session and the clients of the function, keyed by (service, region). They live as long as the Lambda
+# execution environment, so warm invocations reuse the open HTTP connections instead of doing a new TLS handshake.
+aws_session = None
+aws_clients = {}
+
+
+def create_aws_client_config():
+    """Create the botocore client configuration shared by the MediaLive, MediaPackage and CloudWatch clients.
+    The adaptive retry mode gives every client, and so every service, its own token bucket that lowers the request
+    rate on throttling responses and raises it again while requests succeed, and retries with jittered backoff."""
+    config = {'retries': {'mode': 'adaptive', 'total_max_attempts': aws_max_attempts},
+              'max_pool_connections': aws_max_pool_connections}
+    if 'tcp_keepalive' in Config.OPTION_DEFAULTS:
+        config['tcp_keepalive'] = True
+    return Config(**config)
+
+
+def get_aws_client(service_name, region_name):
+    """Return the client of the AWS service "service_name" in the region "region_name". Only one client is created
+    per (service, region) and execution environment."""
+    global aws_session
+    if aws_session is None:
+        aws_session = boto3.session.Session()
+    client_key = (service_name, region_name)
+    if client_key not in aws_clients:
+        aws_clients[client_key] = aws_session.client(service_name, region_name=region_name,
+                                                     config=create_aws_client_config())
+        account_aws_calls(aws_clients[client_key])
+    return aws_clients[client_key]
+
+
+# AWS call accounting related functions
+# Calls, retries, throttling responses, errors and latencies in seconds of every AWS operation of the invocation, keyed
+# by the operation name as called on the boto3 clients, e.g. describe_channel. A paginated operation counts 1 call per
+# page. They are logged in the CloudWatch Embedded Metric Format at the end of every invocation.
+aws_call_stats = {}
+aws_call_stats_lock = threading.Lock()
+aws_call_metrics_namespace = "MediaLiveDashboard"
+
+
+def start_aws_call(model, context, **kwargs):
+    """botocore 'before-call' handler that marks the start of an AWS call, before its first attempt"""
+    context["call_accounting"] = {"operation": xform_name(model.name), "started": time.time(), "attempts": 0,
+                                  "throttles": 0}
+
+
+def count_aws_call_attempt(response_dict, parsed_response, context, **kwargs):
+    """botocore 'response-received' handler that counts the attempts, retries included, of an AWS call and its
+    throttling responses"""
+    call_accounting = context.get("call_accounting")
+    if call_accounting is None:
+        return
+    call_accounting["attempts"] += 1
+    error_code = (parsed_response or {}).get("Error", {}).get("Code")
+    if error_code in throttling_error_codes or (response_dict or {}).get("status_code") == 429:
+        call_accounting["throttles"] += 1
+
+
+def record_aws_call(context, failed):
+    """Add the AWS call of the request context "context" to the accounting of its operation"""
+    call_accounting = context.pop("call_accounting", None)
+    if call_accounting is None:
+        return
+    latency = time.time() - call_accounting["started"]
+    with aws_call_stats_lock:
+        operation_stats = aws_call_stats.setdefault(call_accounting["operation"], {
+            "calls": 0, "retries": 0, "throttles": 0, "errors": 0, "latencies": []})
+        operation_stats["calls"] += 1
+        operation_stats["retries"] += max(0, call_accounting["attempts"] - 1)
+        operation_stats["throttles"] += call_accounting["throttles"]
+        operation_stats["errors"] += 1 if failed else 0
+        operation_stats["latencies"].append(latency)
+
+
+def finish_aws_call(http_response, context, **kwargs):
+    """botocore 'after-call' handler, the AWS call got a response, the last attempt may have failed"""
+    record_aws_call(context, http_response.status_code >= 300)
+
+
+def fail_aws_call(context, **kwargs):
+    """botocore 'after-call-error' handler, the AWS call ended without a response, e.g. on a connection error"""
+    record_aws_call(context, True)
+
+
+def account_aws_calls(client):
+    """Add the calls of the client "client" to the per operation accounting of the invocation"""
+    client.meta.events.register('before-call', start_aws_call)
+    client.meta.events.register('response-received', count_aws_call_attempt)
+    client.meta.events.register('after-call', finish_aws_call)
+    client.meta.events.register('after-call-error', fail_aws_call)
+
+
+def get_latency_percentile(sorted_latencies, percentile):
+    """Return the latency at "percentile" of the sorted list of latencies "sorted_latencies", by the nearest rank"""
+    rank = int(math.ceil(percentile / 100.0 * len(sorted_latencies)))
+    return sorted_latencies[max(0, rank - 1)]
+
+
+def log_aws_call_metrics():
+    """Log the calls, retries, throttling responses, errors and latencies of every AWS operation of the invocation as
+    CloudWatch Embedded Metric Format lines, 1 per operation, from which CloudWatch Logs extracts the metrics"""
+    timestamp = int(time.time() * 1000)
+    with aws_call_stats_lock:
+        for operation in sorted(aws_call_stats):
+            operation_stats = aws_call_stats[operation]
+            latencies = sorted(operation_stats["latencies"])
+            print json.dumps({
+                "_aws": {
+                    "Timestamp": timestamp,
+                    "CloudWatchMetrics": [{
+                        "Namespace": aws_call_metrics_namespace,
+                        "Dimensions": [["Operation"]],
+                        "Metrics": [{"Name": "Calls", "Unit": "Count"},
+                                    {"Name": "Retries", "Unit": "Count"},
+                                    {"Name": "Throttles", "Unit": "Count"},
+                                    {"Name": "Errors", "Unit": "Count"},
+                                    {"Name": "LatencyP50", "Unit": "Milliseconds"},
+                                    {"Name": "LatencyP95", "Unit": "Milliseconds"},
+                                    {"Name": "LatencyMax", "Unit": "Milliseconds"}]
+                    }]
+                },
+                "Operation": operation,
+                "Calls": operation_stats["calls"],
+                "Retries": operation_stats["retries"],
+                "Throttles": operation_stats["throttles"],
+                "Errors": operation_stats["errors"],
+                "LatencyP50": round(get_latency_percentile(latencies, 50) * 1000, 1),
+                "LatencyP95": round(get_latency_percentile(latencies, 95) * 1000, 1),
+                "LatencyMax": round(latencies[-1] * 1000, 1)
+            }, separators=(",", ":"), sort_keys=True)
+
+
+# Profiling related functions
+# Set the environment variable MyProfile to "true" to run the invocation under cProfile. The statistics are written to
+# profile_file, and the functions with the most own time are logged per phase.
+profile_file = "/tmp/lambda_profile.pstats"
+# Number of functions with the most own time printed per phase
+profile_top_functions = 10
+# The functions of this script whose calls, and everything they call, make up a phase of the invocation
+profile_phase_roots = {
+    "create_medialive_client_instance": "discovery",
+    "create_cloudwatch_client_instance": "discovery",
+    "create_mediapackage_client_instance": "discovery",
+    "extract_medialive_channel_info": "discovery",
+    "extract_medialive_outputgroup_names": "discovery",
+    "extract_cw_metrics_output_names": "discovery",
+    "extract_mediapackage_channel_names": "discovery",
+    "extract_mediapackage_endpoints": "discovery",
+    "<lambda>": "builders",
+    "compress_dashboard_metrics": "builders",
+    "serialize_dashboard_body": "serialization",
+    "create_cloudwatch_dashboard": "publishing"
+}
+profile_phases = ("discovery", "builders", "serialization", "publishing", "other")
+
+
+def get_profile_phase_times(stats, phase_roots):
+    """Return the (own time, calls, function) of the functions of the pstats "stats" by phase. The functions of
+    "phase_roots" start a phase, every other function takes the phases of its callers, weighed by the time of the calls
+    from each caller. The functions that aren't called from any phase are in the phase "other"."""
+    module_name = os.path.splitext(os.path.basename(__file__))[0]
+    phase_shares = {}
+    function_callers = {}
+    for function, (primitive_calls, calls, own_time, cumulative_time, callers) in stats.stats.items():
+        filename, line, function_name = function
+        if function_name in phase_roots and os.path.splitext(os.path.basename(filename))[0] == module_name:
+            phase_shares[function] = {phase_roots[function_name]: 1.0}
+            continue
+        # Recursive calls are accounted at the outermost call
+        callers = [(caller, caller_stats[3]) for caller, caller_stats in callers.items()
+                   if caller != function and caller in stats.stats]
+        if len(callers) == 0:
+            phase_shares[function] = {"other": 1.0}
+            continue
+        callers_time = sum(caller_time for caller, caller_time in callers)
+        function_callers[function] = [(caller, caller_time / callers_time if callers_time > 0 else 1.0 / len(callers))
+                                      for caller, caller_time in callers]
+        phase_shares[function] = {}
+    # The phases flow down the call graph, a number of call levels per pass, until they settle. Mutually recursive
+    # functions settle gradually, so the number of passes is capped and what's left over goes to "other".
+    for profile_pass in range(200):
+        settled = True
+        for function, callers in function_callers.items():
+            shares = {}
+            for caller, weight in callers:
+                for phase, share in phase_shares[caller].items():
+                    shares[phase] = shares.get(phase, 0) + weight * share
+            if settled and any(abs(shares.get(phase, 0) - phase_shares[function].get(phase, 0)) > 1e-6
+                               for phase in profile_phases):
+                settled = False
+            phase_shares[function] = shares
+        if settled:
+            break
+    phase_times = dict((phase, []) for phase in profile_phases)
+    for function, (primitive_calls, calls, own_time, cumulative_time, callers) in stats.stats.items():
+        shares = phase_shares[function]
+        if sum(shares.values()) < 0.999:
+            shares["other"] = shares.get("other", 0) + 1.0 - sum(shares.values())
+        for phase, share in shares.items():
+            if share > 0:
+                phase_times[phase].append((own_time * share, calls, function))
+    return phase_times
+
+
+def log_profile(profiler):
+    """Write the statistics of the cProfile profiler "profiler" to profile_file and log the functions with the most
+    own time of every phase of the invocation"""
+    stats = pstats.Stats(profiler)
+    try:
+        stats.dump_stats(profile_file)
+    except Exception, e:
+        print "Warning: Unable to write the profile file '{0}': {1}".format(profile_file, e)
+    phase_times = get_profile_phase_times(stats, profile_phase_roots)
+    print "Profile: {0:.3f} seconds in {1} function calls, written to '{2}'".format(stats.total_tt, stats.total_calls,
+                                                                                  profile_file)
+    for phase in profile_phases:
+        functions = sorted(phase_times[phase], reverse=True)
+        phase_time = sum(function[0] for function in functions)
+        if phase_time == 0:
+            continue
+        print "{0}: {1:.3f} seconds ({2:.0f}%)".format(phase, phase_time, 100 * phase_time / stats.total_tt)
+        for own_time, calls, function in functions[:profile_top_functions]:
+            print "  {0:>9.3f} s {1:>9} calls  {2}".format(own_time, calls, pstats.func_std_string(function))
+
+
+# Discovery cache related functions
+# File of the discovery cache. /tmp is kept between the invocations of a warm execution environment.
+discovery_cache_file = "/tmp/discovery_cache.sqlite"
+# Number of seconds a cached discovery result stays valid, per kind of result
+discovery_cache_ttls = {
+    "describe_channel": 24 * 3600,
+    "mediapackage_channel": 24 * 3600,
+    "mediapackage_endpoints": 3600,
+    "output_names": 6 * 3600
+}
+# The discovery cache of the current invocation, None when the cache is unavailable
+discovery_cache = None
+
+
+class DiscoveryCache(object):
+    """SQLite file holding the describe-channel responses, the MediaPackage Channel and Endpoint indexes and the
+    OutputVideoFrameRate Output Names of earlier invocations in the same execution environment. Entries expire after
+    the time to live of their kind. With "refresh", cached entries are ignored but replaced by the freshly discovered
+    ones. The new entries are written to the file when the cache is closed."""
+
+    def __init__(self, filename, refresh=False):
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS discovery (kind TEXT, key TEXT, stored REAL, value TEXT, "
+                                "PRIMARY KEY (kind, key))")
+
+    def get(self, kind, key):
+        """Return the cached value of "kind" for "key", or None if there is no valid entry"""
+        if self.refresh:
+            return None
+        with self.lock:
+            row = self.connection.execute("SELECT stored, value FROM discovery WHERE kind = ? AND key = ?",
+                                          (kind, key)).fetchone()
+        if row is None or time.time() - row[0] > discovery_cache_ttls[kind]:
+            return None
+        return json.loads(row[1])
+
+    def put(self, kind, key, value):
+        """Store the value of "kind" for "key" """
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO discovery VALUES (?, ?, ?, ?)",
+                                    (kind, key, time.time(), json.dumps(value, default=str)))
+
+    def close(self):
+        """Write the new entries to the file and close it"""
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
+
+
+def get_cached_discovery(kind, key):
+    """Return the value of "kind" for "key" from the discovery cache, or None if not cached or the cache is disabled"""
+    if discovery_cache is None:
+        return None
+    return discovery_cache.get(kind, key)
+
+
+def put_cached_discovery(kind, key, value):
+    """Store the value of "kind" for "key" in the discovery cache, if enabled"""
+    if discovery_cache is not None:
+        discovery_cache.put(kind, key, value)
+
+
+version = '0.5'
+"""
+Notes:
+Version 0.1: Initial Release
+Version 0.2: Added support of both 'Status Code Range (sum), 2xx4xx' and 'Status Code Range (sum), 3xx5xx' metrics
+             Added '-l/--list' command line option with which a user can provide a list of MediaLive Channel ARNs 
+             for which the Dashboard will be created. NOTE: All MediaLive Channels in this list must be in the same 
+             region."
+Version 0.3: Added a text widget to contain all the links to the MediaLive/MediaPackage channel consoles of the 
+             channels of this dashboard.         
+Version 0.4: Switched MediaLive centric widgets to use the MediaLive Channel Name instead of the ARN 
+Version 0.5: Added support for the new dual channel MediaPackage implementation.                     
+"""
+
+dashboard_template = """{
         "widgets": [
             {
                 "type": "text",
@@ -450,585 +758,789 @@ def lambda_handler(event, context):
                 }
             }        
         ]
-    }"""
-    
-    
-    # General functions
-    def usage(app_name):
-        """Function that prints out a detailed help page for the script"""
-        global version
-        print '\npython {0} -a MediaLive_ARN -n Dashboard_Name [Optional parameters]\n'.format(app_name)
-        print 'Version:', version
-        print '\nThis script creates a CloudWatch Dashboard for a MediaLive/MediaPackage workflow.'
-        print "It uses the MediaLive Channel Arn as input and determines the MediaPackage instances from the "
-        print "MediaLive channel configuration. It then creates the CloudWatch Dashboard that contains info on the"
-        print "MediaLive channel, the two MediaPackage channels, and all of the MediaPackage endpoints."
-        print "\nRequired parameters:"
-        print "-a, --arn:    MediaLive Channel ARN"
-        print "-n, --name:   Name for the CloudWatch Dashboard. "
-        print ""
-        print "Optional parameters"
-        print "-l, --list:   Filename of a file that contains a list of MediaLive Channel ARNs, 1 ARN per line. "
-        print "              All MediaLive channels and their corresponding MediaPackage channels will be included in "
-        print "              the CloudWatch Dashboard."
-        print "              Note: This parameter is ignored if a channel ARN is provided via the '-a/--arn' option"
-        print "              Note: All ARNs in the list must be for channels in the same region. All ARNs not in the same"
-        print "              region as the first ARN in the list will be ignored."
-        print '-h, --help:   Print this help and exit.'
-        print ""
-        print 'Examples:'
-        print ""
-        print 'Using MediaLive ARN arn:aws:medialive:us-west-2:0123456789:channel:123456 and create a CloudWatch ' \
-              'Dashboard called "My TV Dashboard"'
-        print 'python {0} -a arn:aws:medialive:us-west-2:0123456789:channel:123456 ' \
-              '-n "My TV Dashboard" '.format(app_name)
-        print ""
-        print 'Using the MediaLive Channel ARN list defined in the text file "My EML arns.txt" create a CloudWatch' \
-              'Dashboard called "Primary Bouquet".'
-        print 'python {0} -l "My EML arns.txt" -n "Primary Bouquet"\n'.format(app_name)
-    
-    
-    def print_mini_help(app_name):
-        """Print statement showing how to use the '-h/--help' option to get help on proper usage of the script"""
-        print "\nExecute the script with either '-h' or '--help' to obtain detailed help on how to run the script:"
-        print 'python {0} -h'.format(app_name)
-        print "or"
-        print 'python {0} --help\n'.format(app_name)
-    
-    
-    def is_valid_medialive_channel_arn(mlive_channel_arn):
-        """Determine if the ARN provided is a valid / complete MediaLive Channel ARN"""
-        if mlive_channel_arn.startswith("arn:aws:medialive:") and "channel" in mlive_channel_arn:
-            return True
-        else:
-            return False
-    
-    
-    def extract_medialive_region(ml_channel_arn):
-        """"Given a MediaLive Channel Arn determine the region the channel is in."""
-        region = None
-        # arn:aws:medialive:us-west-2:0123456789:channel:123456
-        if is_valid_medialive_channel_arn(ml_channel_arn):
-            arn_parts = ml_channel_arn.split(":")
-            if len(arn_parts) == 7:
-                region = arn_parts[3]
-        return region
-    
-    
-    def extract_medialive_channel_id(ml_channel_arn):
-        """Given a MediaLive Channel ARN, return the MediaLive Channel ID"""
-        ml_channel_id = None
-        if is_valid_medialive_channel_arn(ml_channel_arn):
-            ml_channel_id = ml_channel_arn.strip().split(":")[-1]
-        return ml_channel_id
-    
-    
-    def load_eml_arn_list(ml_list_file):
-        """Load the MediaLive Channel ARNs defined in "ml_list_file" and return as a list.
-        All MediaLive Channels must be in the same region to be eligble for inclusion into a CloudWatch Dashboard metric
-        widget. Therefore only Channel ARNs in the same region as the first Channel ARN in the list will be returned.
-        Additionally, any duplicate ARNs will be discarded as well."""
-        first_region = None
-        is_first_arn = True
-        result = []
-        try:
-            with open(ml_list_file, "rt") as in_file:
-                for line in in_file:
-                    line = line.strip()
-                    if is_valid_medialive_channel_arn(line):
-                        current_region = extract_medialive_region(line)
-                        if is_first_arn:
-                            first_region = current_region
-                            is_first_arn = False
-                        if current_region == first_region:
-                            if line not in result:
-                                result.append(line)
-                            else:
-                                print "Skipping duplicate MediaLive ARN '{0}', since it already exists in the " \
-                                      "list".format(line)
+}"""
+
+
+class DashboardError(Exception):
+    """Error that stops the creation of the CloudWatch Dashboard. Its message is reported to CloudFormation as the
+    reason of the failure."""
+    pass
+
+
+# General functions
+def usage(app_name):
+    """Function that prints out a detailed help page for the script"""
+    global version
+    print '\npython {0} -a MediaLive_ARN -n Dashboard_Name [Optional parameters]\n'.format(app_name)
+    print 'Version:', version
+    print '\nThis script creates a CloudWatch Dashboard for a MediaLive/MediaPackage workflow.'
+    print "It uses the MediaLive Channel Arn as input and determines the MediaPackage instances from the "
+    print "MediaLive channel configuration. It then creates the CloudWatch Dashboard that contains info on the"
+    print "MediaLive channel, the two MediaPackage channels, and all of the MediaPackage endpoints."
+    print "\nRequired parameters:"
+    print "-a, --arn:    MediaLive Channel ARN"
+    print "-n, --name:   Name for the CloudWatch Dashboard. "
+    print ""
+    print "Optional parameters"
+    print "-l, --list:   Filename of a file that contains a list of MediaLive Channel ARNs, 1 ARN per line. "
+    print "              All MediaLive channels and their corresponding MediaPackage channels will be included in "
+    print "              the CloudWatch Dashboard."
+    print "              Note: This parameter is ignored if a channel ARN is provided via the '-a/--arn' option"
+    print "              Note: All ARNs in the list must be for channels in the same region. All ARNs not in the same"
+    print "              region as the first ARN in the list will be ignored."
+    print '-h, --help:   Print this help and exit.'
+    print ""
+    print 'Examples:'
+    print ""
+    print 'Using MediaLive ARN arn:aws:medialive:us-west-2:0123456789:channel:123456 and create a CloudWatch ' \
+          'Dashboard called "My TV Dashboard"'
+    print 'python {0} -a arn:aws:medialive:us-west-2:0123456789:channel:123456 ' \
+          '-n "My TV Dashboard" '.format(app_name)
+    print ""
+    print 'Using the MediaLive Channel ARN list defined in the text file "My EML arns.txt" create a CloudWatch' \
+          'Dashboard called "Primary Bouquet".'
+    print 'python {0} -l "My EML arns.txt" -n "Primary Bouquet"\n'.format(app_name)
+
+
+def print_mini_help(app_name):
+    """Print statement showing how to use the '-h/--help' option to get help on proper usage of the script"""
+    print "\nExecute the script with either '-h' or '--help' to obtain detailed help on how to run the script:"
+    print 'python {0} -h'.format(app_name)
+    print "or"
+    print 'python {0} --help\n'.format(app_name)
+
+
+def is_valid_medialive_channel_arn(mlive_channel_arn):
+    """Determine if the ARN provided is a valid / complete MediaLive Channel ARN"""
+    if mlive_channel_arn.startswith("arn:aws:medialive:") and "channel" in mlive_channel_arn:
+        return True
+    else:
+        return False
+
+
+def extract_medialive_region(ml_channel_arn):
+    """"Given a MediaLive Channel Arn determine the region the channel is in."""
+    region = None
+    # arn:aws:medialive:us-west-2:0123456789:channel:123456
+    if is_valid_medialive_channel_arn(ml_channel_arn):
+        arn_parts = ml_channel_arn.split(":")
+        if len(arn_parts) == 7:
+            region = arn_parts[3]
+    return region
+
+
+def extract_medialive_channel_id(ml_channel_arn):
+    """Given a MediaLive Channel ARN, return the MediaLive Channel ID"""
+    ml_channel_id = None
+    if is_valid_medialive_channel_arn(ml_channel_arn):
+        ml_channel_id = ml_channel_arn.strip().split(":")[-1]
+    return ml_channel_id
+
+
+def load_eml_arn_list(ml_list_file):
+    """Load the MediaLive Channel ARNs defined in "ml_list_file" and return as a list.
+    All MediaLive Channels must be in the same region to be eligble for inclusion into a CloudWatch Dashboard metric
+    widget. Therefore only Channel ARNs in the same region as the first Channel ARN in the list will be returned.
+    Additionally, any duplicate ARNs will be discarded as well."""
+    first_region = None
+    is_first_arn = True
+    result = []
+    try:
+        with open(ml_list_file, "rt") as in_file:
+            for line in in_file:
+                line = line.strip()
+                if is_valid_medialive_channel_arn(line):
+                    current_region = extract_medialive_region(line)
+                    if is_first_arn:
+                        first_region = current_region
+                        is_first_arn = False
+                    if current_region == first_region:
+                        if line not in result:
+                            result.append(line)
                         else:
-                            print "Ignoring MediaLive ARN '{0}', since it's not in the same region as the first " \
-                                  "ARN in the list.".format(line)
+                            print "Skipping duplicate MediaLive ARN '{0}', since it already exists in the " \
+                                  "list".format(line)
                     else:
-                        if line is not "":
-                            print "'{0}' is not a valid MediaLive Channel ARN".format(line)
-            return result
-        except Exception, e:
-            print "Error: Processing EML Channel ARN List file '{0}'\n{1}".format(ml_list_file, e.message)
-    
-    
-    # MediaLive related functions
-    def create_medialive_client_instance(ml_region):
-        """Create a MediaLive Client Instance for the region specified in "ml_region". """
-        try:
-            medialive = boto3.client('medialive', region_name=ml_region)
-            return medialive
-        except Exception, e:
-            print "Error: Creating a MediaLive Client instance:\n '{0}'".format(e.message)
-            responseData = { 'Reason': 'Error: Creating a MediaLive Client instance'}
-            send(event, context, FAILED, responseData, "CustomResourcePhysicalID")                 
-            return 1
-
-    def extract_medialive_channel_info(ml_client, ml_channel_id):
-        """Perform a list-channels query against all MediaLive channel in the region specified by the
-        MediaLive Channel ID and retrieve the MediaLive Channel Name, and MediaPackage Channel ARNs
-        Returns: MediaLive_Channel_Name & a list of MediaPackage channels"""
-        mediapackage_channel_list = []
-        channel_name = None
-        try:
-            response = ml_client.describe_channel(
-                ChannelId=ml_channel_id
-            )
-            channel_name = str(response["Name"])
-            destinations = response["Destinations"]
-            for destination in destinations:
-                for output in destination["Settings"]:
-                    url = str(output["Url"])
-                    if "mediapackage" in url:
-                        mediapackage_channel_list.append(url)
-        except Exception, e:
-            print "Error:", e.message
-        return channel_name, mediapackage_channel_list
-
-    def extract_medialive_outputgroup_names(ml_client, ml_channel_id):
-        """given the MediaLive Channel ID "ml_channel_id" retrieve a list of all Output Group Names defined in the
-        channel configuration."""
-        mp_outputgroup_names = []
-        try:
-            channel_response = ml_client.describe_channel(ChannelId=ml_channel_id)
-            outputgroups = channel_response["EncoderSettings"]["OutputGroups"]
-            for outputgroup in outputgroups:
-                groupname = str(outputgroup["Name"])
-                mp_outputgroup_names.append(groupname)
-            return mp_outputgroup_names
-        except Exception, e:
-            print "Error: Unable to perform the describe-channel() query for the MediaLive Channel", ml_channel_id
-            print "Error message:", e
-    
-    
-    # MediaPackage related functions
-    def create_mediapackage_client_instance(mp_region):
-        """Create a MediaPackage Client Instance for the region specified in "mp_region". """
-        try:
-            mediapackage = boto3.client('mediapackage', region_name=mp_region)
-            return mediapackage
-        except Exception, e:
-            print "Error: Creating a MediaPackage Client instance '{0}'".format(e.message)
-    
-    def extract_mediapackage_channel_names(ml_client, mediapackage_url_list, ml_region):
-        """Using the list-channels query, in the region "ml_region", find the MediaPackage Channel Id for the MediaPackage 
-        Channels defined in "mediapackage_url_list"."""
-        mp_uids = []
-        mp_channel_names = []
-        for mediapackage_url in mediapackage_url_list:
-            if "mediapackage." + ml_region in mediapackage_url:
-                if "/v1/" in mediapackage_url:
-                    url_parts = mediapackage_url.split("/")
-                    if len(url_parts) == 7:
-                        emp_ch_id = url_parts[5]
+                        print "Ignoring MediaLive ARN '{0}', since it's not in the same region as the first " \
+                              "ARN in the list.".format(line)
+                else:
+                    if line is not "":
+                        print "'{0}' is not a valid MediaLive Channel ARN".format(line)
+        return result
+    except Exception, e:
+        print "Error: Processing EML Channel ARN List file '{0}'\n{1}".format(ml_list_file, e.message)
+
+
+# MediaLive related functions
+def create_medialive_client_instance(ml_region):
+    """Create a MediaLive Client Instance for the region specified in "ml_region". """
+    try:
+        medialive = get_aws_client('medialive', ml_region)
+        return medialive
+    except Exception, e:
+        print "Error: Creating a MediaLive Client instance:\n '{0}'".format(e.message)
+        raise DashboardError('Error: Creating a MediaLive Client instance')
+
+# describe-channel responses of this invocation, keyed by (region, MediaLive Channel ID). Emptied at the start of every
+# invocation, warm invocations read the earlier responses from the discovery cache.
+medialive_channel_descriptions = {}
+
+
+def describe_medialive_channel(ml_client, ml_channel_id):
+    """Perform the describe-channel query for the MediaLive Channel ID "ml_channel_id" once per run and return the
+    response, so that all information extracted from the channel configuration is read from a single query."""
+    channel_key = (ml_client.meta.region_name, ml_channel_id)
+    if channel_key not in medialive_channel_descriptions:
+        cache_key = "{0}:{1}".format(*channel_key)
+        response = get_cached_discovery("describe_channel", cache_key)
+        if response is None:
+            response = ml_client.describe_channel(ChannelId=ml_channel_id)
+            response.pop("ResponseMetadata", None)
+            put_cached_discovery("describe_channel", cache_key, response)
+        medialive_channel_descriptions[channel_key] = response
+    return medialive_channel_descriptions[channel_key]
+
+
+def extract_medialive_channel_info(ml_client, ml_channel_id):
+    """Perform a list-channels query against all MediaLive channel in the region specified by the
+    MediaLive Channel ID and retrieve the MediaLive Channel Name, and MediaPackage Channel ARNs
+    Returns: MediaLive_Channel_Name & a list of MediaPackage channels"""
+    mediapackage_channel_list = []
+    channel_name = None
+    try:
+        response = describe_medialive_channel(ml_client, ml_channel_id)
+        channel_name = str(response["Name"])
+        destinations = response["Destinations"]
+        for destination in destinations:
+            for output in destination["Settings"]:
+                url = str(output["Url"])
+                if "mediapackage" in url:
+                    mediapackage_channel_list.append(url)
+    except Exception, e:
+        print "Error:", e.message
+    return channel_name, mediapackage_channel_list
+
+def extract_medialive_outputgroup_names(ml_client, ml_channel_id):
+    """given the MediaLive Channel ID "ml_channel_id" retrieve a list of all Output Group Names defined in the
+    channel configuration."""
+    mp_outputgroup_names = []
+    try:
+        channel_response = describe_medialive_channel(ml_client, ml_channel_id)
+        outputgroups = channel_response["EncoderSettings"]["OutputGroups"]
+        for outputgroup in outputgroups:
+            groupname = str(outputgroup["Name"])
+            mp_outputgroup_names.append(groupname)
+        return mp_outputgroup_names
+    except Exception, e:
+        print "Error: Unable to perform the describe-channel() query for the MediaLive Channel", ml_channel_id
+        print "Error message:", e
+
+
+# MediaPackage related functions
+def create_mediapackage_client_instance(mp_region):
+    """Create a MediaPackage Client Instance for the region specified in "mp_region". """
+    try:
+        mediapackage = get_aws_client('mediapackage', mp_region)
+        return mediapackage
+    except Exception, e:
+        print "Error: Creating a MediaPackage Client instance '{0}'".format(e.message)
+
+# Maximum number of results returned per page by the MediaPackage list queries
+mediapackage_page_size = 1000
+
+
+def iterate_mediapackage_items(mp_client, operation_name, result_key):
+    """Generator that streams the items of the paginated MediaPackage query "operation_name" one page at a time, so
+    that no page is requested before all items of the previous page have been consumed."""
+    paginator = mp_client.get_paginator(operation_name)
+    for response in paginator.paginate(PaginationConfig={'PageSize': mediapackage_page_size}):
+        for item in response[result_key]:
+            yield item
+
+
+class MediaPackageInventory(object):
+    """Index of the MediaPackage Channels and Endpoints of a region, shared by all MediaLive channels of a run.
+    The list-channels pages are only read until every requested Channel UID is resolved. The list_origin_endpoints
+    pages are read once, on the first endpoint lookup, since the endpoints of a channel can be on any page.
+    Channels and Endpoints found in the discovery cache are not listed at all, unless a channel is missing from the
+    cached Endpoints, e.g. because it was created since, in which case they are listed again once."""
+
+    def __init__(self, mp_client):
+        self.region = mp_client.meta.region_name
+        self.channels = iterate_mediapackage_items(mp_client, 'list_channels', 'Channels')
+        self.endpoints = iterate_mediapackage_items(mp_client, 'list_origin_endpoints', 'OriginEndpoints')
+        self.channel_ids = {}
+        self.listed_channels = 0
+        self.channel_endpoints = None
+        self.channel_endpoints_cached = False
+
+    def find_channel_ids(self, channel_uids):
+        """Return the (position, Channel Id) of the MediaPackage Channels with the UIDs "channel_uids" that exist,
+        where position is the order in which list-channels returned the channel."""
+        unresolved = set(channel_uids) - set(self.channel_ids)
+        for channel_uid in list(unresolved):
+            cached_channel = get_cached_discovery("mediapackage_channel", "{0}:{1}".format(self.region, channel_uid))
+            if cached_channel is not None:
+                self.channel_ids[channel_uid] = (cached_channel[0], str(cached_channel[1]))
+                unresolved.discard(channel_uid)
+        while len(unresolved) > 0:
+            channel = next(self.channels, None)
+            if channel is None:
+                break
+            channel_uid = channel["Arn"].split("/")[-1]
+            self.channel_ids[channel_uid] = (self.listed_channels, str(channel["Id"]))
+            self.listed_channels += 1
+            put_cached_discovery("mediapackage_channel", "{0}:{1}".format(self.region, channel_uid),
+                                 self.channel_ids[channel_uid])
+            unresolved.discard(channel_uid)
+        return [self.channel_ids[channel_uid] for channel_uid in channel_uids if channel_uid in self.channel_ids]
+
+    def find_endpoint_ids(self, channel_id):
+        """Return the Endpoint Ids of the MediaPackage Channel "channel_id" """
+        if self.channel_endpoints is None:
+            self.channel_endpoints = get_cached_discovery("mediapackage_endpoints", self.region)
+            self.channel_endpoints_cached = self.channel_endpoints is not None
+        if self.channel_endpoints is None or \
+                (self.channel_endpoints_cached and str(channel_id) not in self.channel_endpoints):
+            self.channel_endpoints_cached = False
+            self.channel_endpoints = {}
+            for endpoint in self.endpoints:
+                self.channel_endpoints.setdefault(str(endpoint["ChannelId"]), []).append(str(endpoint['Id']))
+            put_cached_discovery("mediapackage_endpoints", self.region, self.channel_endpoints)
+        return [str(endpoint_id) for endpoint_id in self.channel_endpoints.get(str(channel_id), [])]
+
+
+def extract_mediapackage_channel_names(mp_inventory, mediapackage_url_list, ml_region):
+    """Using the MediaPackage inventory of the region "ml_region", find the MediaPackage Channel Id for the MediaPackage
+    Channels defined in "mediapackage_url_list"."""
+    mp_uids = []
+    for mediapackage_url in mediapackage_url_list:
+        if "mediapackage." + ml_region in mediapackage_url:
+            if "/v1/" in mediapackage_url:
+                url_parts = mediapackage_url.split("/")
+                if len(url_parts) == 7:
+                    emp_ch_id = url_parts[5]
+                    mp_uids.append(emp_ch_id)
+            elif "/v2/" in mediapackage_url:
+                url_parts = mediapackage_url.split("/")
+                if len(url_parts) == 8:
+                    emp_ch_id = url_parts[5]
+                    if emp_ch_id not in mp_uids:
                         mp_uids.append(emp_ch_id)
-                elif "/v2/" in mediapackage_url:
-                    url_parts = mediapackage_url.split("/")
-                    if len(url_parts) == 8:
-                        emp_ch_id = url_parts[5]
-                        if emp_ch_id not in mp_uids:
-                            mp_uids.append(emp_ch_id)
-        if len(mp_uids) > 0:
-            response = ml_client.list_channels()
-            for channel in response["Channels"]:
-                channel_arn = channel["Arn"]
-                channel_uid = channel_arn.split("/")[-1]
-                if channel_uid in mp_uids:
-                    mp_channel_names.append(channel["Id"])
-        return mp_channel_names
-    
-    
-    def extract_mediapackage_endpoints(mp_client, mp_channel_id_list):
-        """Using the list_origin_endpoints query, find all the MediaPackage endpoints for the MediaPackage
-        channels defined in "mediapackage_channel_id_list" """
-        emp_endpoint_list = {}
-        for channel in mp_channel_id_list:
-            emp_endpoint_list[str(channel)] = []
-        response = mp_client.list_origin_endpoints()
-        for endpoint in response['OriginEndpoints']:
-            if str(endpoint["ChannelId"]) in mp_channel_id_list:
-                emp_endpoint_list[str(endpoint["ChannelId"])].append(str(endpoint['Id']))
-        return emp_endpoint_list
-    
-    
-    # CloudWatch related functions
-    def create_cloudwatch_client_instance():
-        """Create a CloudWatch Client Instance. """
-        try:
-            cloudwatch = boto3.client('cloudwatch')
-            return cloudwatch
-        except Exception, e:
-            responseData = { 'Reason': 'Error creating CloudWatch Client instance'}
-            send(event, context, FAILED, responseData, "CustomResourcePhysicalID")                 
-            return 1
-    
-    
-    def extract_cw_metrics_output_names(cw_client, ml_channel_id):
-        """Retrieve a list of MediaLive OutputNames for all Outputs defined in the OutputVideoFrameRate CloudWatch Metric 
-        of the MediaLive defined by the MediaLive Channel ID "ml_channel_id" """
-        output_name_list = []
-        try:
-            paginator = cw_client.get_paginator('list_metrics')
-            for response in paginator.paginate(Dimensions=[{'Name': 'ChannelId', 'Value': ml_channel_id},
-                                                           {'Name': 'OutputName'},
-                                                           {'Name': 'Pipeline'}],
-                                               MetricName='OutputVideoFrameRate',
-                                               Namespace='MediaLive'):
-                if len(response["Metrics"]) > 0:
-                    for metric in response["Metrics"]:
-                        entry = {}
-                        dimensions = metric["Dimensions"]
-                        for dimension in dimensions:
-                            if dimension["Name"] == "OutputName":
-                                entry["OutputName"] = dimension["Value"]
-                            elif dimension["Name"] == "ChannelId":
-                                entry["ChannelId"] = dimension["Value"]
-                            elif dimension["Name"] == "Pipeline":
-                                entry["Pipeline"] = dimension["Value"]
-                                output_name_list.append(entry)
-            return output_name_list
-        except Exception, e:
-            print "Error while retrieving CloudWatch OutputName information", e.message
-    
-    
-    def create_cloudwatch_dashboard(cw_client, cw_dashboard_name, cw_dashboard_body):
-        """Use put_dashboard to create a new CloudWatch Dashboard named "cw_dashboard_name" that consists of the definition
-        as defined in "cw_dashboard_body" """
-        try:
-            cw_dashboard_name = cw_dashboard_name.replace(" ", "-")
-            response = cw_client.put_dashboard(
-                DashboardName=cw_dashboard_name,
-                DashboardBody=cw_dashboard_body
-            )
-            result_code = response["ResponseMetadata"]["HTTPStatusCode"]
-            if result_code == 200:
-                print "Successfully created Dashboard '{0}'".format(cw_dashboard_name)
-            else:
-                print "HTTP Status Code:", result_code
-        except Exception, e:
-            responseData = { 'Reason': 'Error while trying to create new CloudWatch Dashboard'}
-            send(event, context, FAILED, responseData, "CustomResourcePhysicalID")                 
-            return 1
-    # CloudWatch Dashboard metrics related
-    def update_ingress_bytes_metric(mp_channel_names):
-        """Update the metrics of the "Ingress Bytes (sum)" dashboard widget """
-        results = []
-        for mp_name in mp_channel_names:
-            entry = ["AWS/MediaPackage", "IngressBytes", "Channel", mp_name]
+    if len(mp_uids) == 0:
+        return []
+    # Return the Channel Ids in the order list-channels returned them
+    mp_channels = set(mp_inventory.find_channel_ids(mp_uids))
+    return [channel_id for position, channel_id in sorted(mp_channels)]
+
+
+def extract_mediapackage_endpoints(mp_inventory, mp_channel_id_list):
+    """Using the MediaPackage inventory, find all the MediaPackage endpoints for the MediaPackage channels defined in
+    "mediapackage_channel_id_list" """
+    emp_endpoint_list = {}
+    for channel in mp_channel_id_list:
+        emp_endpoint_list[str(channel)] = mp_inventory.find_endpoint_ids(channel)
+    return emp_endpoint_list
+
+
+# CloudWatch related functions
+def create_cloudwatch_client_instance(cw_region):
+    """Create a CloudWatch Client Instance for the region specified in "cw_region". """
+    try:
+        cloudwatch = get_aws_client('cloudwatch', cw_region)
+        return cloudwatch
+    except Exception, e:
+        raise DashboardError('Error creating CloudWatch Client instance')
+
+
+def extract_cw_metrics_output_names(cw_client, ml_channel_id):
+    """Retrieve a list of MediaLive OutputNames for all Outputs defined in the OutputVideoFrameRate CloudWatch Metric 
+    of the MediaLive defined by the MediaLive Channel ID "ml_channel_id" """
+    cache_key = "{0}:{1}".format(cw_client.meta.region_name, ml_channel_id)
+    output_name_list = get_cached_discovery("output_names", cache_key)
+    if output_name_list is not None:
+        return output_name_list
+    output_name_list = []
+    try:
+        paginator = cw_client.get_paginator('list_metrics')
+        for response in paginator.paginate(Dimensions=[{'Name': 'ChannelId', 'Value': ml_channel_id},
+                                                       {'Name': 'OutputName'},
+                                                       {'Name': 'Pipeline'}],
+                                           MetricName='OutputVideoFrameRate',
+                                           Namespace='MediaLive'):
+            if len(response["Metrics"]) > 0:
+                for metric in response["Metrics"]:
+                    entry = {}
+                    dimensions = metric["Dimensions"]
+                    for dimension in dimensions:
+                        if dimension["Name"] == "OutputName":
+                            entry["OutputName"] = dimension["Value"]
+                        elif dimension["Name"] == "ChannelId":
+                            entry["ChannelId"] = dimension["Value"]
+                        elif dimension["Name"] == "Pipeline":
+                            entry["Pipeline"] = dimension["Value"]
+                            output_name_list.append(entry)
+        # Outputs only show up once the channel was started, so keep looking for them while there are none
+        if len(output_name_list) > 0:
+            put_cached_discovery("output_names", cache_key, output_name_list)
+        return output_name_list
+    except Exception, e:
+        print "Error while retrieving CloudWatch OutputName information", e.message
+
+
+def create_cloudwatch_dashboard(cw_client, cw_dashboard_name, cw_dashboard_body):
+    """Use put_dashboard to create a new CloudWatch Dashboard named "cw_dashboard_name" that consists of the definition
+    as defined in "cw_dashboard_body" """
+    try:
+        cw_dashboard_name = cw_dashboard_name.replace(" ", "-")
+        response = cw_client.put_dashboard(
+            DashboardName=cw_dashboard_name,
+            DashboardBody=cw_dashboard_body
+        )
+        result_code = response["ResponseMetadata"]["HTTPStatusCode"]
+        if result_code == 200:
+            print "Successfully created Dashboard '{0}'".format(cw_dashboard_name)
+        else:
+            print "HTTP Status Code:", result_code
+    except Exception, e:
+        raise DashboardError('Error while trying to create new CloudWatch Dashboard')
+# CloudWatch Dashboard metrics related
+def update_ingress_bytes_metric(mp_channel_names):
+    """Update the metrics of the "Ingress Bytes (sum)" dashboard widget """
+    results = []
+    for mp_name in mp_channel_names:
+        entry = ["AWS/MediaPackage", "IngressBytes", "Channel", mp_name]
+        results.append(entry)
+    return results
+
+
+def update_ingress_resp_times_metric(mp_channel_names):
+    """Update the metrics of the "Ingress Response Times (avg)" dashboard widget"""
+    results = []
+    for mp_name in mp_channel_names:
+        entry = ["AWS/MediaPackage", "IngressResponseTime", "Channel", mp_name]
+        results.append(entry)
+    return results
+
+
+def update_egress_req_bytes_metric(mp_endpoint_names):
+    """Update the metrics of the "Egress Request Bytes (sum)" dashboard widget"""
+    results = []
+    for mp_name in mp_endpoint_names:
+        endpoints = mp_endpoint_names[mp_name]
+        for endpoint in endpoints:
+            entry = ["AWS/MediaPackage", "EgressBytes", "Channel", mp_name, "OriginEndpoint", endpoint]
             results.append(entry)
-        return results
-    
-    
-    def update_ingress_resp_times_metric(mp_channel_names):
-        """Update the metrics of the "Ingress Response Times (avg)" dashboard widget"""
-        results = []
-        for mp_name in mp_channel_names:
-            entry = ["AWS/MediaPackage", "IngressResponseTime", "Channel", mp_name]
+    return results
+
+
+def update_egress_req_count_metric(mp_endpoint_names):
+    """Update the metrics of the "Egress Request Count (sum)" dashboard widget"""
+    results = []
+    for mp_name in mp_endpoint_names:
+        endpoints = mp_endpoint_names[mp_name]
+        for endpoint in endpoints:
+            entry = ["AWS/MediaPackage", "EgressRequestCount", "Channel", mp_name, "OriginEndpoint", endpoint]
             results.append(entry)
-        return results
-    
-    
-    def update_egress_req_bytes_metric(mp_endpoint_names):
-        """Update the metrics of the "Egress Request Bytes (sum)" dashboard widget"""
-        results = []
-        for mp_name in mp_endpoint_names:
-            endpoints = mp_endpoint_names[mp_name]
-            for endpoint in endpoints:
-                entry = ["AWS/MediaPackage", "EgressBytes", "Channel", mp_name, "OriginEndpoint", endpoint]
-                results.append(entry)
-        return results
-    
-    
-    def update_egress_req_count_metric(mp_endpoint_names):
-        """Update the metrics of the "Egress Request Count (sum)" dashboard widget"""
-        results = []
-        for mp_name in mp_endpoint_names:
-            endpoints = mp_endpoint_names[mp_name]
-            for endpoint in endpoints:
-                entry = ["AWS/MediaPackage", "EgressRequestCount", "Channel", mp_name, "OriginEndpoint", endpoint]
-                results.append(entry)
-        return results
-    
-    
-    def update_status_code_range_2xx4xx_metric(mp_endpoint_names):
-        """Update the metrics of the "Status Code Range (sum)" dashboard widget"""
-        results = []
-        for mp_name in mp_endpoint_names:
-            endpoints = mp_endpoint_names[mp_name]
-            for endpoint in endpoints:
-                entry = ["AWS/MediaPackage", "EgressRequestCount", "Channel", mp_name, "OriginEndpoint", endpoint,
-                         "StatusCodeRange", "2xx"]
-                results.append(entry)
-                entry = ["AWS/MediaPackage", "EgressRequestCount", "Channel", mp_name, "OriginEndpoint", endpoint,
-                         "StatusCodeRange", "4xx", {"yAxis": "right"}]
-                results.append(entry)
-        return results
-    
-    
-    def update_status_code_range_3xx5xx_metric(mp_endpoint_names):
-        """Update the metrics of the "Status Code Range (sum)" dashboard widget"""
-        results = []
-        for mp_name in mp_endpoint_names:
-            endpoints = mp_endpoint_names[mp_name]
-            for endpoint in endpoints:
-                entry = ["AWS/MediaPackage", "EgressRequestCount", "Channel", mp_name, "OriginEndpoint", endpoint,
-                         "StatusCodeRange", "3xx"]
-                results.append(entry)
-                entry = ["AWS/MediaPackage", "EgressRequestCount", "Channel", mp_name, "OriginEndpoint", endpoint,
-                         "StatusCodeRange", "5xx", {"yAxis": "right"}]
-                results.append(entry)
-        return results
-    
-    
-    def update_input_video_frame_rate_metric(ml_channel_id, ml_channel_name):
-        """Update the metrics of the "Input Video Frame Rate (avg)" dashboard widget"""
-        result = []
-        entry = ["MediaLive", "InputVideoFrameRate", "ChannelId", ml_channel_id, "Pipeline", "0",
-                 {"label": ml_channel_name + "-0"}]
-        result.append(entry)
-        entry = ["MediaLive", "InputVideoFrameRate", "ChannelId", ml_channel_id, "Pipeline", "1",
-                 {"yAxis": "right", "label": ml_channel_name + "-1"}]
-        result.append(entry)
-        return result
-    
-    
-    def update_network_in_metric(ml_channel_id, ml_channel_name):
-        """Update the metrics of the "Network In (sum)" dashboard dashboard widget"""
-        result = []
-        entry = ["MediaLive", "NetworkIn", "ChannelId", ml_channel_id, "Pipeline", "0", {"label": ml_channel_name + "-0"}]
-        result.append(entry)
-        entry = ["MediaLive", "NetworkIn", "ChannelId", ml_channel_id, "Pipeline", "1", {"yAxis": "right",
-                                                                                         "label": ml_channel_name + "-1"}]
-        result.append(entry)
-        return result
-    
-    
-    def update_dropped_frames_metric(ml_channel_id, ml_channel_name):
-        """Update the metrics of the "Dropped Frames (sum)" dashboard dashboard widget"""
-        result = []
-        entry = ["MediaLive", "DroppedFrames", "ChannelId", ml_channel_id, "Pipeline", "0", {"label": ml_channel_name + "-0"}]
-        result.append(entry)
-        entry = ["MediaLive", "DroppedFrames", "ChannelId", ml_channel_id, "Pipeline", "1", {"yAxis": "right",
-                                                                                             "label": ml_channel_name + "-1"}]
-        result.append(entry)
-        return result
-    
-    
-    def update_fill_msec_metric(ml_channel_id, ml_channel_name):
-        """Update the metrics of the "Fill Milliseconds (sum)" dashboard dashboard widget"""
-        result = []
-        entry = ["MediaLive", "FillMsec", "ChannelId", ml_channel_id, "Pipeline", "0", {"label": ml_channel_name + "-0"}]
-        result.append(entry)
-        entry = ["MediaLive", "FillMsec", "ChannelId", ml_channel_id, "Pipeline", "1", {"yAxis": "right",
-                                                                                        "label": ml_channel_name + "-1"}]
-        result.append(entry)
-        return result
-    
-    
-    def update_svq_time_metric(ml_channel_id, ml_channel_name):
-        """Update the metrics of the "SVQ Time (percentage)" dashboard dashboard widget"""
-        result = []
-        entry = ["MediaLive", "SvqTime", "ChannelId", ml_channel_id, "Pipeline", "0", {"label": ml_channel_name + "-0"}]
-        result.append(entry)
-        entry = ["MediaLive", "SvqTime", "ChannelId", ml_channel_id, "Pipeline", "1", {"yAxis": "right",
-                                                                                       "label": ml_channel_name + "-1"}]
-        result.append(entry)
-        return result
-    
-    
-    def update_output_frame_video_rate_metric(ml_output_names):
-        """Update the metrics of the "Output Video Frame Rate (avg)" dashboard dashboard widget"""
-        result = []
-        for output in ml_output_names:
-            if output["Pipeline"] == "0":
-                entry = ["MediaLive", "OutputVideoFrameRate", "ChannelId", output["ChannelId"], "OutputName",
-                         output["OutputName"], "Pipeline", "0"]
-                result.append(entry)
-            elif output["Pipeline"] == "1":
-                entry = ["MediaLive", "OutputVideoFrameRate", "ChannelId", output["ChannelId"], "OutputName",
-                         output["OutputName"], "Pipeline", "1", {"yAxis": "right"}]
-                result.append(entry)
-        return result
-    
-    
-    def update_network_output_metric(ml_channel_id, ml_channel_name):
-        """Update the metrics of the "Network Out (sum)" dashboard dashboard widget"""
-        result = []
-        entry = ["MediaLive", "NetworkOut", "ChannelId", ml_channel_id, "Pipeline", "0", {"label": ml_channel_name + "-0"}]
-        result.append(entry)
-        entry = ["MediaLive", "NetworkOut", "ChannelId", ml_channel_id, "Pipeline", "1", {"yAxis": "right",
-                                                                                          "label": ml_channel_name + "-1"}]
-        result.append(entry)
-        return result
-    
-    
-    def update_active_output_renditions_metric(ml_channel_id, ml_channel_name, ml_channelgroup_names):
-        """Update the metrics of the "Active Output Renditions (avg)" dashboard dashboard widget"""
-        results = []
-        for groupname in ml_channelgroup_names:
-            entry = ["MediaLive", "ActiveOutputs", "OutputGroupName", groupname, "ChannelId", ml_channel_id,
-                     "Pipeline", "0", {"label": ml_channel_name + "-0"}]
+    return results
+
+
+def update_status_code_range_2xx4xx_metric(mp_endpoint_names):
+    """Update the metrics of the "Status Code Range (sum)" dashboard widget"""
+    results = []
+    for mp_name in mp_endpoint_names:
+        endpoints = mp_endpoint_names[mp_name]
+        for endpoint in endpoints:
+            entry = ["AWS/MediaPackage", "EgressRequestCount", "Channel", mp_name, "OriginEndpoint", endpoint,
+                     "StatusCodeRange", "2xx"]
             results.append(entry)
-            entry = ["MediaLive", "ActiveOutputs", "OutputGroupName", groupname, "ChannelId", ml_channel_id,
-                     "Pipeline", "1", {"yAxis": "right", "label": ml_channel_name + "-1"}]
+            entry = ["AWS/MediaPackage", "EgressRequestCount", "Channel", mp_name, "OriginEndpoint", endpoint,
+                     "StatusCodeRange", "4xx", {"yAxis": "right"}]
             results.append(entry)
-        return results
-    
-    
-    def update_console_links_markdown(region, ml_channel_name, ml_channel_id, mp_channel_names):
-        """Update the markdown of the text widget to show the list of console links for the specific MediaLive and
-        MediaPackage channels"""
-        result = "MediaLive: [{0} - {1}](https://{2}.console.aws.amazon.com/medialive/home?region={2}#/" \
-                 "channels/{1}) MediaPackage: ".format(ml_channel_name, ml_channel_id, region)
-        mp_name_count = len(mp_channel_names)
-        index = 1
-        for mp_name in mp_channel_names:
-            tmp = " [{0}](https://{1}.console.aws.amazon.com/mediapackage/home?region={1}#/channels" \
-                  "/{0})".format(mp_name, region)
-            if index < mp_name_count:
-                tmp += " , "
-            index += 1
-            result += tmp
-        result += "   \n"
-        return result
-    
-    
-    def process_all_medialive_channels(ml_channel_list, cw_dashboard_name):
-        """Given a list of all MediaLive Channel ARNs process them one at time and update the CloudWatch Dashboard 
-        template"""
-        global dashboard_template
-        eml_region = extract_medialive_region(ml_channel_list[0])
-        if eml_region is None:
-            print "Error: Unable to extract the Region from the MediaLive Channel ARN '{0}'.".format(ml_channel_list[0])
-            responseData = { 'Reason': 'Error: Unable to extract the Region from the MediaLive Channel ARN'}
-            send(event, context, FAILED, responseData, "CustomResourcePhysicalID")                 
-            return 1
-        eml_client = create_medialive_client_instance(eml_region)
-        cw_client = create_cloudwatch_client_instance()
-        emp_client = create_mediapackage_client_instance(eml_region)
-    
-        dashboard_json = json.loads(dashboard_template, strict=False)
+    return results
 
-        # Update the titles of the 2 sections within the dashboard
-        for widget in dashboard_json["widgets"]:
+
+def update_status_code_range_3xx5xx_metric(mp_endpoint_names):
+    """Update the metrics of the "Status Code Range (sum)" dashboard widget"""
+    results = []
+    for mp_name in mp_endpoint_names:
+        endpoints = mp_endpoint_names[mp_name]
+        for endpoint in endpoints:
+            entry = ["AWS/MediaPackage", "EgressRequestCount", "Channel", mp_name, "OriginEndpoint", endpoint,
+                     "StatusCodeRange", "3xx"]
+            results.append(entry)
+            entry = ["AWS/MediaPackage", "EgressRequestCount", "Channel", mp_name, "OriginEndpoint", endpoint,
+                     "StatusCodeRange", "5xx", {"yAxis": "right"}]
+            results.append(entry)
+    return results
+
+
+def update_input_video_frame_rate_metric(ml_channel_id, ml_channel_name):
+    """Update the metrics of the "Input Video Frame Rate (avg)" dashboard widget"""
+    result = []
+    entry = ["MediaLive", "InputVideoFrameRate", "ChannelId", ml_channel_id, "Pipeline", "0",
+             {"label": ml_channel_name + "-0"}]
+    result.append(entry)
+    entry = ["MediaLive", "InputVideoFrameRate", "ChannelId", ml_channel_id, "Pipeline", "1",
+             {"yAxis": "right", "label": ml_channel_name + "-1"}]
+    result.append(entry)
+    return result
+
+
+def update_network_in_metric(ml_channel_id, ml_channel_name):
+    """Update the metrics of the "Network In (sum)" dashboard dashboard widget"""
+    result = []
+    entry = ["MediaLive", "NetworkIn", "ChannelId", ml_channel_id, "Pipeline", "0", {"label": ml_channel_name + "-0"}]
+    result.append(entry)
+    entry = ["MediaLive", "NetworkIn", "ChannelId", ml_channel_id, "Pipeline", "1", {"yAxis": "right",
+                                                                                     "label": ml_channel_name + "-1"}]
+    result.append(entry)
+    return result
+
+
+def update_dropped_frames_metric(ml_channel_id, ml_channel_name):
+    """Update the metrics of the "Dropped Frames (sum)" dashboard dashboard widget"""
+    result = []
+    entry = ["MediaLive", "DroppedFrames", "ChannelId", ml_channel_id, "Pipeline", "0", {"label": ml_channel_name + "-0"}]
+    result.append(entry)
+    entry = ["MediaLive", "DroppedFrames", "ChannelId", ml_channel_id, "Pipeline", "1", {"yAxis": "right",
+                                                                                         "label": ml_channel_name + "-1"}]
+    result.append(entry)
+    return result
+
+
+def update_fill_msec_metric(ml_channel_id, ml_channel_name):
+    """Update the metrics of the "Fill Milliseconds (sum)" dashboard dashboard widget"""
+    result = []
+    entry = ["MediaLive", "FillMsec", "ChannelId", ml_channel_id, "Pipeline", "0", {"label": ml_channel_name + "-0"}]
+    result.append(entry)
+    entry = ["MediaLive", "FillMsec", "ChannelId", ml_channel_id, "Pipeline", "1", {"yAxis": "right",
+                                                                                    "label": ml_channel_name + "-1"}]
+    result.append(entry)
+    return result
+
+
+def update_svq_time_metric(ml_channel_id, ml_channel_name):
+    """Update the metrics of the "SVQ Time (percentage)" dashboard dashboard widget"""
+    result = []
+    entry = ["MediaLive", "SvqTime", "ChannelId", ml_channel_id, "Pipeline", "0", {"label": ml_channel_name + "-0"}]
+    result.append(entry)
+    entry = ["MediaLive", "SvqTime", "ChannelId", ml_channel_id, "Pipeline", "1", {"yAxis": "right",
+                                                                                   "label": ml_channel_name + "-1"}]
+    result.append(entry)
+    return result
+
+
+def update_output_frame_video_rate_metric(ml_output_names):
+    """Update the metrics of the "Output Video Frame Rate (avg)" dashboard dashboard widget"""
+    result = []
+    for output in ml_output_names:
+        if output["Pipeline"] == "0":
+            entry = ["MediaLive", "OutputVideoFrameRate", "ChannelId", output["ChannelId"], "OutputName",
+                     output["OutputName"], "Pipeline", "0"]
+            result.append(entry)
+        elif output["Pipeline"] == "1":
+            entry = ["MediaLive", "OutputVideoFrameRate", "ChannelId", output["ChannelId"], "OutputName",
+                     output["OutputName"], "Pipeline", "1", {"yAxis": "right"}]
+            result.append(entry)
+    return result
+
+
+def update_network_output_metric(ml_channel_id, ml_channel_name):
+    """Update the metrics of the "Network Out (sum)" dashboard dashboard widget"""
+    result = []
+    entry = ["MediaLive", "NetworkOut", "ChannelId", ml_channel_id, "Pipeline", "0", {"label": ml_channel_name + "-0"}]
+    result.append(entry)
+    entry = ["MediaLive", "NetworkOut", "ChannelId", ml_channel_id, "Pipeline", "1", {"yAxis": "right",
+                                                                                      "label": ml_channel_name + "-1"}]
+    result.append(entry)
+    return result
+
+
+def update_active_output_renditions_metric(ml_channel_id, ml_channel_name, ml_channelgroup_names):
+    """Update the metrics of the "Active Output Renditions (avg)" dashboard dashboard widget"""
+    results = []
+    for groupname in ml_channelgroup_names:
+        entry = ["MediaLive", "ActiveOutputs", "OutputGroupName", groupname, "ChannelId", ml_channel_id,
+                 "Pipeline", "0", {"label": ml_channel_name + "-0"}]
+        results.append(entry)
+        entry = ["MediaLive", "ActiveOutputs", "OutputGroupName", groupname, "ChannelId", ml_channel_id,
+                 "Pipeline", "1", {"yAxis": "right", "label": ml_channel_name + "-1"}]
+        results.append(entry)
+    return results
+
+
+def update_console_links_markdown(region, ml_channel_name, ml_channel_id, mp_channel_names):
+    """Update the markdown of the text widget to show the list of console links for the specific MediaLive and
+    MediaPackage channels"""
+    result = "MediaLive: [{0} - {1}](https://{2}.console.aws.amazon.com/medialive/home?region={2}#/" \
+             "channels/{1}) MediaPackage: ".format(ml_channel_name, ml_channel_id, region)
+    mp_name_count = len(mp_channel_names)
+    index = 1
+    for mp_name in mp_channel_names:
+        tmp = " [{0}](https://{1}.console.aws.amazon.com/mediapackage/home?region={1}#/channels" \
+              "/{0})".format(mp_name, region)
+        if index < mp_name_count:
+            tmp += " , "
+        index += 1
+        result += tmp
+    result += "   \n"
+    return result
+
+
+# The builders of the dashboard widgets as (widget key, widget text, builder) tuples, in the order the widgets of
+# the dashboard template are matched against them. The widget text identifies a metric widget by its title and a
+# text widget by its markdown, the builder returns what a discovered MediaLive Channel adds to the widget.
+widget_builders = []
+
+
+def register_widget_builder(widget_key, widget_text, builder):
+    """Register "builder" as the builder of the dashboard widget with the stable key "widget_key", replacing a
+    builder registered earlier with the same key"""
+    for index, registered_builder in enumerate(widget_builders):
+        if registered_builder[0] == widget_key:
+            widget_builders[index] = (widget_key, widget_text, builder)
+            return
+    widget_builders.append((widget_key, widget_text, builder))
+
+
+def compile_widget_builders(dashboard_json):
+    """Match every widget of the dashboard template with its registered builder, once per template. Returns a list
+    with the builder of each widget, or None for a widget without builder"""
+    compiled_builders = []
+    for widget in dashboard_json["widgets"]:
+        widget_text = None
+        if widget["type"] == "metric":
+            widget_text = widget["properties"]["title"]
+        elif widget["type"] == "text":
+            widget_text = widget["properties"]["markdown"]
+        compiled_builder = None
+        if widget_text is not None:
+            for widget_key, registered_text, builder in widget_builders:
+                if registered_text in widget_text:
+                    compiled_builder = builder
+                    break
+        if compiled_builder is None and widget["type"] == "metric":
+            print "Unsupported metric '{0}' found in the dashboard template".format(widget_text)
+        compiled_builders.append(compiled_builder)
+    return compiled_builders
+
+
+register_widget_builder("ingress_bytes", "Ingress Bytes (sum)",
+                        lambda ml_channel: update_ingress_bytes_metric(ml_channel["mp_channel_names"]))
+register_widget_builder("ingress_response_times", "Ingress Response Times",
+                        lambda ml_channel: update_ingress_resp_times_metric(ml_channel["mp_channel_names"]))
+register_widget_builder("egress_request_bytes", "Egress Request Bytes (sum)",
+                        lambda ml_channel: update_egress_req_bytes_metric(ml_channel["mp_endpoint_names"]))
+register_widget_builder("egress_request_count", "Egress Request Count (sum)",
+                        lambda ml_channel: update_egress_req_count_metric(ml_channel["mp_endpoint_names"]))
+register_widget_builder("status_code_range_2xx_4xx", "Status Code Range (sum), 2xx,4xx",
+                        lambda ml_channel: update_status_code_range_2xx4xx_metric(ml_channel["mp_endpoint_names"]))
+register_widget_builder("status_code_range_3xx_5xx", "Status Code Range (sum), 3xx,5xx",
+                        lambda ml_channel: update_status_code_range_3xx5xx_metric(ml_channel["mp_endpoint_names"]))
+register_widget_builder("active_output_renditions", "Active Output Renditions (avg)",
+                        lambda ml_channel: update_active_output_renditions_metric(
+                            ml_channel["id"], ml_channel["name"], ml_channel["outputgroup_names"]))
+register_widget_builder("output_video_frame_rate", "Output Video Frame Rate (avg)",
+                        lambda ml_channel: update_output_frame_video_rate_metric(ml_channel["output_names"]))
+register_widget_builder("input_video_frame_rate", "Input Video Frame Rate (avg)",
+                        lambda ml_channel: update_input_video_frame_rate_metric(ml_channel["id"], ml_channel["name"]))
+register_widget_builder("network_in", "Network In (sum)",
+                        lambda ml_channel: update_network_in_metric(ml_channel["id"], ml_channel["name"]))
+register_widget_builder("dropped_frames", "Dropped Frames (sum)",
+                        lambda ml_channel: update_dropped_frames_metric(ml_channel["id"], ml_channel["name"]))
+register_widget_builder("network_out", "Network Out (sum)",
+                        lambda ml_channel: update_network_output_metric(ml_channel["id"], ml_channel["name"]))
+register_widget_builder("svq_time", "SVQ Time (percentage)",
+                        lambda ml_channel: update_svq_time_metric(ml_channel["id"], ml_channel["name"]))
+register_widget_builder("fill_milliseconds", "Fill Milliseconds (sum)",
+                        lambda ml_channel: update_fill_msec_metric(ml_channel["id"], ml_channel["name"]))
+register_widget_builder("console_links", "Console Links for all channels",
+                        lambda ml_channel: update_console_links_markdown(ml_channel["region"], ml_channel["name"],
+                                                                         ml_channel["id"],
+                                                                         ml_channel["mp_channel_names"]))
+
+
+# The dashboard template is parsed and its widgets matched with their builders once per execution environment
+dashboard_template_json = json.loads(dashboard_template, strict=False)
+dashboard_compiled_builders = compile_widget_builders(dashboard_template_json)
+
+
+# CloudWatch Dashboard body quota in bytes. A larger Dashboard is reported widget by widget and not published.
+dashboard_max_body_bytes = 1000000
+
+
+def serialize_dashboard_body(dashboard_json):
+    """Serialize the Dashboard definition "dashboard_json" into a Dashboard body: JSON with sorted keys and without any
+    whitespace around its separators"""
+    return json.dumps(dashboard_json, separators=(",", ":"), sort_keys=True)
+
+
+def compress_dashboard_metrics(metrics):
+    """Return the dashboard metrics "metrics" written with the "..." shorthand of CloudWatch Dashboards: a metric with
+    as many items as the metric before it, that starts with the same items, only lists the items after the ones it
+    repeats, following "..." """
+    results = []
+    previous_items = None
+    for metric in metrics:
+        items, options = metric, []
+        if len(metric) > 0 and isinstance(metric[-1], dict):
+            items, options = metric[:-1], metric[-1:]
+        compressed_metric = metric
+        if previous_items is not None and len(items) > 1 and len(items) == len(previous_items):
+            repeated = 0
+            while repeated < len(items) - 1 and items[repeated] == previous_items[repeated]:
+                repeated += 1
+            if repeated > 0:
+                compressed_metric = ["..."] + items[repeated:] + options
+        results.append(compressed_metric)
+        previous_items = items
+    return results
+
+
+def new_dashboard_json():
+    """Return a copy of the parsed dashboard template that can be filled in by an invocation. Only the widget
+    properties and metric lists that an invocation modifies are copied, everything else is shared with the template."""
+    widgets = []
+    for widget in dashboard_template_json["widgets"]:
+        widget = dict(widget)
+        widget["properties"] = dict(widget["properties"])
+        if "metrics" in widget["properties"]:
+            widget["properties"]["metrics"] = list(widget["properties"]["metrics"])
+        widgets.append(widget)
+    return {"widgets": widgets}
+
+
+def process_all_medialive_channels(ml_channel_list, cw_dashboard_name):
+    """Given a list of all MediaLive Channel ARNs process them one at time and update the CloudWatch Dashboard 
+    template"""
+    eml_region = extract_medialive_region(ml_channel_list[0])
+    if eml_region is None:
+        print "Error: Unable to extract the Region from the MediaLive Channel ARN '{0}'.".format(ml_channel_list[0])
+        raise DashboardError('Error: Unable to extract the Region from the MediaLive Channel ARN')
+    eml_client = create_medialive_client_instance(eml_region)
+    cw_client = create_cloudwatch_client_instance(eml_region)
+    emp_client = create_mediapackage_client_instance(eml_region)
+    emp_inventory = MediaPackageInventory(emp_client)
+
+    dashboard_json = new_dashboard_json()
+
+    # Update the titles of the 2 sections within the dashboard
+    for widget in dashboard_json["widgets"]:
+        if widget["type"] == "text":
+            text_title = widget["properties"]["markdown"]
+            if "MediaPackage Section Title" in text_title:
+                widget["properties"]["markdown"] = "# {0}: Packaging and Origination".format(cw_dashboard_name)
+            if "MediaLive Section Title" in text_title:
+                widget["properties"]["markdown"] = "# {0}: Encoding".format(cw_dashboard_name)
+
+    for ml_channel_arn in ml_channel_list:
+        print "Retrieving information from MediaLive channel", ml_channel_arn
+        eml_channel_id = extract_medialive_channel_id(ml_channel_arn)
+        if eml_channel_id is None:
+            print "Error: Verify the MediaLive Channel ARN"
+            raise DashboardError('Error: Verify the MediaLive Channel ARN')
+        eml_channel_name, emp_channel_arn_list = extract_medialive_channel_info(eml_client, eml_channel_id)
+        if eml_channel_name is None or emp_channel_arn_list == []:
+            raise DashboardError('Error: Retrieving MediaLive Name and\or MediaPackage Destinations from the '
+                                 'MediaLive Channel')
+        print "MediaLive Channel Name: ", eml_channel_name
+        eml_outputgroup_names = extract_medialive_outputgroup_names(eml_client, eml_channel_id)
+        eml_output_names = extract_cw_metrics_output_names(cw_client, eml_channel_id)
+
+        print "Retrieving information from the MediaPackage channels"
+        emp_channel_names = extract_mediapackage_channel_names(emp_inventory, emp_channel_arn_list, eml_region)
+        emp_endpoint_names = extract_mediapackage_endpoints(emp_inventory, emp_channel_names)
+        ml_channel = {"id": eml_channel_id, "name": eml_channel_name, "region": eml_region,
+                      "outputgroup_names": eml_outputgroup_names, "output_names": eml_output_names,
+                      "mp_channel_names": emp_channel_names, "mp_endpoint_names": emp_endpoint_names}
+        for widget, builder in zip(dashboard_json["widgets"], dashboard_compiled_builders):
+            if builder is None:
+                continue
+            addition = builder(ml_channel)
+            if widget["type"] == "metric" and len(addition) > 0:
+                widget["properties"]["metrics"] += addition
+                widget["properties"]["region"] = eml_region
             if widget["type"] == "text":
-                text_title = widget["properties"]["markdown"]
-                if "MediaPackage Section Title" in text_title:
-                    widget["properties"]["markdown"] = "# {0}: Packaging and Origination".format(cw_dashboard_name)
-                if "MediaLive Section Title" in text_title:
-                    widget["properties"]["markdown"] = "# {0}: Encoding".format(cw_dashboard_name)
-    
-        for ml_channel_arn in ml_channel_list:
-            print "Retrieving information from MediaLive channel", ml_channel_arn
-            eml_channel_id = extract_medialive_channel_id(ml_channel_arn)
-            if eml_channel_id is None:
-                print "Error: Verify the MediaLive Channel ARN"
-                responseData = { 'Reason': 'Error: Verify the MediaLive Channel ARN'}
-                send(event, context, FAILED, responseData, "CustomResourcePhysicalID")                 
-                return 1
-            eml_channel_name, emp_channel_arn_list = extract_medialive_channel_info(eml_client, eml_channel_id)
-            if eml_channel_name is None or emp_channel_arn_list == []:
-                responseData = { 'Reason': 'Error: Retrieving MediaLive Name and\or MediaPackage Destinations from the MediaLive Channel'}
-                send(event, context, FAILED, responseData, "CustomResourcePhysicalID")                 
-                return 1
-            print "MediaLive Channel Name: ", eml_channel_name
-            eml_outputgroup_names = extract_medialive_outputgroup_names(eml_client, eml_channel_id)
-            eml_output_names = extract_cw_metrics_output_names(cw_client, eml_channel_id)
-    
-            print "Retrieving information from the MediaPackage channels"
-            emp_channel_names = extract_mediapackage_channel_names(emp_client, emp_channel_arn_list, eml_region)
-            emp_endpoint_names = extract_mediapackage_endpoints(emp_client, emp_channel_names)
-            for widget in dashboard_json["widgets"]:
-                if widget["type"] == "metric":
-                    metrics = []
-                    metric_title = widget["properties"]["title"]
-                    if "Ingress Bytes (sum)" in metric_title:
-                        metrics += update_ingress_bytes_metric(emp_channel_names)
-                    elif "Ingress Response Times" in metric_title:
-                        metrics += update_ingress_resp_times_metric(emp_channel_names)
-                    elif "Egress Request Bytes (sum)" in metric_title:
-                        metrics += update_egress_req_bytes_metric(emp_endpoint_names)
-                    elif "Egress Request Count (sum)" in metric_title:
-                        metrics += update_egress_req_count_metric(emp_endpoint_names)
-                    elif "Status Code Range (sum), 2xx,4xx" in metric_title:
-                        metrics += update_status_code_range_2xx4xx_metric(emp_endpoint_names)
-                    elif "Status Code Range (sum), 3xx,5xx" in metric_title:
-                        metrics += update_status_code_range_3xx5xx_metric(emp_endpoint_names)
-                    elif "Active Output Renditions (avg)" in metric_title:
-                        metrics += update_active_output_renditions_metric(eml_channel_id, eml_channel_name, eml_outputgroup_names)
-                    elif "Output Video Frame Rate (avg)" in metric_title:
-                        metrics += update_output_frame_video_rate_metric(eml_output_names)
-                    elif "Input Video Frame Rate (avg)" in metric_title:
-                        metrics += update_input_video_frame_rate_metric(eml_channel_id, eml_channel_name)
-                    elif "Network In (sum)" in metric_title:
-                        metrics += update_network_in_metric(eml_channel_id, eml_channel_name)
-                    elif "Dropped Frames (sum)" in metric_title:
-                        metrics += update_dropped_frames_metric(eml_channel_id, eml_channel_name)
-                    elif "Network Out (sum)" in metric_title:
-                        metrics += update_network_output_metric(eml_channel_id, eml_channel_name)
-                    elif "SVQ Time (percentage)" in metric_title:
-                        metrics += update_svq_time_metric(eml_channel_id, eml_channel_name)
-                    elif "Fill Milliseconds (sum)" in metric_title:
-                        metrics += update_fill_msec_metric(eml_channel_id, eml_channel_name)
-                    else:
-                        print "Unsupported metric '{0}' found in the dashboard template".format(metric_title)
-                    if len(metrics) > 0:
-                        widget["properties"]["metrics"] += metrics
-                        widget["properties"]["region"] = eml_region
-                if widget["type"] == "text":
-                    markdown = widget["properties"]["markdown"]
-                    if "Console Links for all channels" in markdown:
-                        tmp = update_console_links_markdown(eml_region, eml_channel_name, eml_channel_id, emp_channel_names)
-                        widget["properties"]["markdown"] = markdown + tmp
-    
-        dashboard_template = json.dumps(dashboard_json, indent=4, sort_keys=True)
-        create_cloudwatch_dashboard(cw_client, cw_dashboard_name, dashboard_template)
-    
-    
-    def main(argv=None):
-        medialive_channel_arn = os.environ['MyArn']
-        dashboard_name = os.environ['MyDashB']
-        if dashboard_name is '':
-            responseData = { 'Reason': 'Please provide a name for the Dashboard'}
-            send(event, context, FAILED, responseData, "CustomResourcePhysicalID")
-            return 1
-        eml_list_filename = None
-        eml_channel_arn_list = []
-        if medialive_channel_arn is not None:
-            medialive_channel_arn = medialive_channel_arn.replace(' ','')
-            eml_channel_arn_list = medialive_channel_arn.split(';')
-        elif medialive_channel_arn is None and eml_list_filename is not None:
-            eml_channel_arn_list = load_eml_arn_list(eml_list_filename)
-            arn_count = len(eml_channel_arn_list)
-            print "\nFound {0} valid MediaLive Channel ARNs in the file {1}".format(arn_count, eml_list_filename)
-            if arn_count == 0:
-                responseData = { 'Reason': 'Please provide a MediaLive Channel ARN'}
-                send(event, context, FAILED, responseData, "CustomResourcePhysicalID")               
-                return 1  # Must have a MediaLive Channel ARN to continue
-        elif medialive_channel_arn is None and len(eml_channel_arn_list) == 0:
-            responseData = { 'Must provide a MediaLive Channel ARN or a file containing a list of MediaLive Channel ARNs'}
-            send(event, context, FAILED, responseData, "CustomResourcePhysicalID")
-            return 1  # Must have a MediaLive Channel ARN to continue
-    
+                widget["properties"]["markdown"] += addition
 
-    
-    
-        process_all_medialive_channels(eml_channel_arn_list, dashboard_name)
+    # Set the environment variable MyMetricShorthand to "true" to write the metrics with the "..." shorthand
+    if os.environ.get('MyMetricShorthand', '').lower() == 'true':
+        for widget in dashboard_json["widgets"]:
+            if "metrics" in widget["properties"]:
+                widget["properties"]["metrics"] = compress_dashboard_metrics(widget["properties"]["metrics"])
+    dashboard_body = serialize_dashboard_body(dashboard_json)
+    print "Dashboard body: {0} bytes of {1}".format(len(dashboard_body), dashboard_max_body_bytes)
+    if len(dashboard_body) > dashboard_max_body_bytes:
+        for widget in dashboard_json["widgets"]:
+            properties = widget["properties"]
+            widget_name = properties.get("title", properties.get("markdown", "").split("\n")[0])
+            print "  {0:>8} bytes {1:>4} metrics  {2}".format(len(serialize_dashboard_body(widget)),
+                                                              len(properties.get("metrics", [])), widget_name)
+        raise DashboardError('Error: The Dashboard body exceeds the CloudWatch Dashboard quota of {0} '
+                             'bytes'.format(dashboard_max_body_bytes))
+    create_cloudwatch_dashboard(cw_client, cw_dashboard_name, dashboard_body)
 
-    
-    
-    if __name__ == "__main__":
-        sys.exit(main())
-    main()
+
+def main(argv=None):
     medialive_channel_arn = os.environ['MyArn']
+    dashboard_name = os.environ['MyDashB']
+    if dashboard_name is '':
+        raise DashboardError('Please provide a name for the Dashboard')
+    eml_channel_arn_list = medialive_channel_arn.replace(' ', '').split(';')
+    process_all_medialive_channels(eml_channel_arn_list, dashboard_name)
+
+
+def lambda_handler(event, context):
+    global discovery_cache
+    global execution_environment_invocations
+    invocation_started = time.time()
+    execution_environment_invocations += 1
+    medialive_channel_descriptions.clear()
+    aws_call_stats.clear()
+    # The Create and Update events of the stack expect the channels as they are now, so they discover everything
+    # again by default. Set the environment variable MyRefreshCache to "true" to always discover everything again, or
+    # to "false" to use the discovery results cached by earlier invocations
+    refresh_cache = os.environ.get('MyRefreshCache', '').lower()
+    if refresh_cache not in ('true', 'false'):
+        refresh_cache = 'true' if event.get('RequestType') in ('Create', 'Update') else 'false'
+    try:
+        discovery_cache = DiscoveryCache(discovery_cache_file, refresh_cache == 'true')
+    except Exception, e:
+        print "Warning: Unable to open the discovery cache '{0}', continuing without it: {1}".format(
+            discovery_cache_file, e)
+    responseStatus = SUCCESS
     responseData = {}
-    send(event, context, SUCCESS, responseData, "CustomResourcePhysicalID")
+    profiler = None
+    if os.environ.get('MyProfile', '').lower() == 'true':
+        profiler = cProfile.Profile()
+    try:
+        if profiler is not None:
+            profiler.runcall(main)
+        else:
+            main()
+    except DashboardError, e:
+        print e.message
+        responseStatus = FAILED
+        responseData = {'Reason': e.message}
+    finally:
+        if discovery_cache is not None:
+            discovery_cache.close()
+            discovery_cache = None
+    invocation_time = time.time() - invocation_started
+    if execution_environment_invocations == 1:
+        print "Cold start: module setup took {0:.3f} seconds, the invocation {1:.3f} seconds".format(
+            invocation_started - execution_environment_started, invocation_time)
+    else:
+        print "Warm start: invocation {0} of the execution environment took {1:.3f} seconds".format(
+            execution_environment_invocations, invocation_time)
+    log_aws_call_metrics()
+    if profiler is not None:
+        log_profile(profiler)
+    send(event, context, responseStatus, responseData, "CustomResourcePhysicalID")
     return 0
+
+
 from botocore.vendored import requests
 
 SUCCESS = "SUCCESS"